@@ -6,121 +6,198 @@ logger = logging.getLogger(__name__)
 """
 # from http.client import _DataType
 import json
-import dateutil.parser
 import datetime
 import os
 import time
 from common.correspondence_manager import CorrespondenceManager
+from common.member_directory import MemberDirectory
+import common.outbox as outbox_module
+from common.outbox import Outbox, Notification
 from common.email_utils import EmailUtil
 import argparse
 import common.date_utils as date_utils
 import common.utils as utils
 import common.html_formatter as html_formatter
-import re
 import traceback
+import functools
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 import common.teamup_utils as teamup_utils
-from common.config_data import RunConfig, RunTrigger, read_configuration, CoverageLevels
+from common.event_snapshot import EventSnapshot
+from common.snapshot_store import get_snapshot_store
+import common.coverage_engine as coverage_engine
+from common.coverage_engine import CoverageIndex, IntervalIndex
+from common.staffing_rules import get_staffing_rules
+import common.staffing_grid as staffing_grid
+from common.config_data import RunConfig, RunTrigger, EmailConfig, read_configuration, CoverageLevels
 from common.utils import NotificationCategory
-import boto3
-from boto3.dynamodb.conditions import Key
+from common import aws_resources
 
 
-# Global configuration
-run_config: RunConfig
-
 Range = namedtuple('Range', ['start', 'end'])
 
 url = 'https://api.teamup.com'
 
-s3 = boto3.client('s3')
 s3_bucket = 'shift-reports-{}-535096317903' #substitute agency
-s3_bucket_name = None
 
 developer_email = 'gmn314@yahoo.com'
 
-errors_for_run = []
-
 correspondence_control_table_name = os.environ.get('CORRESPONDENCE_CONTROL_TABLE_NAME', 'schedule_notifications')
 squad_member_table_name = os.environ.get('SQUAD_MEMBER_TABLE', 'squad_members')
 agency_configuration_table_name = os.environ.get("AGENCY_CONFIGURATION_TABLE_NAME", "agency_configuration")
 
-dynamodb = boto3.resource('dynamodb')
+# Built on first use (see get_correspondence_manager / get_member_directory) and reused by warm invocations
+correspondence_manager: CorrespondenceManager = None
+member_directory: MemberDirectory = None
+
+# Number of outbox workers delivering notifications concurrently
+outbox_workers = int(os.environ.get('OUTBOX_WORKERS', '4'))
 
-correspondence_manager = CorrespondenceManager(dynamodb, correspondence_control_table_name)
-email = None
+# Number of agencies a multi-agency trigger processes concurrently
+agency_workers = int(os.environ.get('AGENCY_WORKERS', '4'))
 
-member_table = dynamodb.Table(squad_member_table_name)
+# How staffing is checked: 'python' (hour segments, see check_staffing) or 'numpy' (all hours at once, see
+# common.staffing_grid), for long horizons.  'numpy' falls back to 'python' if NumPy is not installed.
+staffing_backend = os.environ.get('STAFFING_BACKEND', 'python')
 
-email_is_live = False
+# Incremental runs ask Teamup for events modified since the previous run's sync time, less this margin for clock skew
+SYNC_MARGIN_SECONDS = 60
 
-## ------------------
-## EMail configuration
-email_address_map = {} # Cache for email addresses -- 
 
-# The below boolean determines if the script will prompt the user to confirm certain actions.
-HEADLESS = False
+@dataclass
+class RunContext:
+    """
+    Everything specific to one agency's run.  Each run gets its own context, so several agencies can be processed
+    at the same time.
+
+    headless: if False, the script prompts the user to confirm certain actions
+    email_is_live: if False, no email is sent
+    """
+    run_config: RunConfig
+    email: EmailUtil
+    s3_bucket_name: str
+    headless: bool = False
+    email_is_live: bool = False
+    errors_for_run: list = field(default_factory=list)
+
 
 BRIEF_COVERAGE_DESCR_MAP = {
-    'crew_chief': 'CC',
-    'emt': 'EMT > 18',
-    'emt_under_18_': 'EMT < 18',
-    'driver': 'Driver',
-    'assistant': 'Assistant'
+    CoverageLevels.CREW_CHIEF: 'CC',
+    CoverageLevels.EMT_OVER_18: 'EMT > 18',
+    CoverageLevels.EMT_UNDER_18: 'EMT < 18',
+    CoverageLevels.DRIVER: 'Driver',
+    CoverageLevels.ASSISTANT: 'Assistant'
 } 
 
-def get_coverage_required(start_dt, end_dt):
+def get_correspondence_manager() -> CorrespondenceManager:
+    global correspondence_manager
+    if correspondence_manager is None:
+        correspondence_manager = CorrespondenceManager(aws_resources.get_dynamodb, correspondence_control_table_name)
+    return correspondence_manager
+
+def get_member_directory() -> MemberDirectory:
+    global member_directory
+    if member_directory is None:
+        member_directory = MemberDirectory(aws_resources.get_dynamodb, squad_member_table_name)
+    return member_directory
+
+def get_coverage_required(context: RunContext, start_dt, end_dt):
+    run_config = context.run_config
     return teamup_utils.get_events(start_dt, end_dt, 
         run_config.teamup_config.all_calendar_key_ro,
         run_config.teamup_config.coverage_required_calendar,
-        run_config.teamup_config.teamup_api_key);
+        run_config.teamup_config.teamup_api_key,
+        run_config.teamup_config.level_mappings);
 
 
-def get_coverage_offered(start_dt, end_dt):
+def get_coverage_offered(context: RunContext, start_dt, end_dt):
     """
-    Get all coverage offered events.  For each event, expand the hours into their own keys in the dict.
-    For example 
-    Key: 2021120218
-    Value: <Coverage Offer Message>
+    Get all coverage offered events, indexed by the hours they cover (see coverage_engine.CoverageIndex)
     """
-    coverage_offered = {} # Key: date + hour, value: list of events
+    run_config = context.run_config
     coverages = teamup_utils.get_events(start_dt, end_dt, 
         run_config.teamup_config.all_calendar_key_ro,
         run_config.teamup_config.coverage_offered_calendar,
-        run_config.teamup_config.teamup_api_key)
+        run_config.teamup_config.teamup_api_key,
+        run_config.teamup_config.level_mappings)
 
-    for coverage in coverages['events']:
-        num_hours = date_utils.get_hours_parse(coverage['start_dt'], coverage['end_dt']) # for how many hours is this coverage offered?
-        start_date = dateutil.parser.isoparse(coverage['start_dt'])
-        for hour in range(num_hours):
-            dt = datetime.timedelta(hours=hour)
-            coverage_hour = start_date + dt
-            date_hour_key = date_utils.date_to_key(coverage_hour)
-            coverage_offered[date_hour_key] = coverage_offered.get(date_hour_key, [])
-            coverage_offered[date_hour_key].append(coverage)
+    return CoverageIndex(coverages['events'])
 
-    return coverage_offered
 
+def get_run_windows(context: RunContext, start_dt, end_dt):
+    """
+    The calendar windows needed for a run: name -> (start, end, subcalendar)
+    Note: When getting the coverage offered, we will start from the previous day (1 day before start_dt) to get all of the events
+    that started the day before, and ended today, and one day after, to get all that started today but end tomorrow.
+    """
+    required_calendar = context.run_config.teamup_config.coverage_required_calendar
+    offered_calendar = context.run_config.teamup_config.coverage_offered_calendar
+
+    check_offered_start = date_utils.parse_date_add_hours(start_dt, -1*24, date_utils.API_DATE_FORMAT_YMD).strftime(date_utils.API_DATE_FORMAT_YMD)
+    check_offered_end = date_utils.parse_date_add_hours(end_dt, 2*24, date_utils.API_DATE_FORMAT_YMD).strftime(date_utils.API_DATE_FORMAT_YMD)
+    report_offered_start = date_utils.parse_date_add_hours(start_dt, -24, date_utils.API_DATE_FORMAT_YMD)
+    report_offered_end = date_utils.parse_date_add_hours(end_dt, 24, date_utils.API_DATE_FORMAT_YMD)
+
+    return {
+        'check_required': (start_dt, end_dt, required_calendar),
+        'check_offered': (check_offered_start, check_offered_end, offered_calendar),
+        'report_required': (start_dt, end_dt, required_calendar),
+        'report_offered': (report_offered_start, report_offered_end, offered_calendar)
+    }
+
+
+def create_snapshot(context: RunContext, start_dt, end_dt, names=None):
+    """
+    Fetch, once and concurrently, each subcalendar for the union of the windows the run needs.
+    names selects which windows from get_run_windows to cover (default: all of them)
+    """
+    windows = get_run_windows(context, start_dt, end_dt)
+    names = list(windows.keys()) if names is None else names
 
-def check_events(start_dt, end_dt):
+    teamup_config = context.run_config.teamup_config
+    snapshot = EventSnapshot(teamup_config.all_calendar_key_ro, teamup_config.teamup_api_key, teamup_config.level_mappings)
+    for name in names:
+        snapshot.add_window(*windows[name])
+    return snapshot.fetch()
+
+
+def get_window_events(context: RunContext, snapshot, start_dt, end_dt, name):
+    return snapshot.get_events(*get_run_windows(context, start_dt, end_dt)[name])
+
+
+def check_events(context: RunContext, start_dt, end_dt, snapshot=None, previous=None, affected_shift_ids=None):
     """
     Check if the coverage offered is sufficient for the required coverage.
+    snapshot is the (optionally shared) EventSnapshot for the run
+    previous is the (shift_errors, shift_warnings) of an earlier check of the same window.  When given, only the
+    shifts in affected_shift_ids are checked again, the rest keep their earlier results.
     """
-    requireds = get_coverage_required(start_dt, end_dt)
+    if snapshot is None:
+        snapshot = create_snapshot(context, start_dt, end_dt, ['check_required', 'check_offered'])
 
-    # Note: When getting the coverage offered, we will start from the previous day (1 day before start_dt) to get all of the events
-    # that started the day before, and ended today, and one day after, to get all that started today but end tomorrow.
-    start_before = date_utils.parse_date_add_hours(start_dt, -1*24, date_utils.API_DATE_FORMAT_YMD).strftime(date_utils.API_DATE_FORMAT_YMD)
-    end_after = date_utils.parse_date_add_hours(end_dt, 2*24, date_utils.API_DATE_FORMAT_YMD).strftime(date_utils.API_DATE_FORMAT_YMD)
+    requireds = get_window_events(context, snapshot, start_dt, end_dt, 'check_required')
+    coverages = CoverageIndex(get_window_events(context, snapshot, start_dt, end_dt, 'check_offered')['events'])
 
-    coverages = get_coverage_offered(start_before, end_after)
+    previous_checks = get_previous_checks(previous)
+    staffing_rules = get_staffing_rules(context.run_config.agency_settings.staffing_rules)
+
+    to_check = [required for required in requireds['events'] if previous is None or required.id in affected_shift_ids]
+    if staffing_backend == 'numpy' and staffing_grid.is_available(staffing_rules):
+        checks = dict(zip([required.id for required in to_check],
+            staffing_grid.check_staffing_grid(to_check, coverages, staffing_rules, STAFFING_ERROR_SORT_ORDER)))
+    else:
+        checks = {required.id: check_staffing(required, coverages, staffing_rules) for required in to_check}
 
     shift_errors = []
     shift_warnings = []
 
     for required in requireds['events']:
-        missing, warnings = check_staffing(required, coverages, run_config.teamup_config.level_mappings)
-        # shift = '{} - {}'.format(required['start_dt'], required['end_dt'])
+        if previous is not None and required.id not in affected_shift_ids:
+            missing, warnings = previous_checks.get(required.id, ([], {}))
+        else:
+            missing, warnings = checks[required.id]
+        # shift = '{} - {}'.format(required.start_dt, required.end_dt)
         if len(missing) > 0:
             shift_errors.append({'shift': required, 'errors': missing, 'warnings': warnings})
 
@@ -130,28 +207,43 @@ def check_events(start_dt, end_dt):
     return (requireds, coverages, shift_errors, shift_warnings)
 
 
-def check_staffing(required_coverage, coverage_events, level_mappings):
+def get_previous_checks(previous):
+    """
+    shift id -> (missing, warnings) from an earlier check_events.  Shifts that are in neither list were fully staffed.
+    """
+    previous_checks = {}
+    if previous is None:
+        return previous_checks
+
+    shift_errors, shift_warnings = previous
+    for shift_error in shift_errors:
+        previous_checks[shift_error['shift'].id] = (shift_error['errors'], shift_error['warnings'])
+    for shift_warning in shift_warnings:
+        previous_checks.setdefault(shift_warning['shift'].id, ([], shift_warning['warnings']))
+    return previous_checks
+
+
+def check_staffing(required_coverage, coverage_index, staffing_rules):
     """
     Check if the coverage offered is sufficient for the required coverage.
+    The shift is swept one segment at a time, where a segment is a stretch of hours (hour indexes, see
+    date_utils.to_hour_index) with the same offered events.  Only these change points are evaluated, and segments
+    with an already seen crew composition are answered from the staffing_rules cache.
     Return tuple: (list of required coverage, warnings)
     """
-    crew_missing = dict()
+    crew_missing = []
     shift_warnings = dict()
 
-    start_date = dateutil.parser.isoparse(required_coverage['start_dt'])
-    hours = date_utils.get_hours_parse(required_coverage['start_dt'], required_coverage['end_dt'])
-    for hour in range(hours):
-        dt = datetime.timedelta(hours=hour)
-        coverage_hour = start_date + dt
-        date_hour_key = date_utils.date_to_key(coverage_hour)
-        coverage_events_for_hour = coverage_events.get(date_hour_key, [])
-        missing, warnings = is_hour_staffed(coverage_events_for_hour, level_mappings)
+    shift_start, shift_end = coverage_engine.hour_index_span(required_coverage.start, required_coverage.end)
+    for segment_start, segment_end, coverage_events in coverage_index.segments(shift_start, shift_end):
+        missing, warnings = is_hour_staffed(coverage_events, staffing_rules)
 
         if len(missing) > 0:
-            crew_missing[date_hour_key] = missing
+            crew_missing.append((segment_start, segment_end, missing))
 
         if len(warnings) > 0:
-            shift_warnings[date_hour_key] = warnings
+            for coverage_hour in range(segment_start, segment_end):
+                shift_warnings[date_utils.hour_index_to_key(coverage_hour, date_utils.NY_TZ)] = warnings
 
     missing_ranges = consolidate_hours(crew_missing)
     return (missing_ranges, shift_warnings)
@@ -159,79 +251,48 @@ def check_staffing(required_coverage, coverage_events, level_mappings):
 STAFFING_ERROR_SORT_ORDER = ['Crew Chief', 'Driver or EMT over 18']
 
 def consolidate_hours(crew_missing):
-    # First, we expand the errors into their own keys in the dict.
+    """
+    crew_missing is a list of (start, end, [missing roles]) segments (hour indexes), in order.
+    Join adjacent segments that are missing the same role into one range, and format them (in date_utils.NY_TZ, so hours
+    after a DST change get their own offset)
+    """
     missing_cats = dict()
 
-    for key, value in crew_missing.items():
-        for missing in value:
-            missing_cats[missing] = missing_cats.get(missing, [])
-            missing_cats[missing].append(key)
-
-    for key, value in missing_cats.items():
-        missing_dates = value
-        date_sets = []
-        sub_list =[]
-        for date in missing_dates:
-            if len(sub_list) == 0:
-                sub_list.append(date)
-            elif date_utils.add_hour_to_key(sub_list[-1]) == date_utils.key_to_date(date):
-                sub_list.append(date)
+    for start, end, missing_roles in crew_missing:
+        for missing in missing_roles:
+            ranges = missing_cats.setdefault(missing, [])
+            if len(ranges) > 0 and ranges[-1][1] == start:
+                ranges[-1][1] = end
             else:
-                date_sets.append(sub_list[:])
-                sub_list = []
-        if len(sub_list) > 0:
-            date_sets.append(sub_list[:])
-
-        missing_cats[key] = date_sets
+                ranges.append([start, end])
 
     missing_ranges = []
     for key in STAFFING_ERROR_SORT_ORDER:
         if key in missing_cats:
-            date_sets = missing_cats[key]
-            for date_set in date_sets:
-                start_date = date_utils.key_to_date(date_set[0])
-                end_date = date_utils.add_hour_to_key(date_set[-1])
-                hours = date_utils.get_hours(start_date, end_date)
-                missing_ranges.append({'start_dt': start_date.strftime(date_utils.OUTPUT_FMT_YMDHM), 'end_dt': end_date.strftime(date_utils.OUTPUT_FMT_YMDHM), 'hours': hours, 'error': key})
+            for start, end in missing_cats[key]:
+                start_date = date_utils.hour_index_to_date(start, date_utils.NY_TZ)
+                end_date = date_utils.hour_index_to_date(end, date_utils.NY_TZ)
+                missing_ranges.append({'start_dt': start_date.strftime(date_utils.OUTPUT_FMT_YMDHM), 'end_dt': end_date.strftime(date_utils.OUTPUT_FMT_YMDHM), 'hours': end - start, 'error': key})
 
     return missing_ranges
 
 
-def is_hour_staffed(coverage_events_for_hour, level_mappings):
+def is_hour_staffed(coverage_events_for_hour, staffing_rules):
     """
-    Logic for determining if a shift is correctly staffed.  The required subcalendar id determines which logic to apply
-    coverage_events_for_hour is a list of coverage events for the hour (a list of CoverageOffered JSON objects)
+    Logic for determining if a shift is correctly staffed.  The agency's staffing_rules (see common.staffing_rules)
+    determine which logic to apply
+    coverage_events_for_hour is a list of coverage events for the hour (a list of teamup_utils.Event)
     """
-    return check_shift_coverage(coverage_events_for_hour, level_mappings)
+    return check_shift_coverage(coverage_events_for_hour, staffing_rules)
 
 
-def check_shift_coverage(coverage_events_for_hour, level_mappings):
-    warnings = []
-    missing = []
-    roles = {}
-
-    if len(coverage_events_for_hour) > 5:
-        warnings.append('Crew too large - 5 maximum')
-
+def check_shift_coverage(coverage_events_for_hour, staffing_rules):
     for event in coverage_events_for_hour:
-        try:
-            roles[event['custom']['coverage_level'][0]] = roles.get(event['custom']['coverage_level'][0], 0) + 1
-        except KeyError:
+        if event.coverage_level is None:
             print('Data Exception: Missing coverage level for event {}'.format(event))
-            raise
-
-    # is there a CC?
-    if level_mappings[CoverageLevels.CREW_CHIEF.value] in roles:
-        if roles[level_mappings[CoverageLevels.CREW_CHIEF.value]] > 1:
-            warnings.append('Warning: more than one CC')
-    else:
-        missing.append(CoverageLevels.CREW_CHIEF.value)
+            raise KeyError('coverage_level')
 
-    if not (level_mappings[CoverageLevels.DRIVER.value] in roles or level_mappings[CoverageLevels.EMT_OVER_18.value] in roles or 
-        (level_mappings[CoverageLevels.CREW_CHIEF.value] in roles and roles[level_mappings[CoverageLevels.CREW_CHIEF.value]] > 1)):
-        missing.append('Driver or EMT over 18')
-
-    return (missing, warnings)
+    return staffing_rules.check(coverage_events_for_hour)
 
 def translate_coverage(coverage_level):
     if coverage_level == 'CC':
@@ -245,7 +306,7 @@ def format_error_report(shift_errors):
     """
     error_report = ''
     for shift in shift_errors:
-        error_report += 'Shift: {}\n'.format(shift['shift']['start_dt'])
+        error_report += 'Shift: {}\n'.format(shift['shift'].start_dt)
         for error in shift['errors']:
             error_report += '  {}\n'.format(error)
         for warning in shift['warnings']:
@@ -259,8 +320,8 @@ def report_errors(shift_errors):
         return
     print('The folowing shifts have errors: '.format(len(shift_errors)))
     for shift in shift_errors:
-        print('Shift: ({}) {} - {}'.format(utils.create_shift_name(shift['shift']), date_utils.date_simple_format(shift['shift']['start_dt']), 
-            date_utils.date_simple_format(shift['shift']['end_dt'])))
+        print('Shift: ({}) {} - {}'.format(utils.create_shift_name(shift['shift']), date_utils.date_simple_format(shift['shift'].start_dt), 
+            date_utils.date_simple_format(shift['shift'].end_dt)))
         for error in shift['errors']:
             print('  {} - {} ({} hours): {}'.format(error['start_dt'], error['end_dt'], error['hours'], error['error']))
         print("") 
@@ -272,7 +333,7 @@ def events_to_map(shifts):
     """
     shift_map = {}
     for shift in shifts:
-        start_date = shift['start_dt']
+        start_date = shift.start_dt
         if start_date in shift_map:
             shift_map[start_date].append(shift)
         else:
@@ -283,63 +344,36 @@ def filter_shifts_before_today(search_start, shifts):
     filtered_shifts = []
 
     for shift in shifts:
-        if dateutil.parser.isoparse(shift['start_dt']) < date_utils.convert_date_to_ny(datetime.datetime.strptime(search_start, date_utils.API_DATE_FORMAT_YMD)):
-            print('Skipping past shift: {}'.format(shift['start_dt']))
+        if shift.start < date_utils.convert_date_to_ny(datetime.datetime.strptime(search_start, date_utils.API_DATE_FORMAT_YMD)):
+            print('Skipping past shift: {}'.format(shift.start_dt))
         else:
             filtered_shifts.append(shift)
     return filtered_shifts
 
 
-def expand_event(shift, event):
+def expand_event(start_hour, num_hours, event):
     """
-    Given an event, expand it into a list of events
-    return key, [event]
+    Given an event, expand it into a list of events: one for each of the num_hours hours from start_hour (an hour index)
+    return hour index, [event]
     """
     # key = hour
     # value = event
 
-    expanded_events = {}
-    num_hours = date_utils.hours_overlap(Range(dateutil.parser.isoparse(shift['start_dt']), dateutil.parser.isoparse(shift['end_dt'])), 
-        Range(dateutil.parser.isoparse(event['start_dt']), dateutil.parser.isoparse(event['end_dt'])))
-    start_date = max(dateutil.parser.isoparse(shift['start_dt']), dateutil.parser.isoparse(event['start_dt']))
-    for hour in range(num_hours):
-        dt = datetime.timedelta(hours=hour)
-        coverage_hour = start_date + dt
-        date_hour_key = date_utils.date_to_key(coverage_hour)
-        expanded_events[date_hour_key] = expanded_events.get(date_hour_key, [])
-        expanded_events[date_hour_key].append(event)
-    
-    return expanded_events
+    return {start_hour + hour: [event] for hour in range(num_hours)}
 
 DEBUG_OUTPUT = False
 
-def is_coverage_in_shift(shift, coverage):
-    shift_start = dateutil.parser.isoparse(shift['start_dt'])
-    shift_end = dateutil.parser.isoparse(shift['end_dt'])
-
-    coverage_start = dateutil.parser.isoparse(coverage['start_dt'])
-    coverage_end = dateutil.parser.isoparse(coverage['end_dt'])
-
-    days_overlap = date_utils.hours_overlap(Range(shift_start, shift_end), Range(coverage_start, coverage_end))
-    return days_overlap > 0
-
-def get_hours_coverage(shift, coverage):
-    shift_start = dateutil.parser.isoparse(shift['start_dt'])
-    shift_end = dateutil.parser.isoparse(shift['end_dt'])
 
-    coverage_start = dateutil.parser.isoparse(coverage['start_dt'])
-    coverage_end = dateutil.parser.isoparse(coverage['end_dt'])
-
-    days_overlap = date_utils.hours_overlap(Range(shift_start, shift_end), Range(coverage_start, coverage_end))
-    return days_overlap
-
-
-def report_shifts(search_start, search_end, errors):
+def report_shifts(context: RunContext, search_start, search_end, errors, snapshot=None, previous_report=None, affected_shift_ids=None):
+    """
+    previous_report is the final_report_map of an earlier report of the same window.  When given, only the shifts in
+    affected_shift_ids are reported again, the rest keep their earlier entries.
+    """
 
     shifts_with_errors = set()
 
     for shift in errors:
-        shifts_with_errors.add(shift['shift']['id'])
+        shifts_with_errors.add(shift['shift'].id)
     
     """
     Returning: 
@@ -357,33 +391,20 @@ def report_shifts(search_start, search_end, errors):
                         "who": "George Nowakowski (CC), Steph Landau (EMT > 18)"
                     }
                 ],
-                "shift": {
-                    "all_day": false,
-                    "attachments": [],
-                    "creation_dt": "2022-01-04T13:24:29-05:00",
+                "shift": Event({
                     "custom": {},
                     "delete_dt": null,
                     "end_dt": "2022-01-09T01:00:00-05:00",
                     "id": "1081908428",
-                    "location": "",
                     "notes": null,
-                    "readonly": true,
-                    "remote_id": null,
-                    "ristart_dt": null,
-                    "rrule": "",
-                    "rsstart_dt": null,
-                    "series_id": null,
                     "start_dt": "2022-01-08T11:00:00-05:00",
                     "subcalendar_id": 10358690,
                     "subcalendar_ids": [
                         10358690
                     ],
                     "title": "MRS Duty: Covering 34 (Green Knoll)",
-                    "tz": null,
-                    "update_dt": null,
-                    "version": "4c69a25fc459",
                     "who": ""
-                },
+                }),
                 "shift-summary": {
                     "George Nowakowski": 2,
                     "Steph Landau": 7
@@ -394,71 +415,74 @@ def report_shifts(search_start, search_end, errors):
     """
     debug_ts = int(time.time())
 
-    shifts = teamup_utils.get_events(search_start, search_end, run_config.teamup_config.all_calendar_key_ro, 
-        run_config.teamup_config.coverage_required_calendar, run_config.teamup_config.teamup_api_key)
+    if snapshot is None:
+        snapshot = create_snapshot(context, search_start, search_end, ['report_required', 'report_offered'])
 
-    coverage_start = date_utils.parse_date_add_hours(search_start, -24, date_utils.API_DATE_FORMAT_YMD)
-    coverage_end = date_utils.parse_date_add_hours(search_end, 24, date_utils.API_DATE_FORMAT_YMD)
-
-    coverages = teamup_utils.get_events(coverage_start, coverage_end, run_config.teamup_config.all_calendar_key_ro, 
-        run_config.teamup_config.coverage_offered_calendar, run_config.teamup_config.teamup_api_key)
+    shifts = get_window_events(context, snapshot, search_start, search_end, 'report_required')
+    coverages = get_window_events(context, snapshot, search_start, search_end, 'report_offered')
     shift_map = events_to_map(filter_shifts_before_today(search_start, shifts['events']))
     shift_keys = sorted(shift_map.keys())
 
-    coverage_map = events_to_map(coverages['events'])
-    coverage_keys = sorted(coverage_map.keys())
+    # Each coverage's timestamps are parsed once, and each shift only visits the coverages that overlap it
+    coverage_index = IntervalIndex.from_events(coverages['events'])
 
+    # Resolve everyone's email address up front, in one batch
+    get_member_directory().resolve(context.run_config.agency, coverages['events'])
 
     # key = date, value = {shift, [coverage]}
     merged_shift_map = {}
+    # Entries of previous_report for shifts that did not change
+    unchanged_report_map = {}
 
     for shift_key in shift_keys:
         shifts_ = shift_map[shift_key]
         for shift in shifts_:
-            if shift['id'] in shifts_with_errors:
-                # print('Skipping shift with id: {}'.format(shift['id']))
+            if shift.id in shifts_with_errors:
+                # print('Skipping shift with id: {}'.format(shift.id))
+                continue
+            if previous_report is not None and shift.id not in affected_shift_ids and \
+                shift.start_dt in previous_report and previous_report[shift.start_dt]['shift'].id == shift.id:
+                unchanged_report_map[shift.start_dt] = previous_report[shift.start_dt]
                 continue
             shift_summary_map = {}
-            shift_date = shift['start_dt']
+            shift_date = shift.start_dt
+            shift_range = Range(shift.start, shift.end)
             covers_for_shift = {}
-            for coverage_key in coverage_keys:
-                coverages_ = coverage_map[coverage_key]
-                for coverage in coverages_:
-                    check_for_email_address(run_config.agency, coverage)
-                    if is_coverage_in_shift(shift, coverage):
-                        shift_summary_map[coverage['who']]  = shift_summary_map.get(coverage['who'], 0) + get_hours_coverage(shift, coverage)
-                        events_by_hour = expand_event(shift, coverage)
-                        for hour_key, events in events_by_hour.items():
-                            covers_for_shift[hour_key] = covers_for_shift.get(hour_key, [])
-                            covers_for_shift[hour_key].extend(events)
+            for coverage_start, coverage_end, coverage in coverage_index.overlapping(shift_range.start, shift_range.end):
+                hours_coverage = date_utils.hours_overlap(shift_range, Range(coverage_start, coverage_end))
+                if hours_coverage > 0:
+                    shift_summary_map[coverage.who]  = shift_summary_map.get(coverage.who, 0) + hours_coverage
+                    events_by_hour = expand_event(date_utils.to_hour_index(max(shift_range.start, coverage_start)), hours_coverage, coverage)
+                    for hour_key, events in events_by_hour.items():
+                        covers_for_shift[hour_key] = covers_for_shift.get(hour_key, [])
+                        covers_for_shift[hour_key].extend(events)
             merged_shift_map[shift_date] = {'shift': shift, 'coverage': covers_for_shift, 'shift-summary': shift_summary_map}
 
     # For every hour, sort the coverages: by coverage level, then by name
     for shift_date, shift_and_coverage in merged_shift_map.items():
         shift = shift_and_coverage['shift']
         coverage = shift_and_coverage['coverage']
-        try:
-            for hour_key, coverages in coverage.items():
-                coverages.sort(key=lambda x: (x['custom']['coverage_level'][0], x['who']))
-                coverage[hour_key] = coverages
-        except KeyError:
-            errors_for_run.append({'shift': shift, 'error': 'No coverage level found for shift'})
+        for hour_key, coverages in coverage.items():
+            if any(x.coverage_level is None for x in coverages):
+                context.errors_for_run.append({'shift': shift, 'error': 'No coverage level found for shift'})
+                break
+            coverages.sort(key=lambda x: (x.coverage_level, x.who))
 
     if DEBUG_OUTPUT:
         print('+++++')
         with open('/Users/gnowakow/Downloads/shift_map_{}.json'.format(debug_ts), 'w') as f:
-            f.write(json.dumps(merged_shift_map, indent=4, sort_keys=True))
+            f.write(json.dumps(merged_shift_map, indent=4, sort_keys=True, default=teamup_utils.Event.to_dict))
         print('+++++')
 
     """
     merged_shift_map is a map containing the following: 
     {
         shift_start_date (2022-01-08T11:00:00-05:00): {
-            shift: {...shift attributes...},
+            shift: Event,
             coverage: {
-                hour_key (2022010812): [
-                    {...coverage attributes...},
-                    {...coverage attributes...},
+                hour index (see date_utils.to_hour_index): [
+                    Event,
+                    Event,
                 ]
             }
         }
@@ -470,54 +494,37 @@ def report_shifts(search_start, search_end, errors):
     # print('MergedShiftMap: \n{}'.format(json.dumps(merged_shift_map)))
 
     final_report_map = collapse_into_like_shifts(merged_shift_map)
+    if previous_report is not None:
+        final_report_map.update(unchanged_report_map)
+        final_report_map = {shift_key: final_report_map[shift_key] for shift_key in shift_keys if shift_key in final_report_map}
 
     if DEBUG_OUTPUT:
         print('+++++')
         with open('/Users/gnowakow/Downloads/final_report_map_{}.json'.format(debug_ts), 'w') as f:
-            f.write(json.dumps(final_report_map, indent=4, sort_keys=True))
+            f.write(json.dumps(final_report_map, indent=4, sort_keys=True, default=teamup_utils.Event.to_dict))
         print('Printed final report map')
         print('+++++')
 
     return final_report_map
 
-def check_for_email_address(agency, coverage):
-    """
-    Confirm that email address exists in the email_address_map.  If it does not, check for the presence of a notes field.  If notes exists, and it contains a string like: 
-    "email: email@domain" then add that email address to the email_address_map, and also save it in the file
-    """
-
-    member_name = coverage['who']
-    if member_name in email_address_map:
-        return True
-
-    email_address = get_email_address_from_notes(coverage)
-    if email_address:
-        save_email_address(agency, member_name, email_address)
-    else:
-        email_address = get_email_from_db(agency, member_name)
-
-    if email_address:
-        email_address_map[member_name] = email_address
-
-    return email_address
-
 def simple_shift_formatting(final_report_map):
     for shift_date, shift_and_coverage in final_report_map.items():
         shift = shift_and_coverage['shift']
         coverage = shift_and_coverage['coverage']
-        print('Shift: ({}) {} - {}'.format(utils.create_shift_name(shift), date_utils.date_simple_format(shift['start_dt']), date_utils.date_simple_format(shift['end_dt'])))
+        print('Shift: ({}) {} - {}'.format(utils.create_shift_name(shift), date_utils.date_simple_format(shift.start_dt), date_utils.date_simple_format(shift.end_dt)))
         for hour_coverage in coverage:
             print('  {} - {} ({} hours): {}'.format(hour_coverage['start_dt'], hour_coverage['end_dt'], date_utils.get_hours(date_utils.key_to_date(hour_coverage['start_dt']), 
                 date_utils.key_to_date(hour_coverage['end_dt'])), hour_coverage['who']))
         print("")
 
-def build_email_list(summary):
+def build_email_list(context: RunContext, summary):
     email_addresses = []
     no_address_for_member = []
 
     for member_name, member_hours in summary.items():
-        if member_name in email_address_map:
-            email_addresses.append(email_address_map[member_name])
+        email_address = get_member_directory().get_email_address(context.run_config.agency, member_name)
+        if email_address:
+            email_addresses.append(email_address)
         else:
             no_address_for_member.append(member_name)
 
@@ -527,6 +534,7 @@ def collapse_into_like_shifts(merged_shift_map):
     """
     Given a map of shifts, collapse them into like shifts
     like shifts are consecutive shifts that have the same people working
+    The hour indexes of the coverage are formatted as keys ('%Y%m%d%H', in the shift's timezone) here
 
     Returns:
 
@@ -537,7 +545,6 @@ def collapse_into_like_shifts(merged_shift_map):
     for shift_date, shift_and_coverage in merged_shift_map.items():
         shift = shift_and_coverage['shift']
         coverage_by_hour = shift_and_coverage['coverage']
-
         collapsed_coverages = []
 
         previous_member_names = None
@@ -549,13 +556,13 @@ def collapse_into_like_shifts(merged_shift_map):
                 previous_hour = hour_key
             else:
                 if previous_member_names is not None:
-                    collapsed_coverages.append({'start_dt': start_hour, 'end_dt': date_utils.date_to_key(date_utils.add_hour_to_key(previous_hour)), 'who': previous_member_names})
+                    collapsed_coverages.append({'start_dt': date_utils.hour_index_to_key(start_hour, date_utils.NY_TZ), 'end_dt': date_utils.hour_index_to_key(previous_hour + 1, date_utils.NY_TZ), 'who': previous_member_names})
                 previous_member_names = concat_offer_names(coverage_offers_for_hour)
                 start_hour = hour_key
                 previous_hour = hour_key
 
         if previous_member_names is not None:
-            collapsed_coverages.append({'start_dt': start_hour, 'end_dt': date_utils.date_to_key(date_utils.add_hour_to_key(previous_hour)), 'who': previous_member_names})
+            collapsed_coverages.append({'start_dt': date_utils.hour_index_to_key(start_hour, date_utils.NY_TZ), 'end_dt': date_utils.hour_index_to_key(previous_hour + 1, date_utils.NY_TZ), 'who': previous_member_names})
 
         final_report_map[shift_date] = {'shift': shift, 'coverage': collapsed_coverages, 'shift-summary': shift_and_coverage['shift-summary']}
 
@@ -566,16 +573,12 @@ def are_keys_consecutive(previous_hour, hour):
     if previous_hour is None:
         return False
 
-    prev_date = datetime.datetime.strptime(previous_hour, date_utils.HOUR_KEY_FMT)
-    dt = datetime.timedelta(hours=1)
-    hour_after_prev = prev_date + dt
-
-    return datetime.datetime.strftime(hour_after_prev, date_utils.HOUR_KEY_FMT) == hour        
+    return previous_hour + 1 == hour
 
 def concat_offer_names(coverages):
     names = []
     for coverage in coverages:
-        names.append('{} <span class="duty_role">({})</span>'.format(coverage['who'], BRIEF_COVERAGE_DESCR_MAP.get(coverage['custom']['coverage_level'][0])))
+        names.append('{} <span class="duty_role">({})</span>'.format(coverage.who, BRIEF_COVERAGE_DESCR_MAP.get(coverage.role)))
     return ', '.join(names)
 
 def are_names_equal(previous_names, coverages):
@@ -586,20 +589,20 @@ def are_names_equal(previous_names, coverages):
     return previous_names == names
 
 
-def should_send_email(agency, report_type, coverage, email_recepients, category, context_date_str):
-    if not email_is_live:
+def should_send_email(context: RunContext, agency, report_type, coverage, email_recepients, category, context_date_str, digest=None):
+    if not context.email_is_live:
         return False
 
-    notification_was_sent = correspondence_manager.was_notification_sent(agency, category, report_type, coverage, context_date_str, email_recepients)
+    notification_was_sent = get_correspondence_manager().was_notification_sent(agency, category, report_type, coverage, context_date_str, email_recepients, digest)
 
     # For shift notifications, we want to constrain to sending only if the shift_start is within NOTIFY_SHIFT_WITHIN_DAYS days
     # Error notifications are sent regardless of how many days away the shift_start is
     if category == NotificationCategory.SHIFT_NOTIFICATION:
-        if date_utils.get_days_diff(datetime.datetime.today(), date_utils.key_to_date(context_date_str)) > run_config.agency_settings.notify_shift_within_days:
+        if date_utils.get_days_diff(datetime.datetime.today(), date_utils.key_to_date(context_date_str)) > context.run_config.agency_settings.notify_shift_within_days:
             return False
 
     # If not HEADLESS, prompt will override whether it was already sent!
-    if HEADLESS == False:
+    if context.headless == False:
         if input("{} recipients already sent: {} Should the email be sent? (y/n) "
             .format(len(email_recepients), notification_was_sent)) == 'y':
             return True
@@ -610,107 +613,136 @@ def should_send_email(agency, report_type, coverage, email_recepients, category,
     return not notification_was_sent
 
 
-def send_html_email(agency, report_type, summary, email_recepients, context_date, category: NotificationCategory, subject, html_body):
+def enqueue_html_email(outbox: Outbox, agency, report_type, summary, email_recepients, context_date, category: NotificationCategory, subject, html_body, file_name, digest=None):
     """
     if category = 'shift_notification', context_date is the start date of the shift
     if category = 'error_notification', context_date is the date of the error
 
     coverage = entire coverage for the given shift.  **Is always None for error notifications**
 
+    The email is sent (and the html written to file_name) by an outbox worker, see deliver_notification
     """
-    cc_list = []
     if html_body is None or len(html_body) == 0:
         print('html_file is None or empty, nothing to do')
         return
 
     # Get the YEAR_MONTH_DAY_HOUR of the context date
     context_date_str = datetime.datetime.strftime(context_date, date_utils.HOUR_KEY_FMT)
-    if should_send_email(agency, report_type, summary, email_recepients, category, context_date_str):
-        email.send_html_email(email_recepients, cc_list, subject, html_body)
-        correspondence_manager.save_notification_sent(agency, report_type, category, summary, context_date_str, email_recepients)
+    outbox.enqueue(Notification(agency, report_type, category, email_recepients, subject, html_body,
+        summary=summary, context_date_str=context_date_str, file_name=file_name, digest=digest))
+
 
+def deliver_notification(context: RunContext, notification: Notification):
+    """
+    Runs on an outbox worker.  Sends the notification unless it was already sent.  Returns True if the email was sent.
+    The bookkeeping afterwards is in record_notification, so that a failure there does not send the email again.
+    """
+    if notification.category is None:
+        context.email.send_email(notification.recipients, notification.cc_list, notification.subject, notification.body)
+        return True
+
+    if should_send_email(context, notification.agency, notification.report_type, notification.summary, notification.recipients, notification.category, notification.context_date_str, notification.digest):
+        context.email.send_html_email(notification.recipients, notification.cc_list, notification.subject, notification.body)
+        return True
+    return False
+
+
+def record_notification(context: RunContext, notification: Notification, sent):
+    """
+    Runs on an outbox worker after deliver_notification: records that the notification was sent, and writes the html
+    to S3
+    """
+    if notification.category is None:
+        return
 
-def process_html_results(agency, report_type, html_map, final_report_map, admin_email_address):
+    if sent:
+        get_correspondence_manager().save_notification_sent(notification.agency, notification.report_type, notification.category, 
+            notification.summary, notification.context_date_str, notification.recipients, digest=notification.digest)
+
+    # Also, write the html to a file
+    write_resulting_html(context, notification.file_name, notification.body)
+
+
+def get_shift_context_date_str(shift):
+    return datetime.datetime.strftime(date_utils.convert_date_to_ny(shift.start), date_utils.HOUR_KEY_FMT)
+
+
+def process_html_results(context: RunContext, outbox: Outbox, agency, report_type, final_report_map, admin_email_address):
     """
     Iterate through the final_report_map.  For each shift:
         * Create an email mailing list
+        * Skip the shift if its report digest matches the one last sent (nothing to render, upload or send)
         * Create an html file
-        * Send an email
+        * Queue the email (and html file) on the outbox
 
         Note: If one or more recipients cannot be found for a shift, send an email to the script owner for manual intervention
     """
     for shift_date, shift_and_coverage in final_report_map.items():
         shift = shift_and_coverage['shift']
-        shift_date_formatted = dateutil.parser.isoparse(shift['start_dt']).strftime('%A_%Y-%m-%d-hour-%H')
+        shift_date_formatted = shift.start.strftime('%A_%Y-%m-%d-hour-%H')
         coverage = shift_and_coverage['coverage']
         summary = shift_and_coverage['shift-summary']
 
-        email_list, no_email_found = build_email_list(summary)
+        email_list, no_email_found = build_email_list(context, summary)
         if len(no_email_found) > 0:
             email_body = 'Problem while sending email for shift {}.  No email address found for the following members: {}'.format(shift_date, no_email_found)
-            email.send_email([admin_email_address], [], 'TeamUp Script could not find email addresses for members listed', email_body)
+            outbox.enqueue(Notification(agency, report_type, None, [admin_email_address], 'TeamUp Script could not find email addresses for members listed', email_body))
             continue
 
-        send_html_email(agency, report_type, summary, email_list, 
-            date_utils.convert_date_to_ny(dateutil.parser.isoparse(shift['start_dt'])), 
-            NotificationCategory.SHIFT_NOTIFICATION, 'Shift coming up soon', html_map[shift_date])
-
-        # Also, write the html to a file
-        write_resulting_html('shift_report_{}.html'.format(shift_date_formatted), html_map[shift_date])
-
-
-def process_html_errors(agency, report_type, error_html, shift_error_recipients):
-    if error_html is not None:
-        send_html_email(agency, report_type, None, shift_error_recipients, date_utils.get_now_tz(), NotificationCategory.ERROR_NOTIFICATION, 'Unstaffed Shifts', error_html)
-        write_resulting_html('error_list.html', error_html)
+        # Interactive runs can choose to re-send an unchanged report, so only headless runs skip it
+        digest = html_formatter.shift_report_digest(shift_and_coverage, email_list)
+        if context.email_is_live and context.headless and get_correspondence_manager().is_digest_unchanged(agency, report_type, get_shift_context_date_str(shift), digest):
+            print('Shift report for {} is unchanged, skipping'.format(shift_date))
+            continue
 
-def write_resulting_html(file_name, html_body):
-    s3.put_object(
-        Bucket=s3_bucket_name,
-        Key= '{}/{}'.format(date_utils.get_current_day_key(), file_name),
-        Body=html_body
-    )
+        enqueue_html_email(outbox, agency, report_type, summary, email_list, 
+            date_utils.convert_date_to_ny(shift.start), 
+            NotificationCategory.SHIFT_NOTIFICATION, 'Shift coming up soon', html_formatter.format_html_shift(shift_and_coverage),
+            'shift_report_{}.html'.format(shift_date_formatted), digest)
 
-def get_email_from_db(agency, member_name):
-    resp = member_table.get_item(
-        Key={
-            'agency':agency,
-            'member_name': member_name
-        }
-    )
-    if 'Item' in resp and 'email_address' in resp['Item']:
-        return resp['Item']['email_address']
 
+def prefetch_notifications(context: RunContext, agency, report_type, final_report_map):
+    """
+    Load the notifications already sent for every shift in the report in one parallel pass, so the dedupe check
+    for each shift is answered from memory.
+    """
+    if not context.email_is_live:
+        return
 
-def get_email_address_from_notes(coverage):
-    if 'notes' in coverage and \
-        coverage['notes'] is not None:
+    shift_starts = [get_shift_context_date_str(shift_and_coverage['shift']) for shift_and_coverage in final_report_map.values()]
+    get_correspondence_manager().prefetch_notifications(agency, NotificationCategory.SHIFT_NOTIFICATION, report_type, shift_starts)
 
-        lst = re.findall('\S+@\S+', coverage['notes'])
-        if len(lst) == 0:
-            return
 
-        # Remove anything before the colon: for example: "email:xxx.yy.com"
-        # Remove <p></p> if they are there
-        email_address = lst[0][lst[0].find(':')+1:].replace('<p>', '').replace('</p>', '')
-        return email_address
+def process_html_errors(outbox: Outbox, agency, report_type, error_html, shift_error_recipients):
+    if error_html is not None:
+        enqueue_html_email(outbox, agency, report_type, None, shift_error_recipients, date_utils.get_now_tz(), NotificationCategory.ERROR_NOTIFICATION, 'Unstaffed Shifts', error_html,
+            'error_list.html')
 
 
-def save_email_address(agency, member_name, email_address):
-    print('*** Putting new email address.  Member: {} address: {}'.format(member_name, email_address))
-    member_table.put_item(
-        Item={
-            'agency': agency,
-            'member_name': member_name,
-            'email_address': email_address
-        }
+def deliver_outbox(outbox: Outbox):
+    """
+    Wait for the outbox to drain, retrying failed notifications once.  Returns the DeliveryResults.
+    """
+    results = outbox.drain()
+    if len(outbox.failed) > 0:
+        print('Retrying {} failed notifications'.format(len(outbox.failed)))
+        results = [result for result in results if result.status != outbox_module.FAILED] + outbox.retry_failed()
+
+    for result in results:
+        if result.status == outbox_module.FAILED:
+            print('Could not deliver: {} to: {} Error: {}'.format(result.notification.subject, result.notification.recipients, result.error))
+        elif result.error is not None:
+            print('Delivered, but could not record: {} to: {} Error: {}'.format(result.notification.subject, result.notification.recipients, result.error))
+    return results
+
+def write_resulting_html(context: RunContext, file_name, html_body):
+    aws_resources.get_s3().put_object(
+        Bucket=context.s3_bucket_name,
+        Key= '{}/{}'.format(date_utils.get_current_day_key(), file_name),
+        Body=html_body
     )
 
-
 def get_command_arguments():
-    global HEADLESS
-    global email_is_live
-
     # Instantiate the parser
     parser = argparse.ArgumentParser(description='Optional app description')        
 
@@ -727,39 +759,190 @@ def get_command_arguments():
     # Parse the arguments
     cmd_args = parser.parse_args()
 
-    HEADLESS = cmd_args.headless
-    email_is_live = cmd_args.send_email
     print('===============================================')
     print('Generating report for {} to {}'.format(cmd_args.start_date, cmd_args.end_date))
     print('Will send email? {}'.format(cmd_args.send_email))
     print('===============================================')    
 
-    if HEADLESS == False and input("are you sure? (y/n) ") != "y":
+    if cmd_args.headless == False and input("are you sure? (y/n) ") != "y":
         exit()
 
     return cmd_args
 
-def init_from_cmd(agency):
-    global s3_bucket_name
+def init_from_cmd(run_config: RunConfig):
     """
     Initialize the script when invoked from the command line
+    Returns (RunContext, command line arguments)
     """
-    s3_bucket_name = s3_bucket.format(agency)
-    return get_command_arguments()
+    cmd_args = get_command_arguments()
+    context = RunContext(run_config, EmailUtil(run_config.email_account), s3_bucket.format(run_config.agency),
+        headless=cmd_args.headless, email_is_live=cmd_args.send_email)
+    return context, cmd_args
 
-def process(start_date, end_date):
-    requireds, coverages, errors, warnings = check_events(start_date, end_date)
-    print('====================================')
-    print('Duty Shifts Found: {} errors: {} warnings: {}'.format(len(requireds), len(errors), len(warnings)))
-    report_errors(errors)
+def get_run_state_key(context: RunContext):
+    return '{}_{}'.format(context.run_config.agency, context.run_config.run_trigger.report_type)
 
-    html_errors = html_formatter.format_html_report_errors(errors, start_date, 99)
-    process_html_errors(run_config.agency, run_config.run_trigger.report_type, html_errors, run_config.email_recipients.shift_error_receipents)
 
-    final_report_map = report_shifts(start_date, end_date, errors)
-    print('Final report map: '.format(json.dumps(final_report_map)))
-    html_map = html_formatter.format_html_shift_report(final_report_map)
-    process_html_results(run_config.agency, run_config.run_trigger.report_type, html_map, final_report_map, run_config.email_recipients.admin_email)
+def sync_snapshot(context: RunContext, start_date, end_date, state):
+    """
+    Bring the snapshot saved by the previous incremental run (state) up to date with the events changed since then.
+    If there is no usable state (first run, or the run window moved, as it does on the first run of a day), the
+    snapshot is fetched in full instead.
+
+    Returns (snapshot, affected_shift_ids, timestamp), where affected_shift_ids is None after a full fetch and
+    timestamp is the modifiedSince for the next incremental run.
+    """
+    teamup_config = context.run_config.teamup_config
+    if state is not None and state['start_date'] == start_date and state['end_date'] == end_date:
+        snapshot = EventSnapshot.from_dict(state['snapshot'], teamup_config.all_calendar_key_ro, teamup_config.teamup_api_key, teamup_config.level_mappings)
+        requested_at = int(time.time()) - SYNC_MARGIN_SECONDS
+        response = teamup_utils.get_changed_events(state['timestamp'], teamup_config.all_calendar_key_ro, teamup_config.teamup_api_key, teamup_config.level_mappings)
+        affected_shift_ids = get_affected_shift_ids(context, snapshot, snapshot.apply_changes(response['events']))
+        print('Incremental run: {} changed events, {} shifts to check'.format(len(response['events']), len(affected_shift_ids)))
+        return snapshot, affected_shift_ids, response.get('timestamp', requested_at)
+
+    requested_at = int(time.time()) - SYNC_MARGIN_SECONDS
+    return create_snapshot(context, start_date, end_date), None, requested_at
+
+
+def get_affected_shift_ids(context: RunContext, snapshot, changes):
+    """
+    changes is subcalendar_id -> [(old_event, new_event)] (see EventSnapshot.apply_changes)
+    Returns the ids of the required shifts that changed, or that overlap a changed coverage offered (before or after the change)
+    """
+    required_calendar = context.run_config.teamup_config.coverage_required_calendar
+    offered_calendar = context.run_config.teamup_config.coverage_offered_calendar
+
+    affected_shift_ids = set()
+    for old_event, new_event in changes.get(required_calendar, []):
+        affected_shift_ids.update([event.id for event in (old_event, new_event) if event is not None])
+
+    required_index = IntervalIndex.from_events(snapshot.events.get(required_calendar, []))
+    for old_event, new_event in changes.get(offered_calendar, []):
+        for event in (old_event, new_event):
+            if event is not None:
+                # Widened to whole hours, since staffing is checked by the hour
+                event_start = coverage_engine.floor_hour(event.start)
+                event_end = event.end + coverage_engine.ONE_HOUR
+                affected_shift_ids.update([shift.id for _, _, shift in required_index.overlapping(event_start, event_end)])
+
+    return affected_shift_ids
+
+
+def shift_entries_to_dict(entries):
+    """
+    entries is a list of {'shift': Event, ...} (shift errors, warnings or reports).  Returns a JSON serializable copy
+    """
+    return [dict(entry, shift=entry['shift'].to_dict()) for entry in entries]
+
+
+def shift_entries_from_dict(entries, level_mappings):
+    return [dict(entry, shift=teamup_utils.Event.from_teamup(entry['shift'], level_mappings)) for entry in entries]
+
+
+def run_state_to_dict(start_date, end_date, timestamp, snapshot, errors, warnings, final_report_map):
+    return {'start_date': start_date, 'end_date': end_date, 'timestamp': timestamp, 'snapshot': snapshot.to_dict(),
+        'errors': shift_entries_to_dict(errors), 'warnings': shift_entries_to_dict(warnings),
+        'report': dict(zip(final_report_map.keys(), shift_entries_to_dict(final_report_map.values())))}
+
+
+def load_run_state(context: RunContext):
+    """
+    The state saved by the previous incremental run (see run_state_to_dict), with its shifts as Events.  The snapshot
+    is left as saved, see sync_snapshot
+    """
+    state = get_snapshot_store().load(get_run_state_key(context))
+    if state is None:
+        return None
+
+    level_mappings = context.run_config.teamup_config.level_mappings
+    state['errors'] = shift_entries_from_dict(state['errors'], level_mappings)
+    state['warnings'] = shift_entries_from_dict(state['warnings'], level_mappings)
+    state['report'] = dict(zip(state['report'].keys(), shift_entries_from_dict(state['report'].values(), level_mappings)))
+    return state
+
+
+def process(context: RunContext, start_date, end_date, incremental=False):
+    """
+    incremental: start from the state saved by the previous incremental run and only re-check the shifts affected by
+    events changed since then (see sync_snapshot).  The new state is saved at the end of the run.
+
+    Returns (DeliveryResults, shift errors)
+    """
+    run_config = context.run_config
+
+    # Notifications are delivered by the outbox workers while the reports are still being generated.
+    # Interactive runs prompt before each email, so they use a single worker.
+    with Outbox(functools.partial(deliver_notification, context), outbox_workers if context.headless else 1,
+        functools.partial(record_notification, context)) as outbox:
+        state = load_run_state(context) if incremental else None
+        snapshot, affected_shift_ids, timestamp = sync_snapshot(context, start_date, end_date, state)
+        previous = state if affected_shift_ids is not None else None
+
+        requireds, coverages, errors, warnings = check_events(context, start_date, end_date, snapshot,
+            (previous['errors'], previous['warnings']) if previous else None, affected_shift_ids)
+        print('====================================')
+        print('Duty Shifts Found: {} errors: {} warnings: {}'.format(len(requireds), len(errors), len(warnings)))
+        report_errors(errors)
+
+        html_errors = html_formatter.format_html_report_errors(errors, start_date, 99)
+        process_html_errors(outbox, run_config.agency, run_config.run_trigger.report_type, html_errors, run_config.email_recipients.shift_error_receipents)
+
+        final_report_map = report_shifts(context, start_date, end_date, errors, snapshot, previous['report'] if previous else None, affected_shift_ids)
+        print('Final report map: '.format(json.dumps(final_report_map, default=teamup_utils.Event.to_dict)))
+        prefetch_notifications(context, run_config.agency, run_config.run_trigger.report_type, final_report_map)
+        process_html_results(context, outbox, run_config.agency, run_config.run_trigger.report_type, final_report_map, run_config.email_recipients.admin_email)
+
+        results = deliver_outbox(outbox)
+
+        if incremental:
+            get_snapshot_store().save(get_run_state_key(context),
+                run_state_to_dict(start_date, end_date, timestamp, snapshot, errors, warnings, final_report_map))
+        return results, errors
+
+
+def get_email_key(email_config: EmailConfig):
+    return (email_config.smtp_server, email_config.email_account, email_config.from_email_address)
+
+
+def run_agency(agency, event, email_utils):
+    """
+    Check one agency of a (possibly multi-agency) trigger.  Exceptions are reported to the developer and returned
+    in the agency's result, so one agency's failure does not stop the others.
+
+    email_utils: EmailUtil per email account (see get_email_key), shared by the agencies of the invocation
+    Returns the agency's result summary
+    """
+    start_date = datetime.datetime.now().strftime(date_utils.API_DATE_FORMAT_YMD)
+    end_date = None
+    email = None
+    try:
+        run_config = read_configuration(RunTrigger(event['time'], agency, event['report_type']))
+        email = email_utils[get_email_key(run_config.email_account)]
+        context = RunContext(run_config, email, s3_bucket.format(agency), headless=True, email_is_live=True)
+
+        end_date = (datetime.datetime.now() + datetime.timedelta(days=run_config.agency_settings.check_errors_within_days)).strftime(date_utils.API_DATE_FORMAT_YMD)
+        print('Checking coverage for: {} {} - {}'.format(agency, start_date, end_date))
+        results, errors = process(context, start_date, end_date, event.get('incremental', False))
+
+        statuses = [result.status for result in results]
+        return {'agency': agency, 'status': 'ok', 'start_date': start_date, 'end_date': end_date, 'shifts_with_errors': len(errors),
+            'sent': statuses.count(outbox_module.SENT), 'skipped': statuses.count(outbox_module.SKIPPED), 'failed': statuses.count(outbox_module.FAILED),
+            'unrecorded': len([result for result in results if result.status != outbox_module.FAILED and result.error is not None])}
+    except Exception as e:
+        print('WTF, I got an exception!!!!')
+        print(traceback.format_exc())
+        invocation_params = 'agency: {} start_date: {} end_date: {}'.format(agency, start_date, end_date)
+        exception_details = traceback.format_exc()
+        email_body = 'Exception in lambda_handler: \n called with: {}\n\n{}'.format(invocation_params, exception_details)
+        try:
+            # If the agency's configuration could not be read, report it through any account of the invocation
+            email = email or next(iter(email_utils.values()), None)
+            if email is not None:
+                email.send_email([developer_email], [], 'Exception in check_coverage lambda handler', email_body)
+        except Exception:
+            print(traceback.format_exc())
+        return {'agency': agency, 'status': 'error', 'start_date': start_date, 'end_date': end_date, 'error': str(e)}
 
 
 # =====================================================================================================================
@@ -768,6 +951,8 @@ def lambda_handler(event, context):
     """
     (was) {"time":"$.time"}
     {"time": "$.time", "agency": "martinsville","report_type": "duty"}  
+    {"time": "$.time", "agency": "martinsville","report_type": "duty", "incremental": true}  (only re-checks what changed since the last run)
+    {"time": "$.time", "agencies": ["martinsville", "squadsentry"],"report_type": "duty"}  (agencies are checked concurrently)
     Called by EventBridge when a rule is triggered
         {
         "time": <time>,
@@ -776,53 +961,55 @@ def lambda_handler(event, context):
         }    
 
     report_type is: [duty, special]
-    """
-    global s3_bucket_name
-    global HEADLESS
-    global email_is_live
-    global run_config
-    global email
 
-    run_config = read_configuration(RunTrigger(event['time'], event['agency'], event['report_type']))
+    The agencies of one invocation share the Teamup session, the DynamoDB resource and (per email account) an SMTP
+    connection.  Returns a result summary per agency.
+    """
+    agencies = event['agencies'] if 'agencies' in event else [event['agency']]
 
     test_mode = True if 'testing' in event and event['testing'] == True else False
-    email = EmailUtil(run_config.email_account, test_mode)
 
-    HEADLESS = True
-    email_is_live = True
+    # Notifications sent by other runs since the last invocation must be seen, and members with no address may have
+    # been given one since
+    get_correspondence_manager().clear_cache()
+    get_member_directory().forget_misses()
 
-    s3_bucket_name = s3_bucket.format(event['agency'])
-
-    start_date = datetime.datetime.now().strftime(date_utils.API_DATE_FORMAT_YMD)
-    end_date = (datetime.datetime.now() + datetime.timedelta(days=run_config.agency_settings.check_errors_within_days)).strftime(date_utils.API_DATE_FORMAT_YMD)
+    # One SMTP connection is held per email account for the whole invocation
+    email_utils = {}
+    for agency in agencies:
+        try:
+            email_config = read_configuration(RunTrigger(event['time'], agency, event['report_type'])).email_account
+        except Exception:
+            # Reported by run_agency
+            continue
+        if get_email_key(email_config) not in email_utils:
+            email_utils[get_email_key(email_config)] = EmailUtil(email_config, test_mode, keep_alive=True)
 
     try:
-        print('Checking coverage for: {} - {}'.format(start_date, end_date))
-        process(start_date, end_date)
-    except Exception as e:
-        print('WTF, I got an exception!!!!')
-        print(traceback.format_exc())
-        invocation_params = 'agency: {} start_date: {} end_date: {}'.format(event['agency'], start_date, end_date)
-        exception_details = traceback.format_exc()
-        email_body = 'Exception in lambda_handler: \n called with: {}\n\n{}'.format(invocation_params, exception_details)
-        email.send_email([developer_email], [], 'Exception in check_coverage lambda handler', email_body)
-        exit()
+        with ThreadPoolExecutor(max_workers=max(1, min(agency_workers, len(agencies)))) as executor:
+            results = list(executor.map(lambda agency: run_agency(agency, event, email_utils), agencies))
+    finally:
+        for email in email_utils.values():
+            email.close()
+
+    for result in results:
+        print('Result: {}'.format(result))
+    return results
 
 
 # =====================================================================================================================
 # Entry point for Regression Testing
 def regression(event, start_date, end_date):
-    global run_config
-    global email
-
     run_config = read_configuration(RunTrigger(event['time'], event['agency'], event['report_type']))
 
     test_mode = True if 'testing' in event and event['testing'] == True else False
     email = EmailUtil(run_config.email_account, test_mode) #TODO: This should be a test email object that returns email info in JSON format
+    context = RunContext(run_config, email, s3_bucket.format(event['agency']))
 
     print('Regression testing for dates: {} to {}'.format(start_date, end_date))
-    requireds, coverages, errors, warnings = check_events(start_date, end_date)
-    shift_map = report_shifts(start_date, end_date, errors)
+    snapshot = create_snapshot(context, start_date, end_date)
+    requireds, coverages, errors, warnings = check_events(context, start_date, end_date, snapshot)
+    shift_map = report_shifts(context, start_date, end_date, errors, snapshot)
 
     return errors, shift_map
 
@@ -839,7 +1026,6 @@ def regression(event, start_date, end_date):
 
 #     print('Here are the error recipients: {}'.format(run_config.email_recipients.shift_error_receipents))
 
-#     args = init_from_cmd(agency)
-#     # run_config: RunConfig = RunConfig(datetime.date.today(), args.agency, 'duty', agency_configuration)
+#     context, args = init_from_cmd(run_config)
 
-#     process(args.start_date, args.end_date)
+#     process(context, args.start_date, args.end_date)
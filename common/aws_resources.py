@@ -0,0 +1,41 @@
+"""
+Lazily constructed AWS clients and resources, shared by every module.
+
+Nothing is built at import time: each client or resource is created the first time it is asked for and then
+reused, so a Lambda cold start only pays for the botocore setup of the services the invocation actually touches.
+
+Clients are thread-safe and shared by all threads.  Resources are not, so every thread gets its own (from its own
+session): code running on several threads should ask get_resource for it each time rather than hold on to one.
+"""
+import threading
+
+_lock = threading.Lock()
+_local = threading.local() # .resources: service name -> the thread's resource
+_clients = {}
+
+
+def get_resource(service_name):
+    resources = getattr(_local, 'resources', None)
+    if resources is None:
+        resources = _local.resources = {}
+    if service_name not in resources:
+        import boto3
+        resources[service_name] = boto3.session.Session().resource(service_name)
+    return resources[service_name]
+
+
+def get_client(service_name):
+    if service_name not in _clients:
+        with _lock:
+            if service_name not in _clients:
+                import boto3
+                _clients[service_name] = boto3.client(service_name)
+    return _clients[service_name]
+
+
+def get_dynamodb():
+    return get_resource('dynamodb')
+
+
+def get_s3():
+    return get_client('s3')
@@ -0,0 +1,92 @@
+import collections
+import csv
+import hashlib
+import os
+
+# Entries written between two fsyncs of the journal
+SYNC_EVERY = int(os.environ.get('JOURNAL_SYNC_EVERY', '50'))
+
+# Last column of every complete journal line
+END_MARKER = 'ok'
+
+
+def row_keys(rows):
+    """
+    Yields (key, row) for the rows (lists of strings) of a source file.  The key is a hash of the row's values and of
+    how many identical rows came before it, so that a file with the same row twice still creates two events.
+    """
+    seen = collections.Counter()
+    for row in rows:
+        digest = hashlib.sha256('\x1f'.join(row).encode('utf-8')).hexdigest()[:32]
+        seen[digest] += 1
+        yield '{}-{}'.format(digest, seen[digest]), row
+
+
+class CheckpointJournal:
+    """
+    Append-only record of the source rows already imported (row key -> id of the event created for it), so that an
+    interrupted import can be run again and only create the events it has not created yet.
+
+    Every entry is flushed when it is recorded and the file is fsynced every sync_every entries (and when the journal
+    is closed), so a crash of the process loses nothing and a crash of the machine at most the last batch.  A request
+    in flight when the import stops may still have created its event without it being recorded.
+    """
+
+    def __init__(self, path, sync_every=SYNC_EVERY):
+        self.path = path
+        self.sync_every = sync_every
+        self.entries = {} # row key -> event id
+        self.unsynced = 0
+        self.load()
+        self.file = open(path, 'a', newline='')
+        self.writer = csv.writer(self.file)
+        if self.file.tell() > 0 and not self.ends_with_newline():
+            self.file.write('\r\n')
+
+    def ends_with_newline(self):
+        with open(self.path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def load(self):
+        if not os.path.isfile(self.path):
+            return
+        with open(self.path, 'r', newline='') as f:
+            for entry in csv.reader(f):
+                # The last line may be cut short if the machine stopped while it was written: only lines that made it
+                # to the end marker count
+                if len(entry) == 3 and entry[2] == END_MARKER:
+                    self.entries[entry[0]] = entry[1]
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def record(self, key, event_id):
+        self.entries[key] = str(event_id)
+        self.writer.writerow([key, event_id, END_MARKER])
+        self.file.flush()
+        self.unsynced += 1
+        if self.unsynced >= self.sync_every:
+            self.sync()
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+
+    def close(self):
+        if not self.file.closed:
+            self.sync()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -1,14 +1,22 @@
 from dataclasses import dataclass
 import os
-import boto3
 from boto3.dynamodb.conditions import Key
+from common import aws_resources
 from enum import Enum
 import json
 import datetime
+import time
 
-dynamodb = boto3.resource('dynamodb')
 agency_configuration_table_name = os.environ.get("AGENCY_CONFIGURATION_TABLE_NAME", "agency_configuration")
 
+# How long (seconds) a warm process keeps an agency's configuration before reading it again
+agency_configuration_ttl = int(os.environ.get("AGENCY_CONFIGURATION_TTL", "3600"))
+
+# Optional local JSON file that overrides DynamoDB (for offline runs).  It holds a map of agency -> configuration item.
+agency_configuration_file = os.environ.get("AGENCY_CONFIGURATION_FILE")
+
+_configuration_cache = {} # agency -> (expires_at, configuration item)
+
 agency_map = {
     'green knoll': '34',
     'finderne': '35',
@@ -52,6 +60,7 @@ class EmailRecipients:
 class AgencyConfig:
     notify_shift_within_days: int
     check_errors_within_days: int = 5
+    staffing_rules: str = 'duty_crew' # see staffing_rules.STAFFING_RULES
 
 @dataclass
 class Settings:
@@ -96,7 +105,8 @@ def is_coverage_level(obj):
 
 def agency_config_from_json(config_j):
     return AgencyConfig(
-            config_j['notify_shift_within_days']
+            config_j['notify_shift_within_days'],
+            staffing_rules=config_j.get('staffing_rules', 'duty_crew')
     )
 
 def email_config_from_json(config_j):
@@ -133,12 +143,46 @@ def run_config_from_json(run_trigger: RunTrigger, config_j):
     )   
 
 def read_configuration(run_trigger: RunTrigger):
-    retval = dynamodb.Table(agency_configuration_table_name).query(KeyConditionExpression=Key('agency').eq(run_trigger.agency))
+    config_json = get_configuration_item(run_trigger.agency)
+    return run_config_from_json(run_trigger, config_json)
+
+def get_configuration_item(agency, ttl=None):
+    """
+    Returns the configuration item for the agency, from the process-level cache if it has not expired.
+    Otherwise it is read from AGENCY_CONFIGURATION_FILE (if set) or from DynamoDB.
+    """
+    ttl = agency_configuration_ttl if ttl is None else ttl
+    now = time.monotonic()
+
+    cached = _configuration_cache.get(agency)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+
+    if agency_configuration_file:
+        config_json = read_configuration_file(agency_configuration_file, agency)
+    else:
+        config_json = read_configuration_from_db(agency)
+
+    _configuration_cache[agency] = (now + ttl, config_json)
+    return config_json
+
+def read_configuration_from_db(agency):
+    retval = aws_resources.get_dynamodb().Table(agency_configuration_table_name).query(KeyConditionExpression=Key('agency').eq(agency))
     if len(retval['Items']) == 0:
-        raise Exception('No configuration found for {}'.format(run_trigger.agency))
+        raise Exception('No configuration found for {}'.format(agency))
     
-    config_json = retval['Items'][0]
-    return run_config_from_json(run_trigger, config_json)
+    return retval['Items'][0]
+
+def read_configuration_file(filename, agency):
+    with open(filename) as f:
+        configurations = json.load(f)
+
+    if agency not in configurations:
+        raise Exception('No configuration found for {} in {}'.format(agency, filename))
+    return configurations[agency]
+
+def clear_configuration_cache():
+    _configuration_cache.clear()
 
 def read_trigger(filename) -> RunTrigger:
     trigger_json = None
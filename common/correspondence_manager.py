@@ -1,4 +1,6 @@
 import datetime
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from common.date_utils import get_current_day
 import boto3
 from boto3.dynamodb.conditions import Key
@@ -6,13 +8,39 @@ from common.utils import NotificationCategory
 import json
 
 
+def summary_hash(summary):
+    """
+    Stable content hash of a summary (dict, or its JSON string), stored with each notification so that
+    summaries can be compared without re-serializing them.
+    """
+    if type(summary) == str:
+        summary = json.loads(summary)
+    return hashlib.sha256(json.dumps(summary, sort_keys=True).encode('utf-8')).hexdigest()
+
+
 class CorrespondenceManager:
 
-    def __init__(self, dynamodb, control_table_name):
-        self.schedule_notification_table = dynamodb.Table(control_table_name)
+    def __init__(self, get_dynamodb, control_table_name):
+        # get_dynamodb returns the calling thread's DynamoDB resource (see aws_resources.get_dynamodb): the manager is
+        # used from the prefetch and outbox threads, and boto3 resources are not thread-safe
+        self.get_dynamodb = get_dynamodb
+        self.control_table_name = control_table_name
+        # notification_key -> latest notification item (None if nothing was sent).  Filled by prefetch_notifications,
+        # was_notification_sent and save_notification_sent.
+        self.latest_notifications = {}
+
+    @property
+    def schedule_notification_table(self):
+        return self.get_dynamodb().Table(self.control_table_name)
+
+    def clear_cache(self):
+        self.latest_notifications = {}
 
-    def save_notification_sent(self, agency, report_type, category: NotificationCategory, summary, context_date_str, email_list, override_send_date=None):
+    def save_notification_sent(self, agency, report_type, category: NotificationCategory, summary, context_date_str, email_list, override_send_date=None, digest=None):
         """
+        digest: digest of the rendered shift report (see html_formatter.shift_report_digest), stored so that
+        an unchanged report can be skipped without rendering it.
+
         Note: This is a bit of a hack.  
             - For error_notifications, we are using the context_date_str to store the date sent.
             - For shift_notifications, we are using the context_date_str to store the shift start.
@@ -28,7 +56,11 @@ class CorrespondenceManager:
             'date_sent': date_sent, 'timestamp': timestamp, 'recipients': email_list}
         if summary is not None: 
             item['summary'] = json.dumps(summary)
+            item['summary_hash'] = summary_hash(summary)
+        if digest is not None:
+            item['digest'] = digest
         self.schedule_notification_table.put_item(Item=item)
+        self.latest_notifications[notification_key] = item
         return notification_key, date_sent
 
     def is_items_in_retval(self, retval):
@@ -39,10 +71,11 @@ class CorrespondenceManager:
         return len(retval.get('Items')) > 0
 
 
-    def check_if_sent(self, category: NotificationCategory, notifications, summary, email_list):
+    def check_if_sent(self, category: NotificationCategory, notifications, summary, email_list, digest=None):
         """
         The rule is:
             If category = SHIFT_NOTIFCATION, then send once per day, unless the summary has changed.
+                When both the latest notification and this one have a digest, the digests are compared instead.
             If category = ERROR_NOTIFICATION, then send once per day
         """
         if len(notifications) == 0:
@@ -52,12 +85,18 @@ class CorrespondenceManager:
             # sort the items and get latest one
             latest_notification = sorted(notifications, key=lambda x: x['timestamp'])[-1]
 
+            if digest is not None and 'digest' in latest_notification:
+                return latest_notification['digest'] == digest
+
             latest_notification['recipients'].sort()
             email_list.sort()
 
             # print('Checking last_notification.recipients: {} against email list: {} Result: {}'.format(latest_notification['recipients'], email_list, (latest_notification['recipients'] == email_list)))
             if latest_notification['recipients'] == email_list:
-                if self.compare_summaries(latest_notification['summary'], summary):
+                if 'summary_hash' in latest_notification:
+                    if latest_notification['summary_hash'] == summary_hash(summary):
+                        return True
+                elif self.compare_summaries(latest_notification['summary'], summary):
                     return True
         else: 
             # Error notifications have date as part of the key, so if a notification exists for today's date, it was sent!
@@ -65,7 +104,7 @@ class CorrespondenceManager:
         
         return False
 
-    def was_notification_sent(self, agency, category: NotificationCategory, report_type, summary, shift_start, email_list):
+    def was_notification_sent(self, agency, category: NotificationCategory, report_type, summary, shift_start, email_list, digest=None):
         """
         Determine if a notification was sent for this shift.
 
@@ -75,6 +114,7 @@ class CorrespondenceManager:
         :param summary: Summary of the report (example: {'Sejal Patel': 3, 'Alice Hadley': 4, 'George Nowakowski': 12, 'Sydroy Morgan': 12})
         :param shift_start: Shift start time (YearMonthDayHour example: '2022050318' )
         :param email_list: List of email addresses
+        :param digest: Digest of the shift report (optional)
         :return: True if the notification was sent, False otherwise
 
 
@@ -84,21 +124,55 @@ class CorrespondenceManager:
         For errors, a notification will be sent once per day (to Martinsvillers).
         """
 
-        # For notification key, use the shift_start if it is a shift notification, otherwise use the current day for error notifications
-        key_date = shift_start if category == NotificationCategory.SHIFT_NOTIFICATION else get_current_day()
-        notification_key = self.make_notification_key(agency, category.value, report_type, key_date)
-
-        retval = self.schedule_notification_table.query(KeyConditionExpression=Key('agency_category_start').eq(notification_key))
-        if not self.is_items_in_retval(retval):
+        latest_notification = self.get_latest_notification(self.get_notification_key(agency, category, report_type, shift_start))
+        if latest_notification is None:
             # print('The key was not found: {}'.format(notification_key))
             was_sent = False
         else:
-            notifications = retval.get('Items')
-            was_sent = self.check_if_sent(category, notifications, summary, email_list)
+            was_sent = self.check_if_sent(category, [latest_notification], summary, email_list, digest)
 
         # print('Key: {} was sent: {}'.format(notification_key, was_sent))
         return was_sent
 
+    def is_digest_unchanged(self, agency, report_type, shift_start, digest):
+        """
+        True if the latest notification sent for the shift has the same digest, meaning the report would be identical
+        """
+        latest_notification = self.get_latest_notification(self.get_notification_key(agency, NotificationCategory.SHIFT_NOTIFICATION, report_type, shift_start))
+        return latest_notification is not None and latest_notification.get('digest') == digest
+
+    def get_latest_notification(self, notification_key):
+        if notification_key not in self.latest_notifications:
+            self.latest_notifications[notification_key] = self.query_latest_notification(notification_key)
+        return self.latest_notifications[notification_key]
+
+    def get_notification_key(self, agency, category: NotificationCategory, report_type, shift_start):
+        # For notification key, use the shift_start if it is a shift notification, otherwise use the current day for error notifications
+        key_date = shift_start if category == NotificationCategory.SHIFT_NOTIFICATION else get_current_day()
+        return self.make_notification_key(agency, category.value, report_type, key_date)
+
+    def query_latest_notification(self, notification_key):
+        """
+        Returns the most recent notification item saved for the key, or None
+        """
+        retval = self.schedule_notification_table.query(KeyConditionExpression=Key('agency_category_start').eq(notification_key))
+        if not self.is_items_in_retval(retval):
+            return None
+        return sorted(retval.get('Items'), key=lambda x: x['timestamp'])[-1]
+
+    def prefetch_notifications(self, agency, category: NotificationCategory, report_type, shift_starts, max_workers=8):
+        """
+        Load (in parallel) the latest notification for every shift_start into the cache, so that the
+        was_notification_sent checks for a run do not each query DynamoDB.
+        """
+        notification_keys = list(set(self.get_notification_key(agency, category, report_type, shift_start) for shift_start in shift_starts))
+        if len(notification_keys) == 0:
+            return
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(notification_keys))) as executor:
+            latest_notifications = list(executor.map(self.query_latest_notification, notification_keys))
+
+        self.latest_notifications.update(zip(notification_keys, latest_notifications))
 
     def compare_summaries(self, summary1, summary2):
         if type(summary1 ) == str:
@@ -0,0 +1,91 @@
+import bisect
+import datetime
+import common.date_utils as date_utils
+
+ONE_HOUR = datetime.timedelta(hours=1)
+
+
+def floor_hour(dt):
+    return dt.replace(minute=0, second=0, microsecond=0)
+
+
+def hour_span(start_dt, end_dt):
+    """
+    Returns the (start, end) hour indexes (see date_utils.to_hour_index) of the whole hours an event occupies: the
+    hour it starts in, plus one hour for every full hour of its duration.  This is the same set of hours the old
+    per-hour ('%Y%m%d%H') expansion produced.
+    """
+    return hour_index_span(date_utils.parse_iso(start_dt), date_utils.parse_iso(end_dt))
+
+
+def hour_index_span(start_date, end_date):
+    span_start = date_utils.to_hour_index(start_date)
+    return span_start, span_start + date_utils.get_hours(start_date, end_date)
+
+
+class IntervalIndex:
+    """
+    Events held as (start, end, event) intervals, sorted by start.  The events overlapping a range are found with a
+    bisect instead of a full scan.
+    start and end are datetimes (from_events, of teamup_utils.Events) or hour indexes (CoverageIndex).
+    """
+
+    def __init__(self, spans):
+        spans = [span for span in spans if span[1] > span[0]]
+        spans.sort(key=lambda span: span[0])
+
+        self.spans = spans
+        self.starts = [span[0] for span in spans]
+        self.max_length = max([span[1] - span[0] for span in spans]) if len(spans) > 0 else None
+
+    @classmethod
+    def from_events(cls, events):
+        return cls([(event.start, event.end, event) for event in events])
+
+    def __len__(self):
+        return len(self.spans)
+
+    def overlapping(self, start, end):
+        """
+        Returns the (start, end, event) spans that overlap [start, end), in order of start
+        """
+        if len(self.spans) == 0:
+            return []
+        lo = bisect.bisect_left(self.starts, start - self.max_length)
+        hi = bisect.bisect_left(self.starts, end)
+        return [span for span in self.spans[lo:hi] if span[1] > start]
+
+
+class CoverageIndex(IntervalIndex):
+    """
+    Coverage offered events held as intervals of the whole hours they cover, as hour indexes (see hour_span).
+
+    Memory grows with the number of events rather than with the number of hours they cover, and the events
+    offered during a required shift are found with a bisect instead of one dict lookup per hour.
+    """
+
+    def __init__(self, events):
+        super().__init__([hour_index_span(event.start, event.end) + (event,) for event in events])
+
+    def segments(self, start, end):
+        """
+        Sweep [start, end) and yield (segment_start, segment_end, events) for each stretch of time during which the
+        set of offered events does not change.  Stretches with no events are yielded too (with an empty list).
+        """
+        spans = self.overlapping(start, end)
+
+        boundaries = {start, end}
+        for span_start, span_end, _ in spans:
+            boundaries.add(max(span_start, start))
+            boundaries.add(min(span_end, end))
+        boundaries = sorted(boundaries)
+
+        active = []
+        next_span = 0
+        for segment_start, segment_end in zip(boundaries, boundaries[1:]):
+            active = [span for span in active if span[1] > segment_start]
+            while next_span < len(spans) and spans[next_span][0] <= segment_start:
+                if spans[next_span][1] > segment_start:
+                    active.append(spans[next_span])
+                next_span += 1
+            yield segment_start, segment_end, [span[2] for span in active]
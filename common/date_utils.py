@@ -1,5 +1,7 @@
 import dateutil
+import dateutil.parser
 import datetime
+import functools
 import pytz
 
 OUTPUT_FMT_YMDHM = '%m/%d/%Y %H:%M'
@@ -8,6 +10,15 @@ API_DATE_FORMAT_YMD = '%Y-%m-%d'
 HOUR_KEY_FMT = '%Y%m%d%H'
 YMD = '%Y%m%d'
 
+# Number of distinct timestamp strings parse_iso keeps parsed (a month of events has a few thousand)
+ISO_PARSE_CACHE_SIZE = 16384
+
+# Number of (day, start time, end time) spans span_for_date keeps (a year of days x a few dozen regulars' times)
+SPAN_CACHE_SIZE = 16384
+
+# The agencies' timezone: times are shown, and hour indexes formatted, in it
+NY_TZ = pytz.timezone('America/New_York')
+
 from collections import namedtuple
 
 Range = namedtuple('Range', ['start', 'end'])
@@ -19,8 +30,16 @@ def chop_dst(dt):
     return dt.replace('-04:00', '').replace('-05:00', '')
     # return dt.replace(tzinfo=None)
 
+@functools.lru_cache(maxsize=ISO_PARSE_CACHE_SIZE)
+def parse_iso(dt):
+    """
+    dateutil.parser.isoparse, memoized.  The same event timestamps are parsed many times during a run; datetimes are
+    immutable, so the parsed values can be shared.
+    """
+    return dateutil.parser.isoparse(dt)
+
 def date_simple_format(dt):
-    return dateutil.parser.isoparse(dt).strftime(OUTPUT_FMT_YMDHM)
+    return parse_iso(dt).strftime(OUTPUT_FMT_YMDHM)
 
 def key_to_date(key):
     return datetime.datetime.strptime(key, HOUR_KEY_FMT)
@@ -33,6 +52,32 @@ def add_hour_to_key(key):
     delta = datetime.timedelta(hours=1)
     return dt + delta
 
+def to_hour_index(dt):
+    """
+    The hour (an integer number of hours since the epoch, in UTC) that the timezone aware datetime dt falls in.
+    Consecutive hours have consecutive indexes, so hours can be compared and stepped through without formatting keys.
+    """
+    return int(dt.timestamp()) // 3600
+
+def hour_index_to_date(hour_index, tz):
+    return datetime.datetime.fromtimestamp(hour_index * 3600, tz)
+
+def hour_index_to_key(hour_index, tz):
+    """
+    Format an hour index as a HOUR_KEY_FMT key, in the timezone tz
+    """
+    return hour_index_to_date(hour_index, tz).strftime(HOUR_KEY_FMT)
+
+def to_date(value):
+    """
+    Date ranges are passed around either as 'YYYY-MM-DD' strings or as datetimes.  Return the date part.
+    """
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.datetime.strptime(value[:10], API_DATE_FORMAT_YMD).date()
+
 def parse_date_add_hours(date_str, hours, format):
     dt = datetime.datetime.strptime(date_str, format)
     delta = datetime.timedelta(hours=hours)
@@ -53,8 +98,8 @@ def get_days_diff(start_date, end_date):
 
 
 def get_hours_parse(start_dt, end_dt):
-    start_date = dateutil.parser.isoparse(start_dt)
-    end_date = dateutil.parser.isoparse(end_dt)
+    start_date = parse_iso(start_dt)
+    end_date = parse_iso(end_dt)
     return get_hours(start_date, end_date)
 
 
@@ -67,11 +112,11 @@ def get_current_day():
 
 
 def convert_date_to_ny(date_obj):
-    return date_obj.astimezone(pytz.timezone("America/New_York"))    
+    return date_obj.astimezone(NY_TZ)
 
 def get_now_tz():
     utc_now = pytz.utc.localize(datetime.datetime.utcnow())
-    return utc_now.astimezone(pytz.timezone("America/New_York"))    
+    return utc_now.astimezone(NY_TZ)
 
 def hours_overlap(range1: Range, range2: Range):
     """
@@ -103,7 +148,13 @@ def span_for_date(target_date, span_start_time, span_end_time):
 
     # Added one day to the end date
     Returns: (2022 05 10 18 00 00, 2022 05 11 06 00 00)
+
+    Only the day of target_date matters, and the spans are cached per (day, start time, end time)
     """
+    return _span_for_day(datetime.date(target_date.year, target_date.month, target_date.day), span_start_time, span_end_time)
+
+@functools.lru_cache(maxsize=SPAN_CACHE_SIZE)
+def _span_for_day(target_date, span_start_time, span_end_time):
     span_start_time = datetime.datetime.strptime(span_start_time, '%H:%M')
     span_end_time = datetime.datetime.strptime(span_end_time, '%H:%M')
 
@@ -1,17 +1,74 @@
 # Import smtplib to provide email functions
 import smtplib
 import datetime
+import threading
 from common.config_data import EmailConfig
 
 # Import the email modules
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 
+
 class EmailUtil:
+    """
+    Sends email through the configured SMTP server.
+
+    By default every message opens its own connection (connect, starttls, login, send, quit).  With keep_alive=True
+    (or when used as a context manager) one authenticated connection is held for the whole run and re-established
+    if the server drops it.  Call close() (or leave the with block) when done.
+    """
 
-    def __init__(self, email_config: EmailConfig, is_test_mode=False):
+    def __init__(self, email_config: EmailConfig, is_test_mode=False, keep_alive=False):
         self.email_config = email_config
         self.is_test_mode = is_test_mode
+        self.keep_alive = keep_alive
+        self.connection = None
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        self.keep_alive = True
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def connect(self):
+        s = smtplib.SMTP(self.email_config.smtp_server, 587)
+        s.starttls()
+        s.login(self.email_config.email_account, self.email_config.email_password)
+        return s
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                try:
+                    self.connection.quit()
+                except smtplib.SMTPException:
+                    pass
+                self.connection = None
+
+    def deliver(self, send):
+        """
+        Run send(smtp_connection), on the held connection when keep_alive is set (reconnecting once if it was
+        dropped), otherwise on a connection opened just for this message.
+        """
+        if not self.keep_alive:
+            s = self.connect()
+            try:
+                send(s)
+            finally:
+                s.quit()
+            return
+
+        with self.lock:
+            if self.connection is None:
+                self.connection = self.connect()
+            try:
+                send(self.connection)
+            except smtplib.SMTPServerDisconnected:
+                print('SMTP connection was dropped, reconnecting')
+                self.connection = self.connect()
+                send(self.connection)
 
     def send_html_email(self, to_emails, cc_list, subject, body):
         if self.is_test_mode:
@@ -33,11 +90,7 @@ class EmailUtil:
 
         # Send the email via our own SMTP server.
         # s = smtplib.SMTP('smtp.gmail.com', 587)
-        s = smtplib.SMTP(self.email_config.smtp_server, 587)
-        s.starttls()
-        s.login(self.email_config.email_account, self.email_config.email_password)
-        s.send_message(msg)
-        s.quit()
+        self.deliver(lambda s: s.send_message(msg))
 
         print('{} email with subject: {} sent to: {} cc list: '.format(datetime.datetime.now(), subject, to_emails, cc_list))
 
@@ -58,11 +111,7 @@ class EmailUtil:
 
 
         # Send the email via our own SMTP server.
-        s = smtplib.SMTP(self.email_config.smtp_server, 587)
-        s.starttls()
-        s.login(self.email_config.email_account, self.email_config.email_password)
         print('Sending from{} to{} msg{}'.format(self.email_config.from_email_address, to_emails, msg.as_string()))
-        s.sendmail(self.email_config.from_email_address, to_emails, msg.as_string())
-        s.quit()
+        self.deliver(lambda s: s.sendmail(self.email_config.from_email_address, to_emails, msg.as_string()))
 
         print('{} email with subject: {} sent to: {} cc list: '.format(datetime.datetime.now(), subject, to_emails, cc_list))
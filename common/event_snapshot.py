@@ -0,0 +1,151 @@
+import datetime
+import pytz
+import common.date_utils as date_utils
+import common.teamup_utils as teamup_utils
+
+
+def start_of_day(day):
+    return pytz.timezone('America/New_York').localize(datetime.datetime.combine(day, datetime.time()))
+
+
+def overlaps_days(event, start_day, end_day):
+    """
+    True if the event overlaps the days start_day through end_day
+    """
+    return event.start < start_of_day(end_day + datetime.timedelta(days=1)) and event.end > start_of_day(start_day)
+
+
+def merge_by_start(events, added):
+    """
+    Insert the added events ((start, event) in the order they were added) into events, each before the first event
+    that starts after it
+    """
+    added = sorted(added, key=lambda entry: entry[0])
+    merged = []
+    next_added = 0
+    for event in events:
+        while next_added < len(added) and event.start > added[next_added][0]:
+            merged.append(added[next_added][1])
+            next_added += 1
+        merged.append(event)
+    merged.extend(entry[1] for entry in added[next_added:])
+    return merged
+
+
+class EventSnapshot:
+    """
+    A per-run, in-memory copy of the events in one or more subcalendars.
+
+    Every window the run needs is registered with add_window before fetch() is called.  Each subcalendar is then
+    fetched once, for the union of its windows, and get_events serves range-filtered views of that single read.
+    This way error checking and shift reporting see the same data without reading Teamup twice.
+    """
+
+    def __init__(self, calendar_key, api_key, level_mappings=None):
+        self.calendar_key = calendar_key
+        self.api_key = api_key
+        self.level_mappings = level_mappings # resolves each event's role, see teamup_utils.Event
+        self.windows = {} # subcalendar_id -> (first date, last date)
+        self.events = {} # subcalendar_id -> list of events
+
+    def add_window(self, start_dt, end_dt, subcalendar_id):
+        start_day = date_utils.to_date(start_dt)
+        end_day = date_utils.to_date(end_dt)
+        if subcalendar_id in self.windows:
+            window = self.windows[subcalendar_id]
+            start_day = min(start_day, window[0])
+            end_day = max(end_day, window[1])
+        self.windows[subcalendar_id] = (start_day, end_day)
+
+    def fetch(self):
+        subcalendars = list(self.windows.keys())
+        queries = []
+        for subcalendar_id in subcalendars:
+            start_day, end_day = self.windows[subcalendar_id]
+            queries.append((start_day.strftime(date_utils.API_DATE_FORMAT_YMD), end_day.strftime(date_utils.API_DATE_FORMAT_YMD),
+                self.calendar_key, subcalendar_id, self.api_key, self.level_mappings))
+
+        for subcalendar_id, response in zip(subcalendars, teamup_utils.get_events_concurrently(queries)):
+            self.events[subcalendar_id] = response['events']
+        return self
+
+    def to_dict(self):
+        """
+        A JSON serializable copy of the snapshot (see from_dict)
+        """
+        return {
+            'windows': {subcalendar_id: [window[0].strftime(date_utils.API_DATE_FORMAT_YMD), window[1].strftime(date_utils.API_DATE_FORMAT_YMD)]
+                for subcalendar_id, window in self.windows.items()},
+            'events': {subcalendar_id: [event.to_dict() for event in events] for subcalendar_id, events in self.events.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data, calendar_key, api_key, level_mappings=None):
+        snapshot = cls(calendar_key, api_key, level_mappings)
+        for subcalendar_id, window in data['windows'].items():
+            snapshot.windows[subcalendar_id] = (date_utils.to_date(window[0]), date_utils.to_date(window[1]))
+        snapshot.events = {subcalendar_id: [teamup_utils.Event.from_teamup(event, level_mappings) for event in events]
+            for subcalendar_id, events in data['events'].items()}
+        return snapshot
+
+    def apply_changes(self, changed_events):
+        """
+        Bring the snapshot up to date with the events created, changed or deleted since it was fetched (the events of
+        a Teamup modifiedSince query).  A changed event replaces its old version, a deleted event (delete_dt is set)
+        is removed, and an event moved to another subcalendar moves with it.
+
+        Returns subcalendar_id -> [(old_event, new_event)] for every event that changed, with None for the missing
+        side of an added or removed event.
+        """
+        changes = {}
+        for subcalendar_id, events in list(self.events.items()):
+            start_day, end_day = self.windows[subcalendar_id]
+            # A changed event keeps its place (its slot; None once deleted), a new one goes in order of start
+            slots = list(events)
+            positions = {event.id: i for i, event in enumerate(events)}
+            added = {} # id -> (start it was added with, event)
+
+            for changed in changed_events:
+                subcalendar_ids = [str(x) for x in changed.subcalendar_ids]
+                new_event = None
+                if changed.delete_dt is None and str(subcalendar_id) in subcalendar_ids and overlaps_days(changed, start_day, end_day):
+                    new_event = changed
+
+                old_event = None
+                if changed.id in positions and slots[positions[changed.id]] is not None:
+                    old_event = slots[positions[changed.id]]
+                    slots[positions[changed.id]] = new_event
+                elif changed.id in added:
+                    start, old_event = added[changed.id]
+                    if new_event is not None:
+                        added[changed.id] = (start, new_event)
+                    else:
+                        del added[changed.id]
+                elif new_event is not None:
+                    added[changed.id] = (new_event.start, new_event)
+
+                if old_event is not None or new_event is not None:
+                    changes.setdefault(subcalendar_id, []).append((old_event, new_event))
+
+            if subcalendar_id in changes:
+                self.events[subcalendar_id] = merge_by_start([event for event in slots if event is not None], list(added.values()))
+        return changes
+
+    def get_events(self, start_dt, end_dt, subcalendar_id):
+        """
+        Return the events (in the same shape as a get_events response) that overlap the days start_dt through end_dt.
+        """
+        start_day = date_utils.to_date(start_dt)
+        end_day = date_utils.to_date(end_dt)
+        window = self.windows.get(subcalendar_id)
+        if window is None or subcalendar_id not in self.events or start_day < window[0] or end_day > window[1]:
+            raise Exception('Snapshot does not cover {} - {} for subcalendar {}'.format(start_day, end_day, subcalendar_id))
+
+        range_start = start_of_day(start_day)
+        range_end = start_of_day(end_day + datetime.timedelta(days=1))
+
+        events = []
+        for event in self.events[subcalendar_id]:
+            if event.start < range_end and event.end > range_start:
+                events.append(event)
+        return {'events': events}
@@ -1,13 +1,19 @@
 import common.date_utils as date_utils
 import common.utils as utils
 import datetime
-import dateutil 
+import hashlib
+import json
 
+# Bump when the way a shift report is rendered changes, so that every shift report is re-sent
+SHIFT_REPORT_VERSION = 1
 
 template = None
 with open('docs/schedule_template.txt', 'r') as f:
     template = f.read()
 
+# Changes with the rendering code (SHIFT_REPORT_VERSION) and with the template itself
+template_version = '{}-{}'.format(SHIFT_REPORT_VERSION, hashlib.sha256(template.encode('utf-8')).hexdigest()[:12])
+
 unstaffed_template = None
 
 with open('docs/unstaffed_template.txt', 'r') as f:
@@ -37,46 +43,70 @@ def format_html_shift_report(final_report_map):
     html_map = dict()
 
     for shift_date, shift_and_coverage in final_report_map.items():
-        shift = shift_and_coverage['shift']
-        coverage = shift_and_coverage['coverage']
-        summary = shift_and_coverage['shift-summary']
-
-        max_members = -1
-        for coverage_span in coverage:
-            max_members = max(max_members, len(coverage_span['who'].split(',')))
-
-        shift_content = '<h2>{}</h2>'.format(utils.create_shift_name(shift))
-        if 'title' in shift:
-            shift_content += '<h3>{}</h3>'.format(shift['title'])
-
-        shift_content += '<h3>Shift Times: {} - {}</h3>'.format(date_utils.date_simple_format(shift['start_dt']), date_utils.date_simple_format(shift['end_dt']))
-        shift_table = '<table>'
-        shift_table += '<tr><th>Start</th><th>End</th><th>Hours</th>{}</tr>'.format(''.join(['<th>Member</th>' for x in range(max_members)]))
-        for coverage_span in coverage:
-            shift_row = '<tr><td>{}</td><td>{}</td><td class="cell_hour">{}</td>'.format(
-                date_utils.key_to_date(coverage_span['start_dt']).strftime(date_utils.OUTPUT_FMT_YMDHM), 
-                date_utils.key_to_date(coverage_span['end_dt']).strftime(date_utils.OUTPUT_FMT_YMDHM),
-                date_utils.get_hours(date_utils.key_to_date(coverage_span['start_dt']), date_utils.key_to_date(coverage_span['end_dt']))
-                )
-            shift_row += ''.join(['<td>{}</td>'.format(x) for x in coverage_span['who'].split(',')])
-            # TODO: Fill in blank cells with empty strings here
-            num_blank_cells = max_members - len(coverage_span['who'].split(','))
-            shift_row += ''.join(['<td></td>' for x in range(num_blank_cells)])
-            shift_row += '</tr>'
-            shift_table += shift_row
-
-        shift_table += '</table>'
-        shift_content += shift_table
-
-        shift_content += '<h3>Shift Summary</h3>'
-        shift_content += build_shift_summary_table(summary)
-
-        html_file = template.replace('<!-- Content -->', shift_content)
-        html_map[shift_date] = html_file
+        html_map[shift_date] = format_html_shift(shift_and_coverage)
 
     return html_map
 
 
+def format_html_shift(shift_and_coverage):
+    """
+    Input: one entry of the final_report_map ('shift', 'coverage' and 'shift-summary')
+
+    Returns the html report for the shift
+    """
+    shift = shift_and_coverage['shift']
+    coverage = shift_and_coverage['coverage']
+    summary = shift_and_coverage['shift-summary']
+
+    max_members = -1
+    for coverage_span in coverage:
+        max_members = max(max_members, len(coverage_span['who'].split(',')))
+
+    shift_content = '<h2>{}</h2>'.format(utils.create_shift_name(shift))
+    if shift.title is not None:
+        shift_content += '<h3>{}</h3>'.format(shift.title)
+
+    shift_content += '<h3>Shift Times: {} - {}</h3>'.format(date_utils.date_simple_format(shift.start_dt), date_utils.date_simple_format(shift.end_dt))
+    shift_table = '<table>'
+    shift_table += '<tr><th>Start</th><th>End</th><th>Hours</th>{}</tr>'.format(''.join(['<th>Member</th>' for x in range(max_members)]))
+    for coverage_span in coverage:
+        shift_row = '<tr><td>{}</td><td>{}</td><td class="cell_hour">{}</td>'.format(
+            date_utils.key_to_date(coverage_span['start_dt']).strftime(date_utils.OUTPUT_FMT_YMDHM), 
+            date_utils.key_to_date(coverage_span['end_dt']).strftime(date_utils.OUTPUT_FMT_YMDHM),
+            date_utils.get_hours(date_utils.key_to_date(coverage_span['start_dt']), date_utils.key_to_date(coverage_span['end_dt']))
+            )
+        shift_row += ''.join(['<td>{}</td>'.format(x) for x in coverage_span['who'].split(',')])
+        # TODO: Fill in blank cells with empty strings here
+        num_blank_cells = max_members - len(coverage_span['who'].split(','))
+        shift_row += ''.join(['<td></td>' for x in range(num_blank_cells)])
+        shift_row += '</tr>'
+        shift_table += shift_row
+
+    shift_table += '</table>'
+    shift_content += shift_table
+
+    shift_content += '<h3>Shift Summary</h3>'
+    shift_content += build_shift_summary_table(summary)
+
+    return template.replace('<!-- Content -->', shift_content)
+
+
+def shift_report_digest(shift_and_coverage, recipients):
+    """
+    Stable digest of everything a shift report depends on: the shift, its hour-by-hour coverage, the summary,
+    the recipients and the template version.  If the digest has not changed, neither has the report.
+    """
+    shift = shift_and_coverage['shift']
+    content = {
+        'shift': [shift.start_dt, shift.end_dt, shift.title],
+        'coverage': [[coverage_span['start_dt'], coverage_span['end_dt'], coverage_span['who']] for coverage_span in shift_and_coverage['coverage']],
+        'summary': shift_and_coverage['shift-summary'],
+        'recipients': sorted(recipients),
+        'template': template_version
+    }
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode('utf-8')).hexdigest()
+
+
 def format_html_report_errors(shift_errors, start_date, max_days):
 
     if len(shift_errors) == 0:
@@ -90,7 +120,7 @@ def format_html_report_errors(shift_errors, start_date, max_days):
         shift = shift_data['shift']
         errors = shift_data['errors']
 
-        days_from_now = date_utils.get_days_diff(datetime.datetime.strptime(start_date, date_utils.API_DATE_FORMAT_YMD), dateutil.parser.isoparse(shift['start_dt']) )
+        days_from_now = date_utils.get_days_diff(datetime.datetime.strptime(start_date, date_utils.API_DATE_FORMAT_YMD), shift.start)
 
         if days_from_now <= max_days:
             shift_content += '<h2>{} days from now</h2>'.format(days_from_now)
@@ -109,8 +139,8 @@ def format_html_report_errors(shift_errors, start_date, max_days):
             error_table.insert_header([utils.create_shift_name(shift)], [4])
 
             second_row = 'Shift Times: {} - {}'.format(
-                date_utils.date_simple_format(shift['start_dt']), 
-                date_utils.date_simple_format(shift['end_dt']))
+                date_utils.date_simple_format(shift.start_dt), 
+                date_utils.date_simple_format(shift.end_dt))
             error_table.insert_header([second_row], [4])
             
         shift_content += str(error_table)
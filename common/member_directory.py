@@ -0,0 +1,102 @@
+import re
+
+# DynamoDB's limit on the number of keys in one batch_get_item request
+BATCH_GET_LIMIT = 100
+
+
+def get_email_address_from_notes(coverage):
+    if coverage.notes is not None:
+        lst = re.findall(r'\S+@\S+', coverage.notes)
+        if len(lst) == 0:
+            return
+
+        # Remove anything before the colon: for example: "email:xxx.yy.com"
+        # Remove <p></p> if they are there
+        email_address = lst[0][lst[0].find(':')+1:].replace('<p>', '').replace('</p>', '')
+        return email_address
+
+
+class MemberDirectory:
+    """
+    Resolves squad members' email addresses, caching the results (including misses) per agency.
+
+    An address written in an event's notes ("email: email@domain") wins and is saved to the squad member table.
+    Every other member is looked up in the table with batched get requests, so resolving a whole run's worth of
+    members takes one or two round trips instead of one per member.
+    """
+
+    def __init__(self, get_dynamodb, table_name):
+        # get_dynamodb returns the calling thread's DynamoDB resource (see aws_resources.get_dynamodb): agencies are
+        # checked on several threads, and boto3 resources are not thread-safe
+        self.get_dynamodb = get_dynamodb
+        self.table_name = table_name
+        self.email_addresses = {} # (agency, member_name) -> email address
+        self.misses = set() # (agency, member_name) with no known email address
+
+    @property
+    def member_table(self):
+        return self.get_dynamodb().Table(self.table_name)
+
+    def get_email_address(self, agency, member_name):
+        return self.email_addresses.get((agency, member_name))
+
+    def forget_misses(self):
+        """
+        Members that had no address may have been given one since; look them up again on the next resolve
+        """
+        self.misses = set()
+
+    def resolve(self, agency, coverages):
+        """
+        Resolve the email address of everyone in the given coverage events ('who').
+        The notes of a member's events are only parsed until an address is found.
+        """
+        unresolved = set()
+        for coverage in coverages:
+            key = (agency, coverage.who)
+            if key in self.email_addresses or key in self.misses:
+                continue
+
+            # A member with no address in the notes so far may still have one in a later event's notes
+            email_address = get_email_address_from_notes(coverage)
+            if email_address:
+                self.save_email_address(agency, coverage.who, email_address)
+                unresolved.discard(coverage.who)
+            else:
+                unresolved.add(coverage.who)
+
+        unresolved = list(unresolved)
+        found = self.get_email_addresses_from_db(agency, unresolved)
+        for member_name in unresolved:
+            if member_name in found:
+                self.email_addresses[(agency, member_name)] = found[member_name]
+            else:
+                self.misses.add((agency, member_name))
+
+    def get_email_addresses_from_db(self, agency, member_names):
+        """
+        Returns member_name -> email address for the members found in the squad member table
+        """
+        found = {}
+        for i in range(0, len(member_names), BATCH_GET_LIMIT):
+            keys = [{'agency': agency, 'member_name': member_name} for member_name in member_names[i:i + BATCH_GET_LIMIT]]
+            request_items = {self.table_name: {'Keys': keys}}
+            while request_items:
+                resp = self.get_dynamodb().batch_get_item(RequestItems=request_items)
+                for item in resp.get('Responses', {}).get(self.table_name, []):
+                    if 'email_address' in item:
+                        found[item['member_name']] = item['email_address']
+                request_items = resp.get('UnprocessedKeys')
+        return found
+
+    def save_email_address(self, agency, member_name, email_address):
+        print('*** Putting new email address.  Member: {} address: {}'.format(member_name, email_address))
+        self.member_table.put_item(
+            Item={
+                'agency': agency,
+                'member_name': member_name,
+                'email_address': email_address
+            }
+        )
+        self.email_addresses[(agency, member_name)] = email_address
+        self.misses.discard((agency, member_name))
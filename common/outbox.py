@@ -0,0 +1,103 @@
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from common.utils import NotificationCategory
+
+SENT = 'sent'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+
+
+@dataclass
+class Notification:
+    """
+    Everything needed to deliver one notification, so it can be sent (or re-sent) without regenerating the report.
+    The dedupe key is (agency, category, report_type, context_date_str).  A notification with no category is a plain
+    text alert: it is not deduped, recorded or archived.
+    """
+    agency: str
+    report_type: str
+    category: NotificationCategory
+    recipients: list
+    subject: str
+    body: str
+    summary: dict = None
+    context_date_str: str = None
+    file_name: str = None # name the html is archived under
+    cc_list: list = field(default_factory=list)
+    digest: str = None # digest of a shift report, stored with the notification when it is sent
+
+
+@dataclass
+class DeliveryResult:
+    notification: Notification
+    status: str # SENT, SKIPPED or FAILED
+    error: str = None # for SENT / SKIPPED: the bookkeeping after the send failed
+
+
+class Outbox:
+    """
+    Queue of notifications drained by a bounded pool of workers.
+
+    Report generation enqueues notifications and carries on; deliver(notification) runs on a worker and returns
+    True if the notification was sent (False if it was skipped, for example because it was already sent).  Failed
+    deliveries are kept and can be retried with retry_failed().
+
+    record(notification, sent), if given, does the bookkeeping once deliver has returned (recording that the
+    notification was sent, archiving it).  A failure there is reported with the SENT / SKIPPED result and is not
+    retried: the email is out, and sending it again would duplicate it.
+    """
+
+    def __init__(self, deliver, max_workers=4, record=None):
+        self.deliver = deliver
+        self.record = record
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.pending = []
+        self.failed = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def enqueue(self, notification: Notification):
+        self.pending.append(self.executor.submit(self.run, notification))
+
+    def run(self, notification: Notification) -> DeliveryResult:
+        try:
+            sent = self.deliver(notification)
+        except Exception as e:
+            print('Failed to deliver notification: {} to: {}'.format(notification.subject, notification.recipients))
+            print(traceback.format_exc())
+            return DeliveryResult(notification, FAILED, str(e))
+
+        status = SENT if sent else SKIPPED
+        if self.record is not None:
+            try:
+                self.record(notification, sent)
+            except Exception as e:
+                print('Failed to record notification: {} to: {}'.format(notification.subject, notification.recipients))
+                print(traceback.format_exc())
+                return DeliveryResult(notification, status, str(e))
+        return DeliveryResult(notification, status)
+
+    def drain(self):
+        """
+        Wait for every queued notification.  Returns their DeliveryResults, in the order they were enqueued.
+        """
+        results = [future.result() for future in self.pending]
+        self.pending = []
+        self.failed = [result.notification for result in results if result.status == FAILED]
+        return results
+
+    def retry_failed(self):
+        """
+        Re-queue the notifications that failed in the last drain, and drain again
+        """
+        for notification in self.failed:
+            self.enqueue(notification)
+        return self.drain()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,68 @@
+"""
+Reconcile the events a calendar should have (Teamup event payloads, e.g. from a spreadsheet) with the events it has
+(teamup_utils.Event): which to create, which to delete and which are already there.
+
+Both sides are indexed once by event_key, so a plan is computed in linear time however many shifts are synced.
+"""
+import collections
+from dataclasses import dataclass, field
+import common.date_utils as date_utils
+
+
+def event_key(event):
+    """
+    The identity of an event (a teamup_utils.Event or an event payload dict) when reconciling:
+    (start, end, subcalendar, title or who), with the times as local times (see date_utils.chop_dst)
+    """
+    if isinstance(event, dict):
+        start_dt, end_dt, subcalendar_id = event['start_dt'], event['end_dt'], event.get('subcalendar_id')
+        name = event.get('title') or event.get('who')
+    else:
+        start_dt, end_dt, subcalendar_id = event.start_dt, event.end_dt, event.subcalendar_id
+        name = event.title or event.who
+    return (date_utils.chop_dst(start_dt), date_utils.chop_dst(end_dt), str(subcalendar_id), (name or '').strip())
+
+
+def build_index(events):
+    """
+    event_key -> the events with that key, in their order
+    """
+    index = collections.defaultdict(collections.deque)
+    for event in events:
+        index[event_key(event)].append(event)
+    return index
+
+
+@dataclass
+class ReconcilePlan:
+    to_create: list = field(default_factory=list) # event payloads not in the calendar yet
+    to_delete: list = field(default_factory=list) # Events in the calendar that are not wanted
+    unchanged: list = field(default_factory=list) # (event payload, the Event already in the calendar)
+
+    def print_preview(self):
+        print('Will create: {} events, delete: {} events, keep: {} events'.format(len(self.to_create), len(self.to_delete), len(self.unchanged)))
+        for event in self.to_create:
+            print('\tCreate: {} - {} {}'.format(event['start_dt'], event['end_dt'], event.get('title') or event.get('who') or ''))
+        for event in self.to_delete:
+            print('\tDelete: {} - {} {} id: {}'.format(event.start_dt, event.end_dt, event.title or event.who or '', event.id))
+
+
+def reconcile(desired_events, existing_events):
+    """
+    desired_events: event payloads the calendar should have, existing_events: the Events it has.
+    Every desired event is matched with at most one existing event of the same event_key, so that duplicates on either
+    side are created or deleted.  Returns a ReconcilePlan, with the events in their original order
+    """
+    existing_events = list(existing_events)
+    index = build_index(existing_events)
+    plan = ReconcilePlan()
+    for event in desired_events:
+        matches = index.get(event_key(event))
+        if matches:
+            plan.unchanged.append((event, matches.popleft()))
+        else:
+            plan.to_create.append(event)
+
+    matched = set(id(existing_event) for _, existing_event in plan.unchanged)
+    plan.to_delete = [existing_event for existing_event in existing_events if id(existing_event) not in matched]
+    return plan
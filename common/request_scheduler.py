@@ -0,0 +1,199 @@
+import collections
+import email.utils
+import random
+import threading
+import time
+from dataclasses import dataclass
+import requests
+
+# Statuses worth trying again: throttled, or a transient server error
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Requests that can be sent twice without doing the work twice.  Others (POST) are only retried when the server
+# certainly did not act on them: throttled (429), or the connection was never made.
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'}
+
+
+class TokenBucket:
+    """
+    Allows rate requests per second on average, in bursts of up to capacity
+    """
+
+    def __init__(self, rate, capacity, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = capacity
+        self.updated = clock()
+        self.paused_until = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take a token, waiting until one is available.  Returns the seconds waited.
+        """
+        waited = 0
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            self.sleep(delay)
+            waited += delay
+
+    def pause(self, seconds):
+        """
+        Hold every request for the given seconds (the server asked us to slow down)
+        """
+        with self.lock:
+            self.paused_until = max(self.paused_until, self.clock() + seconds)
+
+
+@dataclass
+class RequestRecord:
+    method: str
+    url: str
+    status: int # None if no response was received
+    attempts: int
+    elapsed: float # seconds, including the time spent waiting for a token and backing off
+    waited: float # seconds spent waiting for a token or backing off
+
+
+class RequestMetrics:
+    """
+    Counters over every request sent through a scheduler, and the records of the most recent requests
+    """
+
+    def __init__(self, keep=1000):
+        self.lock = threading.Lock()
+        self.records = collections.deque(maxlen=keep)
+        self.statuses = collections.Counter() # status of every attempt (None: no response)
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.total_elapsed = 0
+        self.total_waited = 0
+
+    def record_attempt(self, status):
+        with self.lock:
+            self.statuses[status] += 1
+
+    def record(self, record: RequestRecord, failed):
+        with self.lock:
+            self.records.append(record)
+            self.requests += 1
+            self.retries += record.attempts - 1
+            self.failures += 1 if failed else 0
+            self.total_elapsed += record.elapsed
+            self.total_waited += record.waited
+
+    def summary(self):
+        with self.lock:
+            return {
+                'requests': self.requests,
+                'retries': self.retries,
+                'throttled': self.statuses[429],
+                'failures': self.failures,
+                'statuses': dict(self.statuses),
+                'average_seconds': self.total_elapsed / self.requests if self.requests > 0 else 0,
+                'waited_seconds': self.total_waited
+            }
+
+
+def get_retry_after(response):
+    """
+    Seconds to wait from the response's Retry-After header (seconds or an HTTP date), or None
+    """
+    value = response.headers.get('Retry-After') if response is not None else None
+    if value is None:
+        return None
+    try:
+        return max(0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RequestScheduler:
+    """
+    Sends requests through a token bucket rate limiter, at most max_concurrent at a time, retrying throttled and
+    transient failures with jittered exponential backoff (or as long as the server's Retry-After asks).
+
+    After the retries are used up, the last response is returned (or the last exception raised), so callers handle
+    a failed request the same way as before.
+    """
+
+    def __init__(self, rate, burst, max_concurrent, max_retries, backoff_base=0.5, backoff_max=30, max_retry_after=120,
+        clock=time.monotonic, sleep=time.sleep, jitter=random.uniform):
+        self.bucket = TokenBucket(rate, burst, clock, sleep)
+        self.slots = threading.BoundedSemaphore(max_concurrent)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_retry_after = max_retry_after
+        self.clock = clock
+        self.sleep = sleep
+        self.jitter = jitter
+        self.metrics = RequestMetrics()
+
+    def should_retry(self, method, response, exception):
+        if exception is not None:
+            return method in IDEMPOTENT_METHODS or isinstance(exception, requests.exceptions.ConnectTimeout)
+        if response.status_code == 429:
+            return True
+        return response.status_code in RETRY_STATUSES and method in IDEMPOTENT_METHODS
+
+    def get_backoff(self, attempt, response):
+        """
+        Seconds to wait before the next attempt: full jitter exponential backoff, but at least the Retry-After
+        """
+        backoff = self.jitter(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        retry_after = get_retry_after(response)
+        if retry_after is not None:
+            backoff = max(backoff, min(retry_after, self.max_retry_after))
+        return backoff
+
+    def send(self, method, url, send):
+        """
+        send() makes one attempt of the request (method, url) and returns the response
+        """
+        started = self.clock()
+        waited = 0
+        attempt = 0
+        while True:
+            response = None
+            exception = None
+            waited += self.bucket.acquire()
+            with self.slots:
+                try:
+                    response = send()
+                except requests.exceptions.RequestException as e:
+                    exception = e
+            self.metrics.record_attempt(None if response is None else response.status_code)
+
+            if (exception is None and response.status_code not in RETRY_STATUSES) or attempt >= self.max_retries or \
+                not self.should_retry(method, response, exception):
+                failed = exception is not None or response.status_code >= 400
+                status = None if response is None else response.status_code
+                self.metrics.record(RequestRecord(method, url.split('?')[0], status, attempt + 1, self.clock() - started, waited), failed)
+                if exception is not None:
+                    raise exception
+                return response
+
+            backoff = self.get_backoff(attempt, response)
+            print('Retrying {} request in {:.1f}s (status: {})'.format(method, backoff,
+                response.status_code if response is not None else type(exception).__name__))
+            if response is not None and response.status_code == 429:
+                # Every request is over the limit, not just this one
+                self.bucket.pause(backoff)
+            self.sleep(backoff)
+            waited += backoff
+            attempt += 1
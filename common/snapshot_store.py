@@ -0,0 +1,59 @@
+import json
+import os
+import zlib
+from common import aws_resources
+
+# Where incremental runs keep their state: a local directory when SNAPSHOT_STORE_DIR is set, otherwise DynamoDB
+snapshot_store_dir = os.environ.get('SNAPSHOT_STORE_DIR')
+snapshot_table_name = os.environ.get('SNAPSHOT_TABLE_NAME', 'coverage_snapshots')
+
+
+class FileSnapshotStore:
+    """
+    Keeps each run state as a JSON file in a local directory
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def get_path(self, key):
+        return os.path.join(self.directory, '{}.json'.format(key))
+
+    def load(self, key):
+        if not os.path.exists(self.get_path(key)):
+            return None
+        with open(self.get_path(key), 'r') as f:
+            return json.load(f)
+
+    def save(self, key, state):
+        os.makedirs(self.directory, exist_ok=True)
+        # Write then rename, so an interrupted run never leaves a partial state behind
+        temp_path = self.get_path(key) + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(temp_path, self.get_path(key))
+
+
+class DynamoSnapshotStore:
+    """
+    Keeps each run state as one DynamoDB item (key: snapshot_key).  The state is compressed, to stay well within
+    DynamoDB's item size limit.
+    """
+
+    def __init__(self, table_name):
+        self.table = aws_resources.get_dynamodb().Table(table_name)
+
+    def load(self, key):
+        item = self.table.get_item(Key={'snapshot_key': key}).get('Item')
+        if item is None:
+            return None
+        return json.loads(zlib.decompress(item['state'].value).decode('utf-8'))
+
+    def save(self, key, state):
+        self.table.put_item(Item={'snapshot_key': key, 'state': zlib.compress(json.dumps(state).encode('utf-8'))})
+
+
+def get_snapshot_store():
+    if snapshot_store_dir is not None:
+        return FileSnapshotStore(snapshot_store_dir)
+    return DynamoSnapshotStore(snapshot_table_name)
@@ -0,0 +1,117 @@
+"""
+Vectorized staffing check, for long horizons (a quarter or a year of required shifts).
+
+The coverage offered is counted into a role x hour matrix with NumPy, the staffing rules are evaluated for every hour
+at once as array expressions (see DutyCrewRules.evaluate_grid), and the runs of missing hours of each shift are found
+with diff / nonzero.  The results are the same as check_coverage.check_staffing's.
+
+NumPy is optional: see is_available.
+"""
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import common.coverage_engine as coverage_engine
+import common.date_utils as date_utils
+from common.config_data import CoverageLevels
+
+# Rows of the count matrix: every CoverageLevels, None for coverage levels that do not map to one, and a last row
+# counting the events with no coverage level at all
+GRID_ROLES = list(CoverageLevels) + [None]
+NO_COVERAGE_LEVEL = len(GRID_ROLES)
+
+
+def is_available(staffing_rules=None):
+    """
+    True if NumPy is installed (and the staffing_rules, if given, can be evaluated on a grid)
+    """
+    return np is not None and (staffing_rules is None or staffing_rules.supports_grid)
+
+
+def build_role_grid(spans, origin, num_hours):
+    """
+    spans are (start, end, event) hour index intervals (see coverage_engine.CoverageIndex).
+    Returns the (len(GRID_ROLES) + 1) x num_hours matrix of the number of events of each role covering each hour from
+    origin (an hour index)
+    """
+    rows = np.array([NO_COVERAGE_LEVEL if event.coverage_level is None else GRID_ROLES.index(event.role) for _, _, event in spans], dtype=np.intp)
+    starts = np.clip(np.array([span[0] for span in spans], dtype=np.int64) - origin, 0, num_hours)
+    ends = np.clip(np.array([span[1] for span in spans], dtype=np.int64) - origin, 0, num_hours)
+
+    # +1 where an event starts and -1 where it ends, then a running sum along the hours
+    changes = np.zeros((NO_COVERAGE_LEVEL + 1, num_hours + 1), dtype=np.int32)
+    np.add.at(changes, (rows, starts), 1)
+    np.add.at(changes, (rows, ends), -1)
+    return np.cumsum(changes, axis=1)[:, :num_hours]
+
+
+def find_runs(mask, breaks):
+    """
+    mask is a boolean array, and breaks a boolean array that is True where a new run must start (a shift boundary).
+    Returns the arrays of the (start, end) indexes of the runs of True
+    """
+    previous = np.concatenate(([False], mask[:-1]))
+    following = np.concatenate((mask[1:], [False]))
+    run_starts = np.nonzero(mask & (~previous | breaks))[0]
+    run_ends = np.nonzero(mask & (~following | np.concatenate((breaks[1:], [True]))))[0] + 1
+    return run_starts, run_ends
+
+
+def check_staffing_grid(requireds, coverage_index, staffing_rules, sort_order):
+    """
+    Check the staffing of every required shift (teamup_utils.Event) at once.
+    sort_order is the order in which the missing roles are listed (check_coverage.STAFFING_ERROR_SORT_ORDER)
+
+    Returns a (missing_ranges, warnings) tuple per required shift, in the same shape as check_coverage.check_staffing
+    """
+    if len(requireds) == 0:
+        return []
+
+    shift_spans = np.array([coverage_engine.hour_index_span(required.start, required.end) for required in requireds], dtype=np.int64)
+    origin = int(shift_spans[:, 0].min())
+    num_hours = max(int(shift_spans[:, 1].max()) - origin, 0)
+    grid = build_role_grid(coverage_index.overlapping(origin, origin + num_hours), origin, num_hours)
+
+    # The hours of all the shifts, one after the other (shifts may overlap), as columns of the grid
+    lengths = np.maximum(shift_spans[:, 1] - shift_spans[:, 0], 0)
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    columns = np.repeat(shift_spans[:, 0] - origin - offsets[:-1], lengths) + np.arange(offsets[-1])
+    shift_of = np.repeat(np.arange(len(requireds)), lengths)
+    breaks = np.zeros(offsets[-1], dtype=bool)
+    breaks[offsets[:-1][lengths > 0]] = True
+
+    no_coverage_level = np.nonzero(grid[NO_COVERAGE_LEVEL, columns])[0]
+    if len(no_coverage_level) > 0:
+        print('Data Exception: Missing coverage level for an event offered during {}'.format(requireds[shift_of[no_coverage_level[0]]]))
+        raise KeyError('coverage_level')
+
+    # Every role that maps to a CoverageLevels, and the members whose coverage level does not, count towards the crew
+    roles = {role: grid[row, columns] for row, role in enumerate(GRID_ROLES)}
+    missing_masks, warning_masks = staffing_rules.evaluate_grid(roles)
+
+    results = [([], {}) for _ in requireds]
+
+    for key in sort_order:
+        if key in missing_masks:
+            run_starts, run_ends = find_runs(missing_masks[key], breaks)
+            for run_start, run_end in zip(run_starts.tolist(), run_ends.tolist()):
+                shift = shift_of[run_start]
+                start_date = date_utils.hour_index_to_date(origin + int(columns[run_start]), date_utils.NY_TZ)
+                end_date = date_utils.hour_index_to_date(origin + int(columns[run_end - 1]) + 1, date_utils.NY_TZ)
+                results[shift][0].append({'start_dt': start_date.strftime(date_utils.OUTPUT_FMT_YMDHM), 'end_dt': end_date.strftime(date_utils.OUTPUT_FMT_YMDHM),
+                    'hours': run_end - run_start, 'error': key})
+
+    # The warnings of an hour, encoded as one bit per warning
+    warning_codes = np.zeros(offsets[-1], dtype=np.int64)
+    for bit, (_, mask) in enumerate(warning_masks):
+        warning_codes |= mask.astype(np.int64) << bit
+    warnings_for_code = {}
+    for position in np.nonzero(warning_codes)[0].tolist():
+        code = int(warning_codes[position])
+        if code not in warnings_for_code:
+            warnings_for_code[code] = [warning for bit, (warning, _) in enumerate(warning_masks) if code & (1 << bit)]
+        shift = shift_of[position]
+        results[shift][1][date_utils.hour_index_to_key(origin + int(columns[position]), date_utils.NY_TZ)] = list(warnings_for_code[code])
+
+    return results
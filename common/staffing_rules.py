@@ -0,0 +1,101 @@
+import abc
+from collections import Counter
+from common.config_data import CoverageLevels
+
+
+def crew_composition(events):
+    """
+    The canonical role multiset of a crew: a frozenset of (CoverageLevels, count).  Every crew with the same roles has
+    the same composition, whoever is in it.  Roles that do not map to a CoverageLevels are counted as None.
+    """
+    return frozenset(Counter(event.role for event in events).items())
+
+
+class StaffingRules(abc.ABC):
+    """
+    An agency's rules for deciding whether a crew is correctly staffed.
+
+    Subclasses implement evaluate.  Results are cached by crew composition, so each distinct composition is evaluated
+    once for as long as the instance lives (one run, see get_staffing_rules).
+    """
+    # True if the rules also implement evaluate_grid, for the NumPy backend (see common.staffing_grid)
+    supports_grid = False
+
+    def __init__(self):
+        self.cache = {} # crew composition -> (missing, warnings)
+
+    def check(self, events):
+        """
+        Returns (missing roles, warnings) for the crew made of the given events (teamup_utils.Event)
+        """
+        composition = crew_composition(events)
+        result = self.cache.get(composition)
+        if result is None:
+            missing, warnings = self.evaluate(Counter(dict(composition)))
+            result = (tuple(missing), tuple(warnings))
+            self.cache[composition] = result
+        return list(result[0]), list(result[1])
+
+    @abc.abstractmethod
+    def evaluate(self, roles):
+        """
+        roles is a Counter of CoverageLevels.  Returns (missing roles, warnings)
+        """
+
+
+class DutyCrewRules(StaffingRules):
+    """
+    An ambulance duty crew: a crew chief, plus a driver or an EMT over 18 (or a second crew chief), at most 5 members.
+    """
+    max_crew_size = 5
+    supports_grid = True
+
+    def evaluate(self, roles):
+        warnings = []
+        missing = []
+
+        if sum(roles.values()) > self.max_crew_size:
+            warnings.append('Crew too large - {} maximum'.format(self.max_crew_size))
+
+        # is there a CC?
+        if roles[CoverageLevels.CREW_CHIEF] > 1:
+            warnings.append('Warning: more than one CC')
+        elif roles[CoverageLevels.CREW_CHIEF] == 0:
+            missing.append(CoverageLevels.CREW_CHIEF.value)
+
+        if not (roles[CoverageLevels.DRIVER] > 0 or roles[CoverageLevels.EMT_OVER_18] > 0 or roles[CoverageLevels.CREW_CHIEF] > 1):
+            missing.append('Driver or EMT over 18')
+
+        return (missing, warnings)
+
+    def evaluate_grid(self, roles):
+        """
+        The rules evaluated for many hours at once.  roles maps each CoverageLevels (and None) to the array of its
+        per-hour counts.  Returns ({missing role: boolean array}, [(warning, boolean array)]), with the warnings in
+        the order evaluate lists them
+        """
+        crew_chiefs = roles[CoverageLevels.CREW_CHIEF]
+        missing = {
+            CoverageLevels.CREW_CHIEF.value: crew_chiefs == 0,
+            'Driver or EMT over 18': ~((roles[CoverageLevels.DRIVER] > 0) | (roles[CoverageLevels.EMT_OVER_18] > 0) | (crew_chiefs > 1))
+        }
+        warnings = [
+            ('Crew too large - {} maximum'.format(self.max_crew_size), sum(roles.values()) > self.max_crew_size),
+            ('Warning: more than one CC', crew_chiefs > 1)
+        ]
+        return (missing, warnings)
+
+
+# Name (AgencyConfig.staffing_rules) -> StaffingRules class
+STAFFING_RULES = {
+    'duty_crew': DutyCrewRules
+}
+
+
+def get_staffing_rules(name):
+    """
+    A new instance (with an empty cache) of the named staffing rules
+    """
+    if name not in STAFFING_RULES:
+        raise Exception('Unknown staffing rules: {}'.format(name))
+    return STAFFING_RULES[name]()
@@ -1,41 +1,383 @@
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import collections
+import datetime
 import json
+import os
+import common.date_utils as date_utils
+from common.config_data import CoverageLevels
+from common.request_scheduler import RequestScheduler
 
 url = 'https://api.teamup.com'
 
+# Connection pool / timeout defaults for the shared Teamup session.  Timeouts are in seconds.
+POOL_SIZE = int(os.environ.get('TEAMUP_POOL_SIZE', '10'))
+CONNECT_TIMEOUT = float(os.environ.get('TEAMUP_CONNECT_TIMEOUT', '5'))
+READ_TIMEOUT = float(os.environ.get('TEAMUP_READ_TIMEOUT', '30'))
 
-def create_event(event, calendar_key, api_key):
-    headers = {'Content-type': 'application/json', 'Accept': 'text/plain', 'Teamup-Token': api_key}
+# Request scheduling: requests per second (on average, in bursts of up to TEAMUP_BURST), concurrent requests, and
+# retries of throttled (429) or transient (5xx) failures
+RATE_LIMIT = float(os.environ.get('TEAMUP_RATE_LIMIT', '10'))
+BURST = int(os.environ.get('TEAMUP_BURST', '10'))
+MAX_CONCURRENT = int(os.environ.get('TEAMUP_MAX_CONCURRENT', str(POOL_SIZE)))
+MAX_RETRIES = int(os.environ.get('TEAMUP_MAX_RETRIES', '4'))
 
-    ret = requests.post('/'.join([url, calendar_key, 'events']), data=json.dumps(event), headers=headers)
-    if ret.status_code != 200 and ret.status_code != 201:
-        print('Code: {} Error: {}'.format(ret.status_code, ret.text))
-        return
-    else:
-        return json.loads(ret.text)
+# Event queries over longer ranges are split into windows of this many days, fetched concurrently
+CHUNK_DAYS = int(os.environ.get('TEAMUP_CHUNK_DAYS', '14'))
+
+
+@dataclass
+class BulkResult:
+    """
+    The outcome of one item of a bulk write (see TeamupClient.create_events / delete_events)
+    """
+    item: object # the event payload created, or the id of the event deleted
+    response: dict = None # Teamup's response ({'event': {...}} for a created event)
+    error: str = None # None if the write succeeded
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class BulkSummary:
+    """
+    Counts the results of a bulk write as they go by (see track), and keeps the failures to report them at the end
+    """
+
+    def __init__(self, description):
+        self.description = description
+        self.succeeded = 0
+        self.failures = []
+
+    def track(self, results):
+        for result in results:
+            if result.ok:
+                self.succeeded += 1
+            else:
+                self.failures.append(result)
+            yield result
+
+    def print_summary(self):
+        print('{}: {} succeeded, {} failed'.format(self.description, self.succeeded, len(self.failures)))
+        for failure in self.failures:
+            print('\tFailed: {} {}'.format(failure.item, failure.error))
+
+
+class Event:
+    """
+    The parts of a Teamup event that the scripts use, built once when the event is fetched.
+
+    start_dt / end_dt are the (rounded) ISO strings from Teamup, start / end the same times parsed.
+    coverage_level is the agency's Teamup value of the coverage level (custom.coverage_level), and role the
+    CoverageLevels it maps to through the agency's level_mappings (None if it does not map to one).
+    """
+    __slots__ = ('id', 'subcalendar_id', 'subcalendar_ids', 'start_dt', 'end_dt', 'start', 'end', 'who',
+        'coverage_level', 'role', 'title', 'notes', 'delete_dt')
+
+    def __init__(self, id, subcalendar_id, subcalendar_ids, start_dt, end_dt, who=None, coverage_level=None, role=None,
+        title=None, notes=None, delete_dt=None):
+        self.id = id
+        self.subcalendar_id = subcalendar_id
+        self.subcalendar_ids = subcalendar_ids
+        self.start_dt = start_dt
+        self.end_dt = end_dt
+        self.start = date_utils.parse_iso(start_dt)
+        self.end = date_utils.parse_iso(end_dt)
+        self.who = who
+        self.coverage_level = coverage_level
+        self.role = role
+        self.title = title
+        self.notes = notes
+        self.delete_dt = delete_dt
+
+    @classmethod
+    def from_teamup(cls, event, level_mappings=None):
+        """
+        event is a Teamup event (or the to_dict of an Event).  level_mappings is the agency's CoverageLevels value ->
+        Teamup value map (TeamupConfig.level_mappings)
+        """
+        coverage_level = event.get('custom', {}).get('coverage_level')
+        if isinstance(coverage_level, list):
+            coverage_level = coverage_level[0] if len(coverage_level) > 0 else None
+
+        return cls(event['id'], event.get('subcalendar_id'), event.get('subcalendar_ids', [event.get('subcalendar_id')]),
+            event['start_dt'], event['end_dt'], who=event.get('who'), coverage_level=coverage_level,
+            role=get_role(coverage_level, level_mappings), title=event.get('title'), notes=event.get('notes'),
+            delete_dt=event.get('delete_dt'))
 
+    def to_dict(self):
+        """
+        A JSON serializable copy, in the shape of a Teamup event (see from_teamup)
+        """
+        return {
+            'id': self.id,
+            'subcalendar_id': self.subcalendar_id,
+            'subcalendar_ids': self.subcalendar_ids,
+            'start_dt': self.start_dt,
+            'end_dt': self.end_dt,
+            'who': self.who,
+            'custom': {} if self.coverage_level is None else {'coverage_level': [self.coverage_level]},
+            'title': self.title,
+            'notes': self.notes,
+            'delete_dt': self.delete_dt
+        }
 
-def get_events(start_dt, end_dt, calendar_key, subcalendar_id, api_key):
-    headers = {'Content-type': 'application/json', 'Accept': 'text/plain', 'Teamup-Token': api_key}
-    ret = requests.get('/'.join([url, calendar_key, 'events']) + '?startDate={}&endDate={}&subcalendarId[]={}&tz=America/New_York'.format(start_dt, end_dt, subcalendar_id), headers=headers)
-    response = json.loads(ret.text)
-    if 'error' in response:
-        print('Code: {} Error: {}'.format(ret.status_code, ret.text))
-        raise Exception('Error getting events')
-    round_start_end_dates(response)
+    def __eq__(self, other):
+        return isinstance(other, Event) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return 'Event({})'.format(self.to_dict())
+
+
+def get_role(coverage_level, level_mappings):
+    """
+    The CoverageLevels that the Teamup coverage_level value maps to, or None
+    """
+    if coverage_level is None or level_mappings is None:
+        return None
+    for level, teamup_value in level_mappings.items():
+        if teamup_value == coverage_level:
+            try:
+                return CoverageLevels(level)
+            except ValueError:
+                return None
+    return None
+
+
+def to_events(response, level_mappings=None):
+    """
+    Replace the Teamup events of the response with Events
+    """
+    response['events'] = [Event.from_teamup(event, level_mappings) for event in response['events']]
     return response
 
+
+class TeamupClient:
+    """
+    Client for the Teamup API that owns a pooled, keep-alive requests.Session.
+
+    Connections to api.teamup.com are reused across calls within a run, and (because the default client
+    lives at module level) across warm Lambda invocations.  Every request goes through the client's RequestScheduler
+    (rate limit, bounded concurrency, retries); its metrics are in scheduler.metrics.
+    """
+
+    def __init__(self, pool_size=POOL_SIZE, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT, scheduler=None):
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.scheduler = scheduler or RequestScheduler(RATE_LIMIT, BURST, MAX_CONCURRENT, MAX_RETRIES)
+        self.session = requests.Session()
+        self.session.headers.update({'Content-type': 'application/json', 'Accept': 'text/plain'})
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def _request(self, method, path, api_key, **kwargs):
+        return self.scheduler.send(method, path,
+            lambda: self.session.request(method, path, headers={'Teamup-Token': api_key}, timeout=self.timeout, **kwargs))
+
+    def _events_url(self, start_dt, end_dt, calendar_key, subcalendar_id):
+        return '/'.join([url, calendar_key, 'events']) + '?startDate={}&endDate={}&subcalendarId[]={}&tz=America/New_York'.format(start_dt, end_dt, subcalendar_id)
+
+    def _post_event(self, event, calendar_key, api_key):
+        return self._request('POST', '/'.join([url, calendar_key, 'events']), api_key, data=json.dumps(event))
+
+    def _delete_event(self, event_id, calendar_key, api_key):
+        return self._request('DELETE', '/'.join([url, calendar_key, 'events', str(event_id)]), api_key)
+
+    def create_event(self, event, calendar_key, api_key):
+        ret = self._post_event(event, calendar_key, api_key)
+        if ret.status_code != 200 and ret.status_code != 201:
+            print('Code: {} Error: {}'.format(ret.status_code, ret.text))
+            return
+        else:
+            return json.loads(ret.text)
+
+    def get_events(self, start_dt, end_dt, calendar_key, subcalendar_id, api_key, level_mappings=None):
+        """
+        The events (as Events, with their start and end rounded) in the subcalendar between start_dt and end_dt.
+        Long ranges are fetched in windows, see iter_events
+        """
+        return {'events': list(self.iter_events(start_dt, end_dt, calendar_key, subcalendar_id, api_key, level_mappings))}
+
+    def iter_events(self, start_dt, end_dt, calendar_key, subcalendar_id, api_key, level_mappings=None, round_dates=True,
+        chunk_days=None, max_workers=None):
+        """
+        Yields the events (as Events) in the subcalendar between the days start_dt and end_dt, in order.
+
+        A range longer than chunk_days (default CHUNK_DAYS) is split into windows that are fetched concurrently, at most
+        max_workers at a time.  The events of a window are yielded as soon as it (and every window before it) has
+        arrived, and an event that spans windows is yielded once.
+        round_dates: round the start and end of the events to the half hour (see round_start_end_dates)
+        """
+        def fetch(window):
+            response = self.get_raw_events(window[0], window[1], calendar_key, subcalendar_id, api_key)
+            if round_dates:
+                round_start_end_dates(response)
+            return to_events(response, level_mappings)['events']
+
+        windows = get_date_windows(start_dt, end_dt, chunk_days or CHUNK_DAYS)
+        if len(windows) <= 1:
+            for window in windows:
+                yield from fetch(window)
+            return
+
+        executor = ThreadPoolExecutor(max_workers=max_workers or min(len(windows), self.pool_size))
+        futures = [executor.submit(fetch, window) for window in windows]
+        seen = set()
+        try:
+            for future in futures:
+                for event in future.result():
+                    if event.id not in seen:
+                        seen.add(event.id)
+                        yield event
+        finally:
+            # The caller may stop early: do not fetch the windows it will not read
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def get_raw_events(self, start_dt, end_dt, calendar_key, subcalendar_id, api_key):
+        ret = self._request('GET', self._events_url(start_dt, end_dt, calendar_key, subcalendar_id), api_key)
+        response = json.loads(ret.text)
+        if 'error' in response:
+            print('Code: {} Error: {}'.format(ret.status_code, ret.text))
+            raise Exception('Error getting events')
+        return response
+
+    def get_changed_events(self, modified_since, calendar_key, api_key, level_mappings=None):
+        """
+        Events (as Events) created, changed or deleted (delete_dt is set) since modified_since, a unix timestamp.
+        The response's 'timestamp' is the modified_since to use for the next call.
+        """
+        ret = self._request('GET', '/'.join([url, calendar_key, 'events']) + '?modifiedSince={}&tz=America/New_York'.format(modified_since), api_key)
+        response = json.loads(ret.text)
+        if 'error' in response:
+            print('Code: {} Error: {}'.format(ret.status_code, ret.text))
+            raise Exception('Error getting changed events')
+        round_start_end_dates(response)
+        return to_events(response, level_mappings)
+
+    def get_events_concurrently(self, queries, max_workers=None):
+        """
+        Run several independent get_events queries at the same time.
+        queries is a list of (start_dt, end_dt, calendar_key, subcalendar_id, api_key, level_mappings) tuples.
+        Returns the responses in the same order as the queries.
+        """
+        if len(queries) == 0:
+            return []
+        max_workers = max_workers or min(len(queries), self.pool_size)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(lambda query: self.get_events(*query), queries))
+
+    def delete_event(self, event_id, calendar_key, api_key):
+        ret = self._delete_event(event_id, calendar_key, api_key)
+        if ret.status_code != 200 and ret.status_code != 201:
+            print('Code: {} Error: {}'.format(ret.status_code, ret.text))
+        else:
+            print('deleted event: ' + str(event_id))
+
+    def create_events(self, events, calendar_key, api_key, max_workers=None):
+        """
+        Create the events (Teamup event payloads) of an iterable, at most max_workers (default the pool size) at a time.
+        Yields a BulkResult per event, in the order of the events; a failure does not stop the others
+        """
+        return self._write_all(lambda event: self._post_event(event, calendar_key, api_key), events, max_workers)
+
+    def delete_events(self, event_ids, calendar_key, api_key, max_workers=None):
+        """
+        Delete the events of an iterable of ids, like create_events
+        """
+        return self._write_all(lambda event_id: self._delete_event(event_id, calendar_key, api_key), event_ids, max_workers)
+
+    def _write_all(self, write, items, max_workers=None):
+        def run(item):
+            try:
+                ret = write(item)
+            except requests.exceptions.RequestException as e:
+                return BulkResult(item, error='Error: {}'.format(e))
+            if ret.status_code < 200 or ret.status_code >= 300:
+                return BulkResult(item, error='Code: {} Error: {}'.format(ret.status_code, ret.text))
+            return BulkResult(item, response=json.loads(ret.text) if ret.text else None)
+
+        max_workers = max_workers or self.pool_size
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # Only a few items ahead of the one being yielded are in flight, so items can come from a generator
+            pending = collections.deque()
+            for item in items:
+                pending.append(executor.submit(run, item))
+                if len(pending) >= 2 * max_workers:
+                    yield pending.popleft().result()
+            while len(pending) > 0:
+                yield pending.popleft().result()
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+
+
+def get_client() -> TeamupClient:
+    """
+    Returns the shared TeamupClient, creating it on first use.
+    """
+    global _client
+    if _client is None:
+        _client = TeamupClient()
+    return _client
+
+
+def configure_client(pool_size=POOL_SIZE, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT) -> TeamupClient:
+    """
+    Replace the shared TeamupClient with one using the given pool size and timeouts.
+    """
+    global _client
+    if _client is not None:
+        _client.close()
+    _client = TeamupClient(pool_size, connect_timeout, read_timeout)
+    return _client
+
+
+def create_event(event, calendar_key, api_key):
+    return get_client().create_event(event, calendar_key, api_key)
+
+
+def get_events(start_dt, end_dt, calendar_key, subcalendar_id, api_key, level_mappings=None):
+    return get_client().get_events(start_dt, end_dt, calendar_key, subcalendar_id, api_key, level_mappings)
+
 def get_raw_events(start_dt, end_dt, calendar_key, subcalendar_id, api_key):
-    headers = {'Content-type': 'application/json', 'Accept': 'text/plain', 'Teamup-Token': api_key}
-    ret = requests.get('/'.join([url, calendar_key, 'events']) + '?startDate={}&endDate={}&subcalendarId[]={}&tz=America/New_York'.format(start_dt, end_dt, subcalendar_id), headers=headers)
-    response = json.loads(ret.text)
-    if 'error' in response:
-        print('Code: {} Error: {}'.format(ret.status_code, ret.text))
-        raise Exception('Error getting events')
-    return response
+    return get_client().get_raw_events(start_dt, end_dt, calendar_key, subcalendar_id, api_key)
+
+def iter_events(start_dt, end_dt, calendar_key, subcalendar_id, api_key, level_mappings=None, round_dates=True, chunk_days=None, max_workers=None):
+    return get_client().iter_events(start_dt, end_dt, calendar_key, subcalendar_id, api_key, level_mappings, round_dates, chunk_days, max_workers)
+
+def get_events_concurrently(queries, max_workers=None):
+    return get_client().get_events_concurrently(queries, max_workers)
+
+def get_changed_events(modified_since, calendar_key, api_key, level_mappings=None):
+    return get_client().get_changed_events(modified_since, calendar_key, api_key, level_mappings)
 
 
 
+def get_date_windows(start_dt, end_dt, chunk_days):
+    """
+    Split the days start_dt through end_dt (dates, datetimes or 'YYYY-MM-DD' strings) into consecutive windows of at
+    most chunk_days days.  Returns a list of ('YYYY-MM-DD', 'YYYY-MM-DD') tuples, both days included
+    """
+    start_day = date_utils.to_date(start_dt)
+    end_day = date_utils.to_date(end_dt)
+
+    windows = []
+    while start_day <= end_day:
+        window_end = min(start_day + datetime.timedelta(days=chunk_days - 1), end_day)
+        windows.append((start_day.strftime(date_utils.API_DATE_FORMAT_YMD), window_end.strftime(date_utils.API_DATE_FORMAT_YMD)))
+        start_day = window_end + datetime.timedelta(days=1)
+    return windows
+
+
 def round_start_end_dates(response):
     """
     Given a list of events in the response object, round the hours to the nearest half hour
@@ -70,16 +412,20 @@ def round_time(time):
 
 
 def delete_event(event_id, calendar_key, api_key):
-    # print('Deleting event: ' + str(event_id))
-    headers = {'Content-type': 'application/json', 'Accept': 'text/plain', 'Teamup-Token': api_key}
-    ret = requests.delete('/'.join([url, calendar_key, 'events', str(event_id)]), headers=headers)
-    if ret.status_code != 200 and ret.status_code != 201:
-        print('Code: {} Error: {}'.format(ret.status_code, ret.text))
-    else:
-        print('deleted event: ' + str(event_id))
+    get_client().delete_event(event_id, calendar_key, api_key)
 
 
-def delete_all_events(events, calendar_key, api_key):
-    for event in events['events']:
-        delete_event(event['id'], calendar_key, api_key)
+def create_events(events, calendar_key, api_key, max_workers=None):
+    return get_client().create_events(events, calendar_key, api_key, max_workers)
+
+
+def delete_events(event_ids, calendar_key, api_key, max_workers=None):
+    return get_client().delete_events(event_ids, calendar_key, api_key, max_workers)
 
+
+def delete_all_events(events, calendar_key, api_key):
+    summary = BulkSummary('Deleted events')
+    for _ in summary.track(delete_events([event.id for event in events['events']], calendar_key, api_key)):
+        pass
+    summary.print_summary()
+    return summary
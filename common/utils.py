@@ -1,4 +1,3 @@
-import dateutil
 import calendar
 import common.date_utils as date_utils
 import os
@@ -13,7 +12,7 @@ class NotificationCategory(Enum):
 
 
 def create_shift_name(shift):
-    start_date = dateutil.parser.isoparse(shift['start_dt'])
+    start_date = shift.start
 
     period = (start_date.hour % 24 + 4) // 4
     period_map = {1: 'Late Night',
@@ -27,10 +27,12 @@ import calendar
 from datetime import datetime
 from datetime import timedelta
 import argparse
+import itertools
 import os
 import dateutil
 
-from anyio import create_event
+import common.checkpoint_journal as checkpoint_journal
+import common.reconciliation as reconciliation
 import common.teamup_utils as teamup_utils
 import common.date_utils as date_utils
 import common.utils as utils
@@ -61,6 +63,8 @@ Go to Google Docs (Collaborative Spreadsheet) - click on the tab for the month a
 # ============================
 ### To create events (Coverage required from Collaborative Spreadsheet): 
 python3 create_events.py --calendar coverage_required --spreadsheet --year 2022 --month 6 --source_file '/Users/gnowakow/Downloads/Central Somerset EMS Collaborative Schedule 2022 - June.csv' --trigger_file ./triggers/martinsville_trigger.json
+Add --preview to only list the events that would be created or deleted, and --delete_missing to delete the events of the
+calendar that are not on the spreadsheet (otherwise they are only listed).
 
 # ============================
 # R E G U L A R S
@@ -101,6 +105,10 @@ python3 create_events.py --calendar coverage_offered --source_file /Users/gnowak
 Expected input for coverage_offered: [start_dt, end_dt, role, who]
 Example: 2022-02-14T18:00:00,2022-02-15T00:00:00,crew_chief,Jim Ross
 
+### Resuming an import:
+The rows imported are journaled in <source_file>_journal.csv.  If an import stops or some rows fail, run the same command
+again: only the rows not in the journal are created.  Delete the journal to import the whole file again (e.g. after --delete_all).
+
 -------------------------------------------------------------------------------------------------------------------------
 ### To delete records created: 
 python3 create_events.py --delete_all --calendar coverage_offered --source_file /Users/gnowakow/Downloads/CreatedCovers_0428.txt
@@ -112,28 +120,50 @@ python3 create_events.py --calendar coverage_required --source_file /Users/gnowa
 -------------------------------------------------------------------------------------------------------------------------
 """
 
+def derived_file(source_file, suffix):
+    """
+    The path of a file written next to source_file: shifts.csv -> shifts<suffix>.csv.  The source's extension is kept
+    (.csv if it has none)
+    """
+    root, ext = os.path.splitext(source_file)
+    return root + suffix + (ext or '.csv')
+
 def add_events(source_file, sub_calendar_key):
+    """
+    Create an event per row of source_file, and save the event ids in <source>_event_ids.csv (in the order of the rows).
+
+    Rows are journaled in <source>_journal.csv as their events are created: if the import stops (or some rows fail),
+    running it again only creates the events of the rows not in the journal yet
+    """
     print('Going to create events in calendar: {} Sub calendar: {} using API key: {}'.format(run_config.calendar_admin_key, sub_calendar_key, run_config.api_key))
-    num_events = 0
-    event_id_file = source_file.replace('.csv', '_event_ids.csv')
-    with open(event_id_file, 'w') as events_file:
-        with open(source_file, 'r') as f:
-            rdr = csv.reader(f)
-            for row in rdr:
-                if len(row) == 0:
-                    continue
-                event = row_to_event(sub_calendar_key, row)
-                print(event)
-
-                new_event = teamup_utils.create_event(event, run_config.calendar_admin_key, run_config.api_key)
-                if new_event is None:
-                    print('Failed to create event: {}'.format(event))
-                    sys.exit(1)
-
-                # print('Created event: {}'.format(new_event))
-                events_file.write(str(new_event['event']['id']) + '\n')
-                num_events += 1
-    return num_events
+    event_id_file = derived_file(source_file, '_event_ids')
+    journal_file = derived_file(source_file, '_journal')
+    if os.path.abspath(source_file) in (os.path.abspath(event_id_file), os.path.abspath(journal_file)):
+        raise Exception('The event id and journal files must not be the source file: {}'.format(source_file))
+    summary = teamup_utils.BulkSummary('Created events')
+
+    with open(source_file, 'r') as f:
+        keyed_rows = list(checkpoint_journal.row_keys(row for row in csv.reader(f) if len(row) > 0))
+
+    with checkpoint_journal.CheckpointJournal(journal_file) as journal:
+        new_rows = [(key, row) for key, row in keyed_rows if key not in journal]
+        if len(new_rows) < len(keyed_rows):
+            print('Resuming: {} of {} rows were already imported (see {})'.format(len(keyed_rows) - len(new_rows), len(keyed_rows), journal_file))
+
+        events = (row_to_event(sub_calendar_key, row) for _, row in new_rows)
+        # Results come back in the order of the rows
+        results = summary.track(teamup_utils.create_events(events, run_config.calendar_admin_key, run_config.api_key))
+        for (key, _), result in zip(new_rows, results):
+            if result.ok:
+                journal.record(key, result.response['event']['id'])
+
+        with open(event_id_file, 'w') as events_file:
+            for key, _ in keyed_rows:
+                if key in journal:
+                    events_file.write(journal.get(key) + '\n')
+
+    summary.print_summary()
+    return summary.succeeded
 
 def row_to_event(sub_calendar_id, row):
     # print('calling row_to_event with: {}'.format(sub_calendar_id))
@@ -191,12 +221,16 @@ def translate_calendar_key(calendar_key):
         raise Exception('Invalid calendar key: {}'.format(calendar_key))
 
 def subcalendar_from_event(event):
-    if event['subcalendar_id'] == run_config.teamup_config.coverage_required_calendar:
+    return calendar_from_subcalendar_id(event['subcalendar_id'])
+
+def calendar_from_subcalendar_id(subcalendar_id):
+    # Teamup returns subcalendar ids as numbers, the configuration has them as strings
+    if str(subcalendar_id) == str(run_config.teamup_config.coverage_required_calendar):
         return EventCalendarsKeys.REQUIRED
-    elif event['subcalendar_id'] == run_config.teamup_config.coverage_offered_calendar:
+    elif str(subcalendar_id) == str(run_config.teamup_config.coverage_offered_calendar):
         return EventCalendarsKeys.OFFERED
     else:
-        raise Exception('Invalid sub calendar id: {}'.format(event['subcalendar_id']))
+        raise Exception('Invalid sub calendar id: {}'.format(subcalendar_id))
 
 def get_admin_key_for_calendar(calendar_key):
     if calendar_key == EventCalendarsKeys.REQUIRED:
@@ -218,8 +252,8 @@ def create_test_cases(coverage_required_file, coverage_offered_file):
         for row in reader:
             if len(row) > 0:
                 event = row_to_event2(EventCalendarsKeys.REQUIRED, row)
-                scenarios_start_date = min(scenarios_start_date, dateutil.parser.isoparse(event['start_dt']))
-                scenarios_end_date = max(scenarios_end_date, dateutil.parser.isoparse(event['end_dt']))
+                scenarios_start_date = min(scenarios_start_date, date_utils.parse_iso(event['start_dt']))
+                scenarios_end_date = max(scenarios_end_date, date_utils.parse_iso(event['end_dt']))
                 coverage_required_events.append(event)
 
     coverage_offered_events = []
@@ -228,8 +262,8 @@ def create_test_cases(coverage_required_file, coverage_offered_file):
         for row in reader:
             if len(row) > 0:
                 event = row_to_event2(EventCalendarsKeys.OFFERED, row)
-                scenarios_start_date = min(scenarios_start_date, dateutil.parser.isoparse(event['start_dt']))
-                scenarios_end_date = max(scenarios_end_date, dateutil.parser.isoparse(event['end_dt']))
+                scenarios_start_date = min(scenarios_start_date, date_utils.parse_iso(event['start_dt']))
+                scenarios_end_date = max(scenarios_end_date, date_utils.parse_iso(event['end_dt']))
                 coverage_offered_events.append(event)
 
     print('Scenarios start date: {} endDate: {}'.format(scenarios_start_date, scenarios_end_date))
@@ -252,26 +286,22 @@ def create_test_cases(coverage_required_file, coverage_offered_file):
         sys.exit(1)
 
     print('== Deleting existing events ==')
-    for event in existing_required_events['events']:
-        teamup_utils.delete_event(event['id'], run_config.teamup_config.required_calendar_key_admin, run_config.teamup_config.teamup_api_key)
-    for event in existing_offered_events['events']:
-        teamup_utils.delete_event(event['id'], run_config.teamup_config.offered_calendar_key_admin, run_config.teamup_config.teamup_api_key)
+    teamup_utils.delete_all_events(existing_required_events, run_config.teamup_config.required_calendar_key_admin, run_config.teamup_config.teamup_api_key)
+    teamup_utils.delete_all_events(existing_offered_events, run_config.teamup_config.offered_calendar_key_admin, run_config.teamup_config.teamup_api_key)
 
     print('== Creating new events ==')
-    for event in coverage_required_events:
-        new_event = teamup_utils.create_event(event, run_config.teamup_config.required_calendar_key_admin, run_config.teamup_config.teamup_api_key)
-        print('Created required event: {} with ID: {}'.format(new_event['event']['start_dt'], new_event['event']['id']))
-
-    for event in coverage_offered_events:
-        new_event = teamup_utils.create_event(event, run_config.teamup_config.offered_calendar_key_admin, run_config.teamup_config.teamup_api_key)
-        print('Created offered event: {} with ID: {}'.format(new_event['event']['start_dt'], new_event['event']['id']))
+    create_new_events(coverage_required_events, {'events': []})
+    create_new_events(coverage_offered_events, {'events': []})
 
 
 def delete_all_events(id_file):
+    summary = teamup_utils.BulkSummary('Deleted events')
     with open(id_file, 'r') as f:
-        for event_id in f:
-            # print('Deleting event: {} subcal: {} api-key: {}'.format(event_id, sub_calendar_key, api_key))
-            teamup_utils.delete_event(event_id.strip(), run_config.calendar_admin_key, run_config.api_key)
+        event_ids = (event_id.strip() for event_id in f if len(event_id.strip()) > 0)
+        for result in summary.track(teamup_utils.delete_events(event_ids, run_config.calendar_admin_key, run_config.api_key)):
+            if result.ok:
+                print('deleted event: {}'.format(result.item))
+    summary.print_summary()
 
 
 def query_save_events(calendar_key, start_date, end_date):
@@ -291,12 +321,12 @@ def query_save_events(calendar_key, start_date, end_date):
         os.remove(filename)
 
     utils.clear_relative_path(test_event_ids_folder)
-    events = teamup_utils.get_events(start_date, end_date, run_config.calendar_ro_key, translate_calendar_key(calendar_key), run_config.api_key)
+    events = teamup_utils.iter_events(start_date, end_date, run_config.calendar_ro_key, translate_calendar_key(calendar_key), run_config.api_key)
 
     with open(filename, 'w') as f:
-        for event in events['events']:
-            print('id: {} start: {} end: {} who: {} title: {}'.format(event['id'], event['start_dt'], event['end_dt'], event['who'], event['title']))
-            f.write(event['id'] + '\n')
+        for event in events:
+            print('id: {} start: {} end: {} who: {} title: {}'.format(event.id, event.start_dt, event.end_dt, event.who, event.title))
+            f.write(event.id + '\n')
 
     print('created file: {}'.format(filename))
 
@@ -305,36 +335,67 @@ def check_is_weekend(month, day_num, year):
     return d.weekday() > 4
 
 
-def create_event(event, existing_events):
-    for existing_event in existing_events['events']:
-        if date_utils.chop_dst(existing_event['start_dt']) == event['start_dt'] and date_utils.chop_dst(existing_event['end_dt']) == event['end_dt']:
-            print('Event already exists: {}'.format(existing_event['id']))
-            return
-    new_event = teamup_utils.create_event(event, get_admin_key_for_calendar(subcalendar_from_event(event)), run_config.teamup_config.teamup_api_key)
-    if new_event is None:
-        print('Failed to create event: {}'.format(event))
-        sys.exit(1)
-    print('Created event: {} with ID: {}'.format(new_event['event']['start_dt'], new_event['event']['id']))
+def create_new_events(events, existing_events):
+    """
+    Create the events (in the calendar of their subcalendar) that are not in existing_events yet, concurrently.
+    A failure does not stop the other events: the failures are listed at the end
+    """
+    plan = reconciliation.reconcile(events, existing_events['events'])
+    for _, existing_event in plan.unchanged:
+        print('Event already exists: {}'.format(existing_event.id))
+    return create_all_events(plan.to_create)
+
+
+def create_all_events(events):
+    summary = teamup_utils.BulkSummary('Created events')
+    for calendar, calendar_events in itertools.groupby(events, key=subcalendar_from_event):
+        results = teamup_utils.create_events(calendar_events, get_admin_key_for_calendar(calendar), run_config.teamup_config.teamup_api_key)
+        for result in summary.track(results):
+            if result.ok:
+                print('Created event: {} with ID: {}'.format(result.response['event']['start_dt'], result.response['event']['id']))
+    summary.print_summary()
+    return summary
+
+
+def delete_events_in_calendar(events):
+    summary = teamup_utils.BulkSummary('Deleted events')
+    for calendar, calendar_events in itertools.groupby(events, key=lambda event: calendar_from_subcalendar_id(event.subcalendar_id)):
+        event_ids = [event.id for event in calendar_events]
+        for _ in summary.track(teamup_utils.delete_events(event_ids, get_admin_key_for_calendar(calendar), run_config.teamup_config.teamup_api_key)):
+            pass
+    summary.print_summary()
+    return summary
+
+
+def sync_events(events, existing_events, is_preview=False, delete_missing=False):
+    """
+    Make the calendar match events (event payloads, e.g. from a spreadsheet): create the events that are missing and,
+    with delete_missing, delete the existing events that are not in events (otherwise they are only listed).
+    is_preview: only print the plan
+    """
+    plan = reconciliation.reconcile(events, existing_events['events'])
+    if is_preview:
+        plan.print_preview()
+        return plan
 
+    print('{} events already exist'.format(len(plan.unchanged)))
+    create_all_events(plan.to_create)
 
-def find_events_to_remove(existing_events, spreadsheet_events):
-    events_to_delete = []
-    for existing_event in existing_events['events']:
-        found = False
-        for spreadsheet_event in spreadsheet_events:
-            if date_utils.chop_dst(existing_event['start_dt']) == spreadsheet_event['start_dt'] and date_utils.chop_dst(existing_event['end_dt']) == spreadsheet_event['end_dt']:
-                found = True
-                break
-        if not found:
-            events_to_delete.append(existing_event)
-    return events_to_delete
+    if len(plan.to_delete) > 0:
+        if delete_missing:
+            delete_events_in_calendar(plan.to_delete)
+        else:
+            print('Should remove the below events as they are not on the spreadsheet:')
+            for event_to_remove in plan.to_delete:
+                print('Date: {} id: {}'.format(event_to_remove.start_dt, event_to_remove.id))
+    return plan
 
 def get_period(month, year):
     period_start_date = datetime(year, month, 1)
     period_end_date = datetime(year, month, calendar.monthrange(year, month)[1])
     return (period_start_date, period_end_date)
 
-def process_spreadsheet(filename, calendar_key, month, year):
+def process_spreadsheet(filename, calendar_key, month, year, is_preview=False, delete_missing=False):
     period = get_period(month, year)
     existing_events = teamup_utils.get_events(period[0], period[1], run_config.calendar_ro_key, translate_calendar_key(calendar_key), run_config.api_key)
 
@@ -380,15 +441,7 @@ def process_spreadsheet(filename, calendar_key, month, year):
                     # create_event(morning_event, existing_events)
                     total_hours += 12
 
-    events_to_remove = find_events_to_remove(existing_events, events_to_create)
-
-    for event in events_to_create:
-        create_event(event, existing_events)
-
-    if len(events_to_remove) > 0:
-        print('Should remove the below events as they are not on the spreadsheet:')
-        for event_to_remove in events_to_remove:
-            print('Date: {} id: {}'.format(event_to_remove['start_dt'], event_to_remove['id']))
+    sync_events(events_to_create, existing_events, is_preview, delete_missing)
     
     print('===== Statistics =====')
     print('Days staffed:')
@@ -397,7 +450,7 @@ def process_spreadsheet(filename, calendar_key, month, year):
         day += 1    
     print('Total hours: {}'.format(total_hours))
 
-def process_spreadsheet_v2(filename, calendar_key, month, year):
+def process_spreadsheet_v2(filename, calendar_key, month, year, is_preview=False, delete_missing=False):
     """
     This parses the csv from the latest version of the spreadsheet.
     Notable differences:
@@ -475,14 +528,7 @@ def process_spreadsheet_v2(filename, calendar_key, month, year):
 
             prev_row = row
 
-    events_to_remove = find_events_to_remove(existing_events, events_to_create)
-    for event in events_to_create:
-        create_event(event, existing_events)
-
-    if len(events_to_remove) > 0:
-        print('Should remove the below events as they are not on the spreadsheet:')
-        for event_to_remove in events_to_remove:
-            print('Date: {} id: {}'.format(event_to_remove['start_dt'], event_to_remove['id']))
+    sync_events(events_to_create, existing_events, is_preview, delete_missing)
 
 
 def create_cover_event(member_name, start_dt, end_dt, coverage_level):
@@ -518,29 +564,44 @@ def get_coverage_span(required_start_date, required_end_date, offer_day_of_week,
         return max(offer_span[0], required_start_date), min(offer_span[1], required_end_date)
 
 
-def is_duplicate_offer(member_name, coverage_hours, existing_offers):
-    for existing_offer in existing_offers['events']:
-        offer_start = coverage_hours[0].isoformat()
-        offer_end = coverage_hours[1].isoformat()
-        if existing_offer['who'] == member_name and existing_offer['start_dt'] == offer_start and existing_offer['end_dt'] == offer_end:
-            return True
-    return False
+def index_offers(existing_offers):
+    """
+    The set of (who, start_dt, end_dt) of the existing offers, see is_duplicate_offer
+    """
+    return set((existing_offer.who, existing_offer.start_dt, existing_offer.end_dt) for existing_offer in existing_offers['events'])
+
+def is_duplicate_offer(member_name, coverage_hours, offer_index):
+    return (member_name, coverage_hours[0].isoformat(), coverage_hours[1].isoformat()) in offer_index
+
+def index_regulars(regulars):
+    """
+    day_of_week -> [(position in regulars, regular)]
+    """
+    regulars_by_day = {}
+    for position, regular in enumerate(regulars):
+        regulars_by_day.setdefault(int(regular['day_of_week']), []).append((position, regular))
+    return regulars_by_day
 
-def find_coverage(required_event, existing_offers, regulars):
+def find_coverage(required_event, offer_index, regulars_by_day):
     """
     For the given required_event, find all of the "regulars" that should be scheduled to cover it
+    offer_index: see index_offers, regulars_by_day: see index_regulars
     Note: If the regular is already scheduled to cover the required_event, it will be skipped
     """
     covers_events = []
-    required_start_date = dateutil.parser.isoparse(required_event['start_dt'])
-    required_end_date = dateutil.parser.isoparse(required_event['end_dt'])
+    required_start_date = required_event.start
+    required_end_date = required_event.end
+
+    candidates = regulars_by_day.get(required_start_date.weekday(), [])
+    if required_end_date.weekday() != required_start_date.weekday():
+        # In the order of the regulars file
+        candidates = sorted(candidates + regulars_by_day.get(required_end_date.weekday(), []), key=lambda candidate: candidate[0])
 
-    for regular in regulars:
+    for _, regular in candidates:
         offer_day_of_week = int(regular['day_of_week'])
-        if offer_day_of_week == required_start_date.weekday() or offer_day_of_week == required_end_date.weekday():
-            coverage_hours = get_coverage_span(required_start_date, required_end_date,  offer_day_of_week, regular['start_time'], regular['end_time'])
-            if coverage_hours and not is_duplicate_offer(regular['member'], coverage_hours, existing_offers):
-                covers_events.append(create_cover_event(regular['member'], coverage_hours[0], coverage_hours[1], regular['coverage_level']))
+        coverage_hours = get_coverage_span(required_start_date, required_end_date,  offer_day_of_week, regular['start_time'], regular['end_time'])
+        if coverage_hours and not is_duplicate_offer(regular['member'], coverage_hours, offer_index):
+            covers_events.append(create_cover_event(regular['member'], coverage_hours[0], coverage_hours[1], regular['coverage_level']))
     return covers_events
 
 def read_regulars():
@@ -556,12 +617,14 @@ def read_regulars():
 
 def get_offers(regulars, month, year):
     period = get_period(month, year)
-    required_coverage = teamup_utils.get_events(period[0], period[1], run_config.teamup_config.all_calendar_key_ro, run_config.teamup_config.coverage_required_calendar, run_config.teamup_config.teamup_api_key)
-    existing_offers = teamup_utils.get_raw_events(period[0], period[1], run_config.teamup_config.all_calendar_key_ro, run_config.teamup_config.coverage_offered_calendar, run_config.teamup_config.teamup_api_key)
+    # Not rounded, so that offers are compared with the times they were created with
+    offer_index = index_offers({'events': teamup_utils.iter_events(period[0], period[1], run_config.teamup_config.all_calendar_key_ro, run_config.teamup_config.coverage_offered_calendar, run_config.teamup_config.teamup_api_key, round_dates=False)})
+    regulars_by_day = index_regulars(regulars)
+    required_coverage = teamup_utils.iter_events(period[0], period[1], run_config.teamup_config.all_calendar_key_ro, run_config.teamup_config.coverage_required_calendar, run_config.teamup_config.teamup_api_key)
 
     coverage_events = []
-    for required_event in required_coverage['events']:
-        covers = find_coverage(required_event, existing_offers, regulars)
+    for required_event in required_coverage:
+        covers = find_coverage(required_event, offer_index, regulars_by_day)
         if len(covers) > 0:
             coverage_events.extend(covers)
 
@@ -573,10 +636,9 @@ def auto_populate_coverage(month, year, is_preview=False):
     if is_preview:
         print('Will create: {} events'.format(len(offer_events)))
         for offer_event in offer_events:
-            print('{} Start: {} End: {} Who: {} ({})'.format(days_of_week[dateutil.parser.isoparse(offer_event['start_dt']).weekday()], offer_event['start_dt'], offer_event['end_dt'], offer_event['who'], offer_event['custom']['coverage_level']))
+            print('{} Start: {} End: {} Who: {} ({})'.format(days_of_week[date_utils.parse_iso(offer_event['start_dt']).weekday()], offer_event['start_dt'], offer_event['end_dt'], offer_event['who'], offer_event['custom']['coverage_level']))
     else:
-        for cover in offer_events:
-            create_event(cover, {'events':[]})
+        create_new_events(offer_events, {'events':[]})
 
 def parse_skips(skips):
     if skips == None or len(skips.strip()) == 0:
@@ -649,6 +711,7 @@ def get_command_arguments():
     parser.add_argument('--required_events_file', help='The name of the file to read from')
     parser.add_argument('--offered_events_file', help='The name of the file to read from')
     parser.add_argument('--preview', action='store_true', help='Preview the events to be created')
+    parser.add_argument('--delete_missing', action='store_true', help='With --spreadsheet: delete the events that are not on the spreadsheet')
 
 
     # Parse the arguments
@@ -728,7 +791,7 @@ if __name__ == '__main__':
     elif args.delete_all:
         delete_all_events(args.source_file)
     elif args.spreadsheet:
-        process_spreadsheet_v2(args.source_file, args.calendar_key, args.month, args.year)
+        process_spreadsheet_v2(args.source_file, args.calendar_key, args.month, args.year, args.preview, args.delete_missing)
     elif args.default_coverage:
         auto_populate_coverage(args.month, args.year, args.preview)
     elif args.auto_populate_shifts:
@@ -0,0 +1,97 @@
+"""
+Micro-benchmark: hour-by-hour coverage keyed by '%Y%m%d%H' strings vs. integer hour indexes.
+
+Times the expand (one entry per covered hour) and collapse (join consecutive hours) steps of report_shifts over a
+month of 12 hour shifts, each covered by a few offers:
+    strings      - keys built with strftime, adjacency tested with strptime (the old implementation, reproduced here)
+    hour_index   - date_utils.to_hour_index keys, adjacency is a + 1 == b, keys formatted only for the output
+
+## To run: From root of project (TeamUp):
+python -m test.benchmark_hour_index --days 31 --repeat 5
+"""
+
+import argparse
+import datetime
+import timeit
+import pytz
+import common.date_utils as date_utils
+
+NY = pytz.timezone('America/New_York')
+
+
+def build_offers(days):
+    """
+    (shift start, [(offer start, hours)]) for a 18:00 - 06:00 shift every day, covered by three overlapping offers
+    """
+    shifts = []
+    for day in range(days):
+        shift_start = NY.localize(datetime.datetime(2021, 12, 1, 18) + datetime.timedelta(days=day))
+        offers = [(shift_start, 12), (shift_start, 6), (shift_start + datetime.timedelta(hours=6), 6)]
+        shifts.append((shift_start, offers))
+    return shifts
+
+
+def string_keys(shifts):
+    collapsed = []
+    for shift_start, offers in shifts:
+        coverage_by_hour = {}
+        for offer_start, hours in offers:
+            for hour in range(hours):
+                key = date_utils.date_to_key(offer_start + datetime.timedelta(hours=hour))
+                coverage_by_hour.setdefault(key, []).append(offer_start)
+
+        previous_hour = None
+        start_hour = None
+        for hour_key in sorted(coverage_by_hour.keys()):
+            consecutive = previous_hour is not None and \
+                datetime.datetime.strftime(datetime.datetime.strptime(previous_hour, date_utils.HOUR_KEY_FMT) + datetime.timedelta(hours=1), date_utils.HOUR_KEY_FMT) == hour_key
+            if not consecutive:
+                if previous_hour is not None:
+                    collapsed.append((start_hour, date_utils.date_to_key(date_utils.add_hour_to_key(previous_hour))))
+                start_hour = hour_key
+            previous_hour = hour_key
+        collapsed.append((start_hour, date_utils.date_to_key(date_utils.add_hour_to_key(previous_hour))))
+    return collapsed
+
+
+def hour_index_keys(shifts):
+    collapsed = []
+    for shift_start, offers in shifts:
+        tz = shift_start.tzinfo
+        coverage_by_hour = {}
+        for offer_start, hours in offers:
+            start = date_utils.to_hour_index(offer_start)
+            for hour in range(start, start + hours):
+                coverage_by_hour.setdefault(hour, []).append(offer_start)
+
+        previous_hour = None
+        start_hour = None
+        for hour in sorted(coverage_by_hour.keys()):
+            if previous_hour is None or previous_hour + 1 != hour:
+                if previous_hour is not None:
+                    collapsed.append((date_utils.hour_index_to_key(start_hour, tz), date_utils.hour_index_to_key(previous_hour + 1, tz)))
+                start_hour = hour
+            previous_hour = hour
+        collapsed.append((date_utils.hour_index_to_key(start_hour, tz), date_utils.hour_index_to_key(previous_hour + 1, tz)))
+    return collapsed
+
+
+def run_benchmark(days, repeat):
+    shifts = build_offers(days)
+    assert string_keys(shifts) == hour_index_keys(shifts)
+
+    print('Expand and collapse {} shifts, best of {} (seconds)'.format(days, repeat))
+    timings = {}
+    for name, func in [('strings', string_keys), ('hour_index', hour_index_keys)]:
+        timings[name] = min(timeit.repeat(lambda: func(shifts), number=10, repeat=repeat)) / 10
+        print('  {:<12} {:.5f}'.format(name, timings[name]))
+    print('  speedup      {:.1f}x'.format(timings['strings'] / timings['hour_index']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare string hour keys with integer hour indexes')
+    parser.add_argument('--days', type=int, default=31)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    run_benchmark(args.days, args.repeat)
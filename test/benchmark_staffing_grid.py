@@ -0,0 +1,83 @@
+"""
+Benchmark: the staffing check over a long horizon, pure Python vs. the NumPy hour grid.
+
+Builds a year (by default) of 18:00 - 06:00 duty shifts, each covered by a few offers with varying crews (some
+shifts short a crew chief, some with a crew that is too large), then times:
+    python   - check_coverage.check_staffing, one shift at a time (hour segments, staffing rules cached by crew)
+    numpy    - staffing_grid.check_staffing_grid, every hour of every shift at once
+Both must produce the same missing ranges and warnings.
+
+Requires NumPy.
+
+## To run: From root of project (TeamUp):
+python -m test.benchmark_staffing_grid --days 365 --repeat 3
+"""
+
+import argparse
+import datetime
+import timeit
+import pytz
+import check_coverage
+import common.staffing_grid as staffing_grid
+from common.coverage_engine import CoverageIndex
+from common.staffing_rules import get_staffing_rules
+from common.teamup_utils import Event
+
+NY = pytz.timezone('America/New_York')
+
+level_mappings = {'Crew Chief': 'crew_chief', 'Driver': 'driver', 'EMT (over 18)': 'emt', 'EMT (under 18)': 'emt_under_18_', 'Assistant': 'assistant'}
+
+# (offset from shift start in hours, hours, coverage level) offers for each kind of night
+CREWS = [
+    [(0, 12, 'crew_chief'), (0, 6, 'driver'), (6, 6, 'emt')],
+    [(0, 12, 'crew_chief'), (0, 12, 'emt'), (2, 4, 'assistant')],
+    [(0, 6, 'crew_chief'), (0, 12, 'driver')],
+    [(0, 12, 'crew_chief'), (0, 12, 'crew_chief'), (0, 12, 'driver'), (0, 12, 'assistant'), (0, 12, 'assistant'), (3, 3, 'emt_under_18_')],
+]
+
+
+def event(id, start, hours, who, coverage_level=None):
+    custom = {} if coverage_level is None else {'coverage_level': [coverage_level]}
+    return Event.from_teamup({'id': id, 'start_dt': start.isoformat(), 'end_dt': (start + datetime.timedelta(hours=hours)).isoformat(),
+        'who': who, 'custom': custom}, level_mappings)
+
+
+def build_shifts(days):
+    requireds = []
+    offers = []
+    for day in range(days):
+        shift_start = NY.localize(datetime.datetime(2022, 1, 1, 18) + datetime.timedelta(days=day))
+        requireds.append(event('shift{}'.format(day), shift_start, 12, ''))
+        for i, (offset, hours, coverage_level) in enumerate(CREWS[day % len(CREWS)]):
+            offers.append(event('offer{}-{}'.format(day, i), shift_start + datetime.timedelta(hours=offset), hours, 'member{}'.format(i), coverage_level))
+    return requireds, CoverageIndex(offers)
+
+
+def python_check(requireds, coverages):
+    staffing_rules = get_staffing_rules('duty_crew')
+    return [check_coverage.check_staffing(required, coverages, staffing_rules) for required in requireds]
+
+
+def numpy_check(requireds, coverages):
+    return staffing_grid.check_staffing_grid(requireds, coverages, get_staffing_rules('duty_crew'), check_coverage.STAFFING_ERROR_SORT_ORDER)
+
+
+def run_benchmark(days, repeat):
+    requireds, coverages = build_shifts(days)
+    assert python_check(requireds, coverages) == numpy_check(requireds, coverages)
+
+    print('Staffing check of {} shifts, best of {} (seconds)'.format(days, repeat))
+    timings = {}
+    for name, func in [('python', python_check), ('numpy', numpy_check)]:
+        timings[name] = min(timeit.repeat(lambda: func(requireds, coverages), number=1, repeat=repeat))
+        print('  {:<10} {:.4f}'.format(name, timings[name]))
+    print('  speedup    {:.1f}x'.format(timings['python'] / timings['numpy']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the pure Python and the NumPy staffing checks')
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    run_benchmark(args.days, args.repeat)
@@ -0,0 +1,57 @@
+"""
+Startup benchmark: how long a cold process takes from importing check_coverage to its first completed fetch.
+
+Each run happens in a fresh interpreter (like a Lambda cold start) and reports:
+    import       - time to import check_coverage
+    config       - time to read the agency configuration (DynamoDB, or AGENCY_CONFIGURATION_FILE when set)
+    first_fetch  - time to complete the first Teamup read (today's required shifts)
+    total        - import through first fetch
+
+## To run: From root of project (TeamUp):
+python -m test.benchmark_startup --trigger_file ./triggers/squadsentry_trigger.json --runs 5
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+RUN_ONCE = '''
+import json, sys, time
+t0 = time.perf_counter()
+import check_coverage
+from common.config_data import RunTrigger, read_configuration
+import common.date_utils as date_utils
+import datetime
+t1 = time.perf_counter()
+trigger = json.load(open(sys.argv[1]))
+context = check_coverage.RunContext(read_configuration(RunTrigger(trigger['time'], trigger['agency'], trigger['report_type'])), None, None)
+t2 = time.perf_counter()
+today = datetime.datetime.now().strftime(date_utils.API_DATE_FORMAT_YMD)
+check_coverage.get_coverage_required(context, today, today)
+t3 = time.perf_counter()
+print(json.dumps({'import': t1 - t0, 'config': t2 - t1, 'first_fetch': t3 - t2, 'total': t3 - t0}))
+'''
+
+
+def run_once(trigger_file):
+    output = subprocess.run([sys.executable, '-c', RUN_ONCE, trigger_file], capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run_benchmark(trigger_file, runs):
+    results = [run_once(trigger_file) for run in range(runs)]
+    print('Startup timings over {} cold runs (seconds)'.format(runs))
+    for phase in ['import', 'config', 'first_fetch', 'total']:
+        timings = [result[phase] for result in results]
+        print('  {:<12} median: {:.3f}  min: {:.3f}  max: {:.3f}'.format(phase, statistics.median(timings), min(timings), max(timings)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure check_coverage import-to-first-fetch time')
+    parser.add_argument('--trigger_file', default='./triggers/squadsentry_trigger.json')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    run_benchmark(args.trigger_file, args.runs)
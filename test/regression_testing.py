@@ -16,13 +16,14 @@ TODO:
 
 import json
 import check_coverage as CheckCoverage
+from common.teamup_utils import Event
 import glob
 import os
 
 
 def save_snapshot(to_save, target_file_path):
     with open(target_file_path, 'w') as f:
-        json.dump(to_save, f)
+        json.dump(to_save, f, default=Event.to_dict)
 
 
 def load_snapshot_compare(to_compare, target_file_path):
@@ -35,7 +36,7 @@ def load_snapshot_compare(to_compare, target_file_path):
     if 'timestamp' in snapshot:
         snapshot.pop('timestamp')
 
-    return json.dumps(to_compare, sort_keys=True) == json.dumps(snapshot, sort_keys=True)
+    return json.dumps(to_compare, sort_keys=True, default=Event.to_dict) == json.dumps(snapshot, sort_keys=True)
 
 
 def validate_results(errors, shifts) -> bool:
@@ -0,0 +1,34 @@
+from common.coverage_engine import CoverageIndex
+from common.staffing_rules import get_staffing_rules
+from common.teamup_utils import Event
+import check_coverage
+import unittest
+
+"""
+From root directory TeamUp: python3 -m test.test_check_coverage
+"""
+
+level_mappings = {'Crew Chief': 'crew_chief', 'Driver': 'driver'}
+
+
+def event(id, start_dt, end_dt, coverage_level=None):
+    custom = {} if coverage_level is None else {'coverage_level': [coverage_level]}
+    return Event.from_teamup({'id': id, 'start_dt': start_dt, 'end_dt': end_dt, 'who': id, 'custom': custom}, level_mappings)
+
+
+class TestCheckStaffing(unittest.TestCase):
+
+    def test_shift_across_dst_change(self):
+        # Clocks go back at 02:00 EDT on 2021-11-07: the shift starts on EDT and ends on EST
+        required = event('night', '2021-11-07T00:00:00-04:00', '2021-11-07T05:00:00-05:00')
+        offers = [
+            event('member1', '2021-11-07T00:00:00-04:00', '2021-11-07T05:00:00-05:00', 'crew_chief'),
+            event('member2', '2021-11-07T00:00:00-04:00', '2021-11-07T03:00:00-05:00', 'driver'),
+        ]
+        missing, warnings = check_coverage.check_staffing(required, CoverageIndex(offers), get_staffing_rules('duty_crew'))
+        self.assertEqual([(error['start_dt'], error['end_dt'], error['hours'], error['error']) for error in missing],
+            [('11/07/2021 03:00', '11/07/2021 05:00', 2, 'Driver or EMT over 18')])
+
+
+if __name__ == '__main__':
+    unittest.main()
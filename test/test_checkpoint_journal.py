@@ -0,0 +1,60 @@
+from common.checkpoint_journal import CheckpointJournal, row_keys
+import os
+import tempfile
+import unittest
+
+"""
+From root directory TeamUp: python3 -m test.test_checkpoint_journal
+"""
+
+
+class TestCheckpointJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'shifts_journal.csv')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_row_keys(self):
+        rows = [['2022-02-01T18:00:00', '2022-02-02T06:00:00', 'Duty'], ['2022-02-02T18:00:00', '2022-02-03T06:00:00', 'Duty'],
+            ['2022-02-01T18:00:00', '2022-02-02T06:00:00', 'Duty']]
+        keys = [key for key, _ in row_keys(rows)]
+        self.assertEqual(len(set(keys)), 3)
+        # Same rows, same keys
+        self.assertEqual(keys, [key for key, _ in row_keys(rows)])
+        self.assertNotEqual(next(row_keys([['a', 'bc']]))[0], next(row_keys([['ab', 'c']]))[0])
+
+    def test_resume(self):
+        with CheckpointJournal(self.path, sync_every=2) as journal:
+            journal.record('a-1', 100)
+            journal.record('b-1', 101)
+            journal.record('c-1', 102)
+
+        with CheckpointJournal(self.path) as journal:
+            self.assertEqual(len(journal), 3)
+            self.assertIn('b-1', journal)
+            self.assertEqual(journal.get('c-1'), '102')
+            self.assertNotIn('d-1', journal)
+            journal.record('d-1', 103)
+
+        with CheckpointJournal(self.path) as journal:
+            self.assertEqual(journal.get('d-1'), '103')
+
+    def test_truncated_line(self):
+        with open(self.path, 'w', newline='') as f:
+            f.write('a-1,100,ok\r\nb-1,10')
+
+        with CheckpointJournal(self.path) as journal:
+            self.assertEqual(len(journal), 1)
+            self.assertNotIn('b-1', journal)
+            journal.record('b-1', 101)
+
+        with CheckpointJournal(self.path) as journal:
+            self.assertEqual(len(journal), 2)
+            self.assertEqual(journal.get('b-1'), '101')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -25,7 +25,7 @@ recepients3 = ['c3po@gmail.com']
 
 dynamodb = boto3.resource('dynamodb')
 
-correspondence_manager = CorrespondenceManager(dynamodb)
+correspondence_manager = CorrespondenceManager(lambda: dynamodb, 'schedule_notifications')
 
 member_table = dynamodb.Table('squad_members')
 schedule_notification_table = dynamodb.Table('schedule_notifications')
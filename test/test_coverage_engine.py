@@ -0,0 +1,69 @@
+from common.coverage_engine import CoverageIndex, hour_span
+from common.date_utils import to_hour_index, hour_index_to_date
+from common.teamup_utils import Event
+from datetime import datetime, timezone, timedelta
+import unittest
+
+"""
+From root directory TeamUp: python3 -m test.test_coverage_engine
+"""
+
+EST = timezone(timedelta(hours=-5))
+
+
+def offer(start_dt, end_dt, who):
+    return Event.from_teamup({'id': who, 'start_dt': start_dt, 'end_dt': end_dt, 'who': who})
+
+
+class TestHourSpan(unittest.TestCase):
+
+    def test_whole_hours(self):
+        self.assertEqual(hour_span('2021-12-01T18:00:00-05:00', '2021-12-02T01:00:00-05:00'),
+            (to_hour_index(datetime(2021, 12, 1, 18, tzinfo=EST)), to_hour_index(datetime(2021, 12, 2, 1, tzinfo=EST))))
+
+    def test_half_hour_start(self):
+        # Starts within the 18:00 hour and lasts 2 full hours: the 18:00 and 19:00 hours
+        self.assertEqual(hour_span('2021-12-01T18:30:00-05:00', '2021-12-01T20:30:00-05:00'),
+            (to_hour_index(datetime(2021, 12, 1, 18, tzinfo=EST)), to_hour_index(datetime(2021, 12, 1, 20, tzinfo=EST))))
+
+
+class TestCoverageIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = CoverageIndex([
+            offer('2021-12-08T19:00:00-05:00', '2021-12-09T01:00:00-05:00', 'member2'),
+            offer('2021-12-08T18:00:00-05:00', '2021-12-08T19:00:00-05:00', 'member1'),
+            offer('2021-12-08T18:00:00-05:00', '2021-12-09T01:00:00-05:00', 'member3'),
+            offer('2021-12-10T18:00:00-05:00', '2021-12-10T23:00:00-05:00', 'member4'),
+        ])
+
+    def segments(self, start, end):
+        return [(hour_index_to_date(segment_start, EST).hour, hour_index_to_date(segment_end, EST).hour, [event.who for event in events])
+            for segment_start, segment_end, events in self.index.segments(to_hour_index(start), to_hour_index(end))]
+
+    def test_overlapping(self):
+        overlapping = self.index.overlapping(to_hour_index(datetime(2021, 12, 8, 20, tzinfo=EST)), to_hour_index(datetime(2021, 12, 9, 6, tzinfo=EST)))
+        self.assertEqual([span[2].who for span in overlapping], ['member3', 'member2'])
+
+    def test_segments_follow_crew_changes(self):
+        self.assertEqual(self.segments(datetime(2021, 12, 8, 18, tzinfo=EST), datetime(2021, 12, 9, 1, tzinfo=EST)),
+            [(18, 19, ['member1', 'member3']), (19, 1, ['member3', 'member2'])])
+
+    def test_segments_include_uncovered_time(self):
+        self.assertEqual(self.segments(datetime(2021, 12, 10, 18, tzinfo=EST), datetime(2021, 12, 11, 1, tzinfo=EST)),
+            [(18, 23, ['member4']), (23, 1, [])])
+
+    def test_segments_clip_to_shift(self):
+        self.assertEqual(self.segments(datetime(2021, 12, 8, 22, tzinfo=EST), datetime(2021, 12, 9, 0, tzinfo=EST)),
+            [(22, 0, ['member3', 'member2'])])
+
+    def test_no_offers(self):
+        self.assertEqual(self.segments(datetime(2021, 12, 20, 6, tzinfo=EST), datetime(2021, 12, 20, 18, tzinfo=EST)),
+            [(6, 18, [])])
+
+    def test_empty_index(self):
+        self.assertEqual([(start, end, events) for start, end, events in CoverageIndex([]).segments(10, 12)], [(10, 12, [])])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+from common.config_data import TeamupConfig
+from common.teamup_utils import Event, TeamupClient
+from types import SimpleNamespace
+import common.teamup_utils as teamup_utils
+import create_events
+import json
+import unittest
+
+"""
+From root directory TeamUp: python3 -m test.test_create_events
+"""
+
+level_mappings = {'Crew Chief': 'crew_chief', 'Driver': 'driver', 'EMT (over 18)': 'emt'}
+
+
+class Resp:
+
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.text = json.dumps(body) if body is not None else ''
+        self.headers = {}
+
+
+class RecordingClient(TeamupClient):
+
+    def __init__(self):
+        super().__init__()
+        self.posted = []
+        self.deleted = []
+
+    def _post_event(self, event, calendar_key, api_key):
+        self.posted.append((calendar_key, event))
+        return Resp(201, {'event': {'id': 'new-' + event['start_dt'], 'start_dt': event['start_dt']}})
+
+    def _delete_event(self, event_id, calendar_key, api_key):
+        self.deleted.append((calendar_key, event_id))
+        return Resp(204)
+
+
+def teamup_event(id, start_dt, end_dt, title):
+    # As Teamup returns it: the subcalendar ids are numbers
+    return Event.from_teamup({'id': id, 'subcalendar_id': 10358690, 'subcalendar_ids': [10358690], 'title': title, 'who': '',
+        'notes': None, 'custom': {'coverage_level': ['do_not_select']}, 'start_dt': start_dt, 'end_dt': end_dt, 'delete_dt': None}, level_mappings)
+
+
+class TestSyncEvents(unittest.TestCase):
+
+    def setUp(self):
+        create_events.run_config = SimpleNamespace(teamup_config=TeamupConfig('api_key', 'required_admin', 'all_ro', 'offered_admin',
+            '10358690', '10358691', level_mappings))
+        self.client = RecordingClient()
+        self.previous_client = teamup_utils._client
+        teamup_utils._client = self.client
+
+    def tearDown(self):
+        teamup_utils._client = self.previous_client
+
+    def test_delete_missing(self):
+        existing_events = {'events': [
+            teamup_event('1', '2022-06-01T18:00:00-04:00', '2022-06-02T06:00:00-04:00', 'Duty'),
+            teamup_event('2', '2022-06-02T18:00:00-04:00', '2022-06-03T06:00:00-04:00', 'Duty')
+        ]}
+        events = [
+            {'subcalendar_id': '10358690', 'start_dt': '2022-06-01T18:00:00', 'end_dt': '2022-06-02T06:00:00', 'title': 'Duty'},
+            {'subcalendar_id': '10358690', 'start_dt': '2022-06-03T18:00:00', 'end_dt': '2022-06-04T06:00:00', 'title': 'Duty'}
+        ]
+        create_events.sync_events(events, existing_events, delete_missing=True)
+
+        self.assertEqual(self.client.posted, [('required_admin', events[1])])
+        self.assertEqual(self.client.deleted, [('required_admin', '2')])
+
+    def test_deletes_only_listed_by_default(self):
+        existing_events = {'events': [teamup_event('1', '2022-06-01T18:00:00-04:00', '2022-06-02T06:00:00-04:00', 'Duty')]}
+        create_events.sync_events([], existing_events)
+        self.assertEqual(self.client.deleted, [])
+
+
+class TestDerivedFile(unittest.TestCase):
+
+    def test_keeps_extension(self):
+        self.assertEqual(create_events.derived_file('shifts/feb.csv', '_journal'), 'shifts/feb_journal.csv')
+        self.assertEqual(create_events.derived_file('shifts/feb.txt', '_journal'), 'shifts/feb_journal.txt')
+
+    def test_no_extension(self):
+        self.assertEqual(create_events.derived_file('shifts/feb', '_journal'), 'shifts/feb_journal.csv')
+
+    def test_csv_elsewhere_in_path(self):
+        self.assertEqual(create_events.derived_file('exports.csv.d/feb.csv', '_event_ids'), 'exports.csv.d/feb_event_ids.csv')
+
+
+if __name__ == '__main__':
+    unittest.main()
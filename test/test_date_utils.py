@@ -1,6 +1,7 @@
 # import common.date_utils as date_utils
 from common import date_utils
-from datetime import datetime
+from datetime import datetime, timezone, timedelta
+import pytz
 from collections import namedtuple
 import unittest
 Range = namedtuple('Range', ['start', 'end'])
@@ -58,5 +59,37 @@ class TestDaysOverlap(unittest.TestCase):
             Range(datetime(2022, 2, 5, 12, 0, 0), datetime(2022, 2, 5, 18, 0, 0))), 0)
 
 
+class TestHourIndex(unittest.TestCase):
+
+    def test_consecutive_hours(self):
+        start = date_utils.to_hour_index(pytz.timezone('America/New_York').localize(datetime(2021, 12, 31, 23, 0, 0)))
+        self.assertEqual(date_utils.hour_index_to_key(start, pytz.timezone('America/New_York')), '2021123123')
+        self.assertEqual(date_utils.hour_index_to_key(start + 1, pytz.timezone('America/New_York')), '2022010100')
+
+    def test_floors_to_the_hour(self):
+        eastern = timezone(timedelta(hours=-5))
+        self.assertEqual(date_utils.to_hour_index(datetime(2021, 12, 1, 18, 30, tzinfo=eastern)), 
+            date_utils.to_hour_index(datetime(2021, 12, 1, 18, 0, tzinfo=eastern)))
+
+    def test_dst_change(self):
+        # Clocks go back at 2:00 on 2021-11-07, so the 1:00 hour happens twice: two indexes, the same key
+        ny = pytz.timezone('America/New_York')
+        first = date_utils.to_hour_index(ny.localize(datetime(2021, 11, 7, 0, 0, 0)))
+        self.assertEqual([date_utils.hour_index_to_key(hour, ny) for hour in range(first, first + 4)],
+            ['2021110700', '2021110701', '2021110701', '2021110702'])
+
+
+
+class TestSpanForDate(unittest.TestCase):
+
+    def test_overnight(self):
+        span = date_utils.span_for_date(datetime(2022, 5, 10, 15), '18:00', '06:00')
+        self.assertEqual(span[1] - span[0], timedelta(hours=12))
+
+    def test_only_the_day_matters(self):
+        eastern = pytz.timezone('America/New_York')
+        self.assertEqual(date_utils.span_for_date(eastern.localize(datetime(2022, 5, 10, 23)), '13:00', '18:00'),
+            date_utils.span_for_date(datetime(2022, 5, 10).date(), '13:00', '18:00'))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,73 @@
+from common.event_snapshot import EventSnapshot
+from common.teamup_utils import Event
+import unittest
+
+"""
+From root directory TeamUp: python3 -m test.test_event_snapshot
+"""
+
+
+def offer(id, start_dt, end_dt, who, subcalendar_id=2, delete_dt=None):
+    return Event.from_teamup({'id': id, 'subcalendar_id': subcalendar_id, 'subcalendar_ids': [subcalendar_id], 'start_dt': start_dt, 'end_dt': end_dt,
+        'who': who, 'delete_dt': delete_dt})
+
+
+class TestApplyChanges(unittest.TestCase):
+
+    def setUp(self):
+        self.snapshot = EventSnapshot.from_dict({
+            'windows': {'2': ['2021-12-01', '2021-12-05']},
+            'events': {'2': [event.to_dict() for event in [
+                offer('a', '2021-12-01T18:00:00-05:00', '2021-12-02T00:00:00-05:00', 'member1'),
+                offer('b', '2021-12-02T18:00:00-05:00', '2021-12-03T00:00:00-05:00', 'member2'),
+                offer('c', '2021-12-04T18:00:00-05:00', '2021-12-05T00:00:00-05:00', 'member3')
+            ]]}
+        }, 'calendar_key', 'api_key')
+
+    def ids(self):
+        return [event.id for event in self.snapshot.events['2']]
+
+    def test_changed_event_keeps_its_place(self):
+        changed = offer('a', '2021-12-01T20:00:00-05:00', '2021-12-02T00:00:00-05:00', 'member1')
+        changes = self.snapshot.apply_changes([changed])
+        self.assertEqual(self.ids(), ['a', 'b', 'c'])
+        self.assertEqual(self.snapshot.events['2'][0].start_dt, '2021-12-01T20:00:00-05:00')
+        self.assertEqual(changes['2'][0][1], changed)
+
+    def test_new_event_in_order_of_start(self):
+        self.snapshot.apply_changes([offer('d', '2021-12-03T18:00:00-05:00', '2021-12-04T00:00:00-05:00', 'member4')])
+        self.assertEqual(self.ids(), ['a', 'b', 'd', 'c'])
+
+    def test_several_changes(self):
+        changes = self.snapshot.apply_changes([
+            offer('e', '2021-12-05T06:00:00-05:00', '2021-12-05T12:00:00-05:00', 'member5'),
+            offer('d', '2021-12-01T06:00:00-05:00', '2021-12-01T12:00:00-05:00', 'member4'),
+            offer('b', '2021-12-02T18:00:00-05:00', '2021-12-03T00:00:00-05:00', 'member2', delete_dt='2021-12-01T10:00:00-05:00'),
+            offer('f', '2021-12-02T18:00:00-05:00', '2021-12-03T00:00:00-05:00', 'member6'),
+            offer('d', '2021-12-01T06:00:00-05:00', '2021-12-01T12:00:00-05:00', 'member7')
+        ])
+        self.assertEqual(self.ids(), ['d', 'a', 'f', 'c', 'e'])
+        self.assertEqual(self.snapshot.events['2'][0].who, 'member7')
+        self.assertEqual([(old is None, new is None) for old, new in changes['2']], [(True, False), (True, False), (False, True), (True, False), (False, False)])
+
+    def test_deleted_event(self):
+        changes = self.snapshot.apply_changes([offer('b', '2021-12-02T18:00:00-05:00', '2021-12-03T00:00:00-05:00', 'member2', delete_dt='2021-12-01T10:00:00-05:00')])
+        self.assertEqual(self.ids(), ['a', 'c'])
+        self.assertIsNone(changes['2'][0][1])
+
+    def test_moved_to_other_subcalendar(self):
+        self.snapshot.apply_changes([offer('c', '2021-12-04T18:00:00-05:00', '2021-12-05T00:00:00-05:00', 'member3', subcalendar_id=1)])
+        self.assertEqual(self.ids(), ['a', 'b'])
+
+    def test_outside_window_and_unknown(self):
+        changes = self.snapshot.apply_changes([offer('e', '2021-12-10T18:00:00-05:00', '2021-12-11T00:00:00-05:00', 'member5')])
+        self.assertEqual(self.ids(), ['a', 'b', 'c'])
+        self.assertEqual(changes, {})
+
+    def test_round_trip(self):
+        self.assertEqual(EventSnapshot.from_dict(self.snapshot.to_dict(), 'calendar_key', 'api_key').get_events('2021-12-02', '2021-12-02', '2'),
+            self.snapshot.get_events('2021-12-02', '2021-12-02', '2'))
+
+
+if __name__ == '__main__':
+    unittest.main()
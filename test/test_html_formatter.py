@@ -0,0 +1,51 @@
+import common.html_formatter as html_formatter
+from common.teamup_utils import Event
+import copy
+import unittest
+
+"""
+From root directory TeamUp: python3 -m test.test_html_formatter
+"""
+
+shift_and_coverage = {
+    'shift': Event.from_teamup({'id': '1', 'start_dt': '2021-12-02T18:00:00-05:00', 'end_dt': '2021-12-03T06:00:00-05:00'}),
+    'coverage': [
+        {'start_dt': '2021120218', 'end_dt': '2021120300', 'who': 'member1,member2'},
+        {'start_dt': '2021120300', 'end_dt': '2021120306', 'who': 'member1,member3'}
+    ],
+    'shift-summary': {'member1': 12, 'member2': 6, 'member3': 6}
+}
+
+recipients = ['member1@db', 'member2@db', 'member3@db']
+
+
+class TestShiftReportDigest(unittest.TestCase):
+
+    def test_stable(self):
+        self.assertEqual(html_formatter.shift_report_digest(shift_and_coverage, recipients),
+            html_formatter.shift_report_digest(copy.deepcopy(shift_and_coverage), list(reversed(recipients))))
+
+    def test_crew_layout_change(self):
+        # Same hour totals per member, but member2 and member3 swap halves of the shift
+        changed = copy.deepcopy(shift_and_coverage)
+        changed['coverage'][0]['who'] = 'member1,member3'
+        changed['coverage'][1]['who'] = 'member1,member2'
+        self.assertNotEqual(html_formatter.shift_report_digest(shift_and_coverage, recipients),
+            html_formatter.shift_report_digest(changed, recipients))
+
+    def test_recipient_change(self):
+        self.assertNotEqual(html_formatter.shift_report_digest(shift_and_coverage, recipients),
+            html_formatter.shift_report_digest(shift_and_coverage, recipients[:2]))
+
+    def test_template_change(self):
+        digest = html_formatter.shift_report_digest(shift_and_coverage, recipients)
+        template_version = html_formatter.template_version
+        try:
+            html_formatter.template_version = 'changed'
+            self.assertNotEqual(digest, html_formatter.shift_report_digest(shift_and_coverage, recipients))
+        finally:
+            html_formatter.template_version = template_version
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+from common.member_directory import MemberDirectory
+from types import SimpleNamespace
+import unittest
+
+"""
+From root directory TeamUp: python3 -m test.test_member_directory
+"""
+
+
+class FakeTable:
+
+    def __init__(self):
+        self.items = []
+
+    def put_item(self, Item):
+        self.items.append(Item)
+
+
+class FakeDynamoDB:
+    """
+    Serves batch_get_item from a map of (agency, member_name) -> email address
+    """
+
+    def __init__(self, addresses):
+        self.addresses = addresses
+        self.table = FakeTable()
+        self.requested = []
+
+    def Table(self, table_name):
+        return self.table
+
+    def batch_get_item(self, RequestItems):
+        table_name, request = next(iter(RequestItems.items()))
+        keys = [(key['agency'], key['member_name']) for key in request['Keys']]
+        self.requested.extend(keys)
+        items = [{'agency': key[0], 'member_name': key[1], 'email_address': self.addresses[key]} for key in keys if key in self.addresses]
+        return {'Responses': {table_name: items}}
+
+
+def coverage(who, notes=None):
+    return SimpleNamespace(who=who, notes=notes)
+
+
+class TestMemberDirectory(unittest.TestCase):
+
+    def test_address_in_a_later_event(self):
+        dynamodb = FakeDynamoDB({})
+        directory = MemberDirectory(lambda: dynamodb, 'squad_members')
+        directory.resolve('a', [coverage('bob'), coverage('bob', 'email: bob@x.org')])
+
+        self.assertEqual(directory.get_email_address('a', 'bob'), 'bob@x.org')
+        self.assertEqual(directory.misses, set())
+        self.assertEqual(dynamodb.table.items, [{'agency': 'a', 'member_name': 'bob', 'email_address': 'bob@x.org'}])
+        self.assertEqual(dynamodb.requested, [])
+
+    def test_batch_lookup_and_misses(self):
+        dynamodb = FakeDynamoDB({('a', 'amy'): 'amy@x.org'})
+        directory = MemberDirectory(lambda: dynamodb, 'squad_members')
+        directory.resolve('a', [coverage('amy'), coverage('carl'), coverage('amy'), coverage('dan', 'email: dan@x.org')])
+
+        self.assertEqual(directory.get_email_address('a', 'amy'), 'amy@x.org')
+        self.assertEqual(directory.get_email_address('a', 'dan'), 'dan@x.org')
+        self.assertIsNone(directory.get_email_address('a', 'carl'))
+        self.assertEqual(directory.misses, {('a', 'carl')})
+        self.assertEqual(sorted(dynamodb.requested), [('a', 'amy'), ('a', 'carl')])
+
+        # Cached: no more lookups
+        directory.resolve('a', [coverage('amy'), coverage('carl')])
+        self.assertEqual(len(dynamodb.requested), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
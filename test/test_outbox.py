@@ -0,0 +1,61 @@
+from common.outbox import FAILED, SENT, SKIPPED, Notification, Outbox
+from common.utils import NotificationCategory
+import unittest
+
+"""
+From root directory TeamUp: python3 -m test.test_outbox
+"""
+
+
+def notification(subject):
+    return Notification('agency', 'report_type', list(NotificationCategory)[0], ['member@x.org'], subject, '<html></html>')
+
+
+class TestOutbox(unittest.TestCase):
+
+    def setUp(self):
+        self.sent = []
+        self.recorded = []
+        self.failing_sends = set()
+        self.failing_records = set()
+
+    def deliver(self, notification):
+        if notification.subject in self.failing_sends:
+            self.failing_sends.discard(notification.subject)
+            raise Exception('smtp down')
+        self.sent.append(notification.subject)
+        return notification.subject != 'already sent'
+
+    def record(self, notification, sent):
+        if notification.subject in self.failing_records:
+            raise Exception('dynamodb down')
+        self.recorded.append((notification.subject, sent))
+
+    def test_send_failure_is_retried(self):
+        self.failing_sends.add('a')
+        with Outbox(self.deliver, 2, self.record) as outbox:
+            outbox.enqueue(notification('a'))
+            outbox.enqueue(notification('already sent'))
+            results = outbox.drain()
+            self.assertEqual([result.status for result in results], [FAILED, SKIPPED])
+            self.assertEqual(self.recorded, [('already sent', False)])
+
+            results = outbox.retry_failed()
+            self.assertEqual([result.status for result in results], [SENT])
+        self.assertEqual(self.recorded, [('already sent', False), ('a', True)])
+
+    def test_record_failure_is_not_retried(self):
+        self.failing_records.add('a')
+        with Outbox(self.deliver, 2, self.record) as outbox:
+            outbox.enqueue(notification('a'))
+            results = outbox.drain()
+            self.assertEqual(results[0].status, SENT)
+            self.assertEqual(results[0].error, 'dynamodb down')
+            self.assertEqual(outbox.failed, [])
+            self.assertEqual(outbox.retry_failed(), [])
+        # Sent once only
+        self.assertEqual(self.sent, ['a'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+from common.reconciliation import event_key, reconcile
+from common.teamup_utils import Event
+import unittest
+
+"""
+From root directory TeamUp: python3 -m test.test_reconciliation
+"""
+
+
+def existing(id, start_dt, end_dt, title=None, who=None, subcalendar_id=1):
+    return Event(id, subcalendar_id, [subcalendar_id], start_dt, end_dt, who=who, title=title)
+
+
+def payload(start_dt, end_dt, title=None, who=None, subcalendar_id=1):
+    event = {'subcalendar_id': subcalendar_id, 'start_dt': start_dt, 'end_dt': end_dt}
+    if title is not None:
+        event['title'] = title
+    if who is not None:
+        event['who'] = who
+    return event
+
+
+class TestReconciliation(unittest.TestCase):
+
+    def test_event_key(self):
+        self.assertEqual(event_key(existing('1', '2022-06-01T18:00:00-04:00', '2022-06-02T06:00:00-04:00', title='43 Covering [35]')),
+            event_key(payload('2022-06-01T18:00:00', '2022-06-02T06:00:00', title='43 Covering [35] ')))
+        self.assertEqual(event_key(existing('1', '2022-01-01T18:00:00-05:00', '2022-01-02T06:00:00-05:00', who='member1')),
+            ('2022-01-01T18:00:00', '2022-01-02T06:00:00', '1', 'member1'))
+
+    def test_reconcile(self):
+        existing_events = [
+            existing('1', '2022-06-01T18:00:00-04:00', '2022-06-02T06:00:00-04:00', title='Duty'),
+            existing('2', '2022-06-02T18:00:00-04:00', '2022-06-03T06:00:00-04:00', title='Duty'),
+            existing('3', '2022-06-03T18:00:00-04:00', '2022-06-04T06:00:00-04:00', title='Old title'),
+            existing('4', '2022-06-01T18:00:00-04:00', '2022-06-02T06:00:00-04:00', title='Duty')
+        ]
+        desired = [
+            payload('2022-06-01T18:00:00', '2022-06-02T06:00:00', title='Duty'),
+            payload('2022-06-03T18:00:00', '2022-06-04T06:00:00', title='New title'),
+            payload('2022-06-02T18:00:00', '2022-06-03T06:00:00', title='Duty'),
+            payload('2022-06-05T18:00:00', '2022-06-06T06:00:00', title='Duty')
+        ]
+        plan = reconcile(desired, existing_events)
+
+        self.assertEqual([(event['start_dt'], existing_event.id) for event, existing_event in plan.unchanged],
+            [('2022-06-01T18:00:00', '1'), ('2022-06-02T18:00:00', '2')])
+        self.assertEqual([event['title'] for event in plan.to_create], ['New title', 'Duty'])
+        # The changed event, and the duplicate of the first one
+        self.assertEqual([event.id for event in plan.to_delete], ['3', '4'])
+
+    def test_subcalendars(self):
+        plan = reconcile([payload('2022-06-01T18:00:00', '2022-06-02T06:00:00', who='member1', subcalendar_id=2)],
+            [existing('1', '2022-06-01T18:00:00-04:00', '2022-06-02T06:00:00-04:00', who='member1')])
+        self.assertEqual(len(plan.to_create), 1)
+        self.assertEqual(len(plan.to_delete), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+from common.request_scheduler import RequestScheduler, TokenBucket, get_retry_after
+import requests
+import unittest
+
+"""
+From root directory TeamUp: python3 -m test.test_request_scheduler
+"""
+
+
+class FakeClock:
+    """
+    A clock that only moves when slept on
+    """
+
+    def __init__(self):
+        self.now = 0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class Resp:
+
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+def responses(*items):
+    """
+    A send() returning (or raising) the items in turn, and the list of the attempts made
+    """
+    attempts = []
+    def send():
+        item = items[len(attempts)]
+        attempts.append(item)
+        if isinstance(item, Exception):
+            raise item
+        return item
+    return send, attempts
+
+
+class TestRequestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.scheduler = RequestScheduler(100, 100, 4, 3, backoff_base=1, clock=self.clock, sleep=self.clock.sleep,
+            jitter=lambda low, high: high)
+
+    def test_success(self):
+        send, attempts = responses(Resp(200))
+        self.assertEqual(self.scheduler.send('GET', '/events', send).status_code, 200)
+        self.assertEqual(len(attempts), 1)
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_retries_transient_get(self):
+        send, attempts = responses(Resp(503), Resp(502), Resp(200))
+        self.assertEqual(self.scheduler.send('GET', '/events', send).status_code, 200)
+        self.assertEqual(len(attempts), 3)
+        self.assertEqual(self.clock.sleeps, [1, 2])
+
+        summary = self.scheduler.metrics.summary()
+        self.assertEqual(summary['requests'], 1)
+        self.assertEqual(summary['retries'], 2)
+        self.assertEqual(summary['failures'], 0)
+        self.assertEqual(summary['statuses'], {503: 1, 502: 1, 200: 1})
+
+    def test_retry_after(self):
+        send, attempts = responses(Resp(429, {'Retry-After': '7'}), Resp(201))
+        self.assertEqual(self.scheduler.send('POST', '/events', send).status_code, 201)
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(self.clock.sleeps, [7])
+        self.assertEqual(self.scheduler.metrics.summary()['throttled'], 1)
+
+    def test_post_not_retried_on_server_error(self):
+        send, attempts = responses(Resp(500), Resp(201))
+        self.assertEqual(self.scheduler.send('POST', '/events', send).status_code, 500)
+        self.assertEqual(len(attempts), 1)
+        self.assertEqual(self.scheduler.metrics.summary()['failures'], 1)
+
+    def test_retries_exhausted(self):
+        send, attempts = responses(Resp(503), Resp(503), Resp(503), Resp(503))
+        self.assertEqual(self.scheduler.send('DELETE', '/events/1', send).status_code, 503)
+        self.assertEqual(len(attempts), 4)
+        self.assertEqual(self.clock.sleeps, [1, 2, 4])
+
+    def test_client_error_not_retried(self):
+        send, attempts = responses(Resp(404))
+        self.assertEqual(self.scheduler.send('GET', '/events/1', send).status_code, 404)
+        self.assertEqual(len(attempts), 1)
+
+    def test_exceptions(self):
+        send, attempts = responses(requests.exceptions.ConnectTimeout(), Resp(201))
+        self.assertEqual(self.scheduler.send('POST', '/events', send).status_code, 201)
+        self.assertEqual(len(attempts), 2)
+
+        # The server may have created the event before the read timed out
+        send, attempts = responses(requests.exceptions.ReadTimeout(), Resp(201))
+        with self.assertRaises(requests.exceptions.ReadTimeout):
+            self.scheduler.send('POST', '/events', send)
+        self.assertEqual(len(attempts), 1)
+
+        send, attempts = responses(requests.exceptions.ReadTimeout(), Resp(200))
+        self.assertEqual(self.scheduler.send('GET', '/events', send).status_code, 200)
+        self.assertEqual(len(attempts), 2)
+
+    def test_backoff_capped(self):
+        self.scheduler.backoff_max = 3
+        self.assertEqual(self.scheduler.get_backoff(5, None), 3)
+        self.assertEqual(self.scheduler.get_backoff(0, Resp(429, {'Retry-After': '1000'})), 120)
+
+    def test_get_retry_after(self):
+        self.assertEqual(get_retry_after(Resp(429, {'Retry-After': '3'})), 3)
+        self.assertEqual(get_retry_after(Resp(429, {'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'})), 0)
+        self.assertIsNone(get_retry_after(Resp(429, {'Retry-After': 'soon'})))
+        self.assertIsNone(get_retry_after(Resp(429)))
+        self.assertIsNone(get_retry_after(None))
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_rate(self):
+        clock = FakeClock()
+        bucket = TokenBucket(2, 3, clock, clock.sleep)
+        waits = [bucket.acquire() for _ in range(5)]
+        # The burst goes through at once, then one token every half second
+        self.assertEqual(waits, [0, 0, 0, 0.5, 0.5])
+        self.assertEqual(clock.now, 1)
+
+    def test_pause(self):
+        clock = FakeClock()
+        bucket = TokenBucket(2, 3, clock, clock.sleep)
+        bucket.pause(5)
+        self.assertEqual(bucket.acquire(), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+from common.coverage_engine import CoverageIndex
+from common.staffing_rules import get_staffing_rules
+from common.teamup_utils import Event
+import check_coverage
+import common.staffing_grid as staffing_grid
+import unittest
+
+"""
+From root directory TeamUp: python3 -m test.test_staffing_grid
+(requires NumPy, skipped otherwise)
+"""
+
+level_mappings = {'Crew Chief': 'crew_chief', 'Driver': 'driver', 'EMT (over 18)': 'emt', 'Assistant': 'assistant'}
+
+
+def event(id, start_dt, end_dt, coverage_level=None):
+    custom = {} if coverage_level is None else {'coverage_level': [coverage_level]}
+    return Event.from_teamup({'id': id, 'start_dt': start_dt, 'end_dt': end_dt, 'who': id, 'custom': custom}, level_mappings)
+
+
+requireds = [
+    event('night', '2021-12-08T18:00:00-05:00', '2021-12-09T06:00:00-05:00'),
+    # Overlaps the night shift
+    event('late', '2021-12-09T00:00:00-05:00', '2021-12-09T08:00:00-05:00'),
+    event('day', '2021-12-11T06:00:00-05:00', '2021-12-11T18:00:00-05:00'),
+    event('empty', '2021-12-12T06:00:00-05:00', '2021-12-12T06:00:00-05:00'),
+]
+
+offers = [
+    event('member1', '2021-12-08T18:00:00-05:00', '2021-12-09T02:00:00-05:00', 'crew_chief'),
+    event('member2', '2021-12-08T20:00:00-05:00', '2021-12-09T06:00:00-05:00', 'driver'),
+    event('member3', '2021-12-09T04:00:00-05:00', '2021-12-09T08:00:00-05:00', 'crew_chief'),
+    event('member4', '2021-12-11T06:00:00-05:00', '2021-12-11T12:00:00-05:00', 'crew_chief'),
+    event('member5', '2021-12-11T06:00:00-05:00', '2021-12-11T18:00:00-05:00', 'crew_chief'),
+    event('member6', '2021-12-11T08:00:00-05:00', '2021-12-11T10:00:00-05:00', 'assistant'),
+    event('member7', '2021-12-11T08:00:00-05:00', '2021-12-11T10:00:00-05:00', 'assistant'),
+    event('member8', '2021-12-11T09:00:00-05:00', '2021-12-11T10:00:00-05:00', 'assistant'),
+    event('member9', '2021-12-11T09:00:00-05:00', '2021-12-11T11:00:00-05:00', 'emt'),
+]
+
+
+@unittest.skipUnless(staffing_grid.is_available(), 'NumPy is not installed')
+class TestCheckStaffingGrid(unittest.TestCase):
+
+    def check(self, requireds, offers):
+        return staffing_grid.check_staffing_grid(requireds, CoverageIndex(offers), get_staffing_rules('duty_crew'), check_coverage.STAFFING_ERROR_SORT_ORDER)
+
+    def test_same_as_check_staffing(self):
+        staffing_rules = get_staffing_rules('duty_crew')
+        coverages = CoverageIndex(offers)
+        self.assertEqual(self.check(requireds, offers), [check_coverage.check_staffing(required, coverages, staffing_rules) for required in requireds])
+
+    def test_runs_split_at_shift_boundaries(self):
+        missing, _ = self.check(requireds, offers)[1]
+        self.assertEqual([(error['start_dt'], error['end_dt'], error['error']) for error in missing],
+            [('12/09/2021 02:00', '12/09/2021 04:00', 'Crew Chief'), ('12/09/2021 06:00', '12/09/2021 08:00', 'Driver or EMT over 18')])
+
+    def test_no_offers(self):
+        missing, warnings = self.check(requireds[:1], [])[0]
+        self.assertEqual([(error['hours'], error['error']) for error in missing], [(12, 'Crew Chief'), (12, 'Driver or EMT over 18')])
+        self.assertEqual(warnings, {})
+
+    def test_missing_coverage_level(self):
+        with self.assertRaises(KeyError):
+            self.check(requireds[:1], offers + [event('member10', '2021-12-08T18:00:00-05:00', '2021-12-08T19:00:00-05:00')])
+
+    def test_shift_across_dst_change(self):
+        required = event('night', '2021-11-07T00:00:00-04:00', '2021-11-07T05:00:00-05:00')
+        dst_offers = [
+            event('member1', '2021-11-07T00:00:00-04:00', '2021-11-07T05:00:00-05:00', 'crew_chief'),
+            event('member2', '2021-11-07T00:00:00-04:00', '2021-11-07T03:00:00-05:00', 'driver'),
+        ]
+        missing, _ = self.check([required], dst_offers)[0]
+        self.assertEqual([(error['start_dt'], error['end_dt'], error['error']) for error in missing],
+            [('11/07/2021 03:00', '11/07/2021 05:00', 'Driver or EMT over 18')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+from common.config_data import CoverageLevels
+from common.staffing_rules import DutyCrewRules, StaffingRules, crew_composition, get_staffing_rules
+from common.teamup_utils import Event
+import unittest
+
+"""
+From root directory TeamUp: python3 -m test.test_staffing_rules
+"""
+
+level_mappings = {'Crew Chief': 'crew_chief', 'Driver': 'driver', 'EMT (over 18)': 'emt', 'Assistant': 'assistant'}
+
+
+def member(who, coverage_level):
+    return Event.from_teamup({'id': who, 'start_dt': '2021-12-01T18:00:00-05:00', 'end_dt': '2021-12-02T01:00:00-05:00',
+        'who': who, 'custom': {'coverage_level': [coverage_level]}}, level_mappings)
+
+
+class TestCrewComposition(unittest.TestCase):
+
+    def test_same_roles_same_composition(self):
+        self.assertEqual(crew_composition([member('member1', 'crew_chief'), member('member2', 'driver')]),
+            crew_composition([member('member3', 'driver'), member('member4', 'crew_chief')]))
+
+    def test_counts_matter(self):
+        self.assertNotEqual(crew_composition([member('member1', 'crew_chief')]),
+            crew_composition([member('member1', 'crew_chief'), member('member2', 'crew_chief')]))
+
+
+class TestDutyCrewRules(unittest.TestCase):
+
+    def setUp(self):
+        self.rules = get_staffing_rules('duty_crew')
+
+    def test_fully_staffed(self):
+        self.assertEqual(self.rules.check([member('member1', 'crew_chief'), member('member2', 'emt')]), ([], []))
+
+    def test_missing_crew_chief_and_driver(self):
+        self.assertEqual(self.rules.check([member('member1', 'assistant')]), ([CoverageLevels.CREW_CHIEF.value, 'Driver or EMT over 18'], []))
+
+    def test_two_crew_chiefs(self):
+        self.assertEqual(self.rules.check([member('member1', 'crew_chief'), member('member2', 'crew_chief')]), ([], ['Warning: more than one CC']))
+
+    def test_crew_too_large(self):
+        crew = [member('member1', 'crew_chief'), member('member2', 'driver')] + [member('member{}'.format(i), 'assistant') for i in range(3, 7)]
+        self.assertEqual(self.rules.check(crew), ([], ['Crew too large - 5 maximum']))
+
+    def test_evaluated_once_per_composition(self):
+        calls = []
+        evaluate = self.rules.evaluate
+        self.rules.evaluate = lambda roles: calls.append(roles) or evaluate(roles)
+        self.rules.check([member('member1', 'crew_chief'), member('member2', 'driver')])
+        missing, warnings = self.rules.check([member('member3', 'driver'), member('member4', 'crew_chief')])
+        missing.append('changed by the caller')
+        self.assertEqual(self.rules.check([member('member1', 'crew_chief'), member('member2', 'driver')]), ([], []))
+        self.assertEqual(len(calls), 1)
+
+    def test_supports_grid(self):
+        self.assertTrue(self.rules.supports_grid)
+        self.assertFalse(StaffingRules.supports_grid)
+        with self.assertRaises(TypeError):
+            StaffingRules()
+
+    def test_unknown_rules(self):
+        self.assertIsInstance(get_staffing_rules('duty_crew'), DutyCrewRules)
+        with self.assertRaises(Exception):
+            get_staffing_rules('unknown')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+from common.config_data import CoverageLevels
+from common.teamup_utils import BulkSummary, Event, TeamupClient, get_date_windows
+import datetime
+import json
+import random
+import requests
+import time
+import threading
+import unittest
+
+"""
+From root directory TeamUp: python3 -m test.test_teamup_utils
+"""
+
+level_mappings = {'Crew Chief': 'crew_chief', 'Driver': 'driver', 'EMT (over 18)': 'emt'}
+
+teamup_event = {
+    'id': '1093666183', 'series_id': None, 'remote_id': None, 'subcalendar_id': 10358690, 'subcalendar_ids': [10358690],
+    'all_day': False, 'rrule': '', 'title': 'Night shift', 'who': 'member1', 'location': '', 'notes': 'email: member1@db',
+    'version': '0f7c3a3f7c04', 'readonly': True, 'tz': None, 'attachments': [], 'custom': {'coverage_level': ['crew_chief']},
+    'start_dt': '2021-12-02T18:00:00-05:00', 'end_dt': '2021-12-03T01:00:00-05:00', 'ristart_dt': None, 'rsstart_dt': None,
+    'creation_dt': '2022-01-19T09:01:01-05:00', 'update_dt': None, 'delete_dt': None
+}
+
+
+class TestEvent(unittest.TestCase):
+
+    def test_from_teamup(self):
+        event = Event.from_teamup(teamup_event, level_mappings)
+        self.assertEqual(event.id, '1093666183')
+        self.assertEqual(event.coverage_level, 'crew_chief')
+        self.assertEqual(event.role, CoverageLevels.CREW_CHIEF)
+        self.assertEqual((event.end - event.start).total_seconds(), 7 * 3600)
+        self.assertFalse(hasattr(event, '__dict__'))
+
+    def test_unmapped_coverage_level(self):
+        self.assertIsNone(Event.from_teamup(dict(teamup_event, custom={'coverage_level': ['assistant']}), level_mappings).role)
+        self.assertIsNone(Event.from_teamup(teamup_event).role)
+
+    def test_no_coverage_level(self):
+        event = Event.from_teamup(dict(teamup_event, custom={}), level_mappings)
+        self.assertIsNone(event.coverage_level)
+        self.assertIsNone(event.role)
+
+    def test_round_trip(self):
+        event = Event.from_teamup(teamup_event, level_mappings)
+        self.assertEqual(Event.from_teamup(event.to_dict(), level_mappings), event)
+        self.assertEqual(Event.from_teamup(event.to_dict(), level_mappings).role, CoverageLevels.CREW_CHIEF)
+
+
+class TestDateWindows(unittest.TestCase):
+
+    def test_short_range(self):
+        self.assertEqual(get_date_windows('2021-12-01', '2021-12-05', 14), [('2021-12-01', '2021-12-05')])
+
+    def test_split(self):
+        self.assertEqual(get_date_windows(datetime.datetime(2021, 12, 1), datetime.datetime(2021, 12, 31), 14),
+            [('2021-12-01', '2021-12-14'), ('2021-12-15', '2021-12-28'), ('2021-12-29', '2021-12-31')])
+
+    def test_empty_range(self):
+        self.assertEqual(get_date_windows('2021-12-05', '2021-12-01', 14), [])
+
+
+class WindowedClient(TeamupClient):
+    """
+    Serves get_raw_events from a list of Teamup events, the way Teamup does: every event that overlaps the days
+    """
+
+    def __init__(self, events):
+        super().__init__()
+        self.events = events
+        self.windows = []
+        self.lock = threading.Lock()
+
+    def get_raw_events(self, start_dt, end_dt, calendar_key, subcalendar_id, api_key):
+        with self.lock:
+            self.windows.append((start_dt, end_dt))
+        return {'events': [dict(event) for event in self.events if event['start_dt'][:10] <= end_dt and event['end_dt'][:10] >= start_dt]}
+
+
+def night(day, minute='00'):
+    return {'id': str(day), 'start_dt': '2021-12-{:02d}T18:{}:00-05:00'.format(day, minute), 'end_dt': '2021-12-{:02d}T06:00:00-05:00'.format(day + 1),
+        'who': 'member{}'.format(day), 'custom': {'coverage_level': ['crew_chief']}}
+
+
+class TestIterEvents(unittest.TestCase):
+
+    def setUp(self):
+        self.client = WindowedClient([night(day) for day in range(1, 30)])
+
+    def test_windows_merged_in_order(self):
+        events = list(self.client.iter_events('2021-12-01', '2021-12-31', 'calendar_key', 1, 'api_key', level_mappings, chunk_days=7))
+        # The nights that start on the last day of a window are in two windows, but only returned once
+        self.assertEqual([event.id for event in events], [str(day) for day in range(1, 30)])
+        self.assertEqual(sorted(self.client.windows), get_date_windows('2021-12-01', '2021-12-31', 7))
+        self.assertEqual(events[0].role, CoverageLevels.CREW_CHIEF)
+
+    def test_single_window(self):
+        self.assertEqual(len(list(self.client.iter_events('2021-12-01', '2021-12-05', 'calendar_key', 1, 'api_key', chunk_days=7))), 5)
+        self.assertEqual(self.client.windows, [('2021-12-01', '2021-12-05')])
+
+    def test_round_dates(self):
+        client = WindowedClient([night(1, '15')])
+        self.assertEqual(next(client.iter_events('2021-12-01', '2021-12-01', 'calendar_key', 1, 'api_key')).start_dt, '2021-12-01T18:30:00-05:00')
+        self.assertEqual(next(client.iter_events('2021-12-01', '2021-12-01', 'calendar_key', 1, 'api_key', round_dates=False)).start_dt, '2021-12-01T18:15:00-05:00')
+
+
+
+class Resp:
+
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.text = json.dumps(body) if body is not None else ''
+        self.headers = {}
+
+
+class WritingClient(TeamupClient):
+    """
+    Answers event creates and deletes after a random delay, so that they finish out of order
+    """
+
+    def __init__(self, failing):
+        super().__init__()
+        self.failing = failing
+        self.posted = []
+
+    def _post_event(self, event, calendar_key, api_key):
+        time.sleep(random.uniform(0, 0.01))
+        self.posted.append(event['title'])
+        if event['title'] in self.failing:
+            return Resp(500, {'error': 'failed'})
+        return Resp(201, {'event': {'id': 'id-' + event['title']}})
+
+    def _delete_event(self, event_id, calendar_key, api_key):
+        time.sleep(random.uniform(0, 0.01))
+        if event_id in self.failing:
+            raise requests.exceptions.ConnectionError('no connection')
+        return Resp(204)
+
+
+class TestBulkWrites(unittest.TestCase):
+
+    def test_create_events_in_order(self):
+        client = WritingClient({'3', '7'})
+        events = ({'title': str(i)} for i in range(20))
+        summary = BulkSummary('Created events')
+        results = list(summary.track(client.create_events(events, 'calendar_key', 'api_key', max_workers=4)))
+
+        self.assertEqual([result.item['title'] for result in results], [str(i) for i in range(20)])
+        self.assertEqual([result.response['event']['id'] for result in results if result.ok], ['id-' + str(i) for i in range(20) if i not in (3, 7)])
+        self.assertEqual(summary.succeeded, 18)
+        self.assertEqual([failure.item['title'] for failure in summary.failures], ['3', '7'])
+        self.assertEqual(len(client.posted), 20)
+
+    def test_delete_events(self):
+        client = WritingClient({'b'})
+        results = list(client.delete_events(['a', 'b', 'c'], 'calendar_key', 'api_key'))
+        self.assertEqual([(result.item, result.ok) for result in results], [('a', True), ('b', False), ('c', True)])
+        self.assertIn('no connection', results[1].error)
+
+
+if __name__ == '__main__':
+    unittest.main()